@@ -0,0 +1,258 @@
+import asyncio
+import ipaddress
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+WHOIS_SERVER = "bgp.tools"
+WHOIS_PORT = 43
+# Wall-clock seconds before a whois lookup is stopped
+WHOIS_TIMEOUT = 20
+# Seconds a whois answer is served from the local cache
+DEFAULT_TTL = 24 * 3600
+WHOIS_CACHE_PATH = "data/whois_cache.sqlite"
+# Columns of the bgp.tools verbose table
+COLUMNS = ["AS", "IP", "BGP Prefix", "CC", "Registry", "Allocated", "AS Name"]
+
+
+def normalize_resource(resource: str) -> str:
+    """
+    Canonical form of an ASN ("AS2497") or IP address, as used for the cache keys.
+
+    Raises:
+        ValueError: If the resource is neither an ASN nor an IP address.
+    """
+    resource = resource.strip()
+    digits = resource[2:] if resource[:2].upper() == "AS" else resource
+    if digits.isdigit():
+        return f"AS{int(digits)}"
+    return str(ipaddress.ip_address(resource))
+
+
+def parse_bulk(text: str) -> Dict[str, Dict[str, str]]:
+    """Rows of a bgp.tools verbose answer, keyed by canonical IP, or by ASN for ASN queries"""
+    rows = {}
+    for line in text.splitlines():
+        cells = [cell.strip() for cell in line.split("|")]
+        if len(cells) != len(COLUMNS) or cells[0] == "AS":
+            continue
+        row = dict(zip(COLUMNS, cells))
+        try:
+            key = str(ipaddress.ip_address(row["IP"]))
+        except ValueError:
+            key = f"AS{row['AS']}"
+        rows[key] = row
+    return rows
+
+
+def bulk_request(resources: List[str]) -> bytes:
+    """bgp.tools bulk mode: every resource over one connection"""
+    return ("begin\nverbose\n" + "".join(f"{resource}\n" for resource in resources) + "end\n").encode()
+
+
+class WhoisCache:
+    """
+    Persistent whois answers in SQLite, with a TTL.
+
+    ASN answers are keyed by ASN. IP answers are keyed by their BGP prefix and
+    looked up by longest-prefix match, so any IP of a cached prefix is answered
+    without a query.
+    """
+
+    def __init__(self, path: str = WHOIS_CACHE_PATH, ttl: float = DEFAULT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS asn (asn TEXT PRIMARY KEY, record TEXT, expires REAL)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS prefix "
+                "(prefix TEXT PRIMARY KEY, version INTEGER, length INTEGER, record TEXT, expires REAL)"
+            )
+        # Prefix lengths present per IP version, only those are tried by the lookups
+        self._lengths: Dict[int, set[int]] = {4: set(), 6: set()}
+        for version, length in self._db.execute("SELECT DISTINCT version, length FROM prefix"):
+            self._lengths[version].add(length)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, resource: str) -> Optional[Dict[str, str]]:
+        """Cached answer of a canonical resource, None when missing or expired"""
+        now = time.time()
+        with self._lock:
+            if resource.startswith("AS"):
+                row = self._db.execute(
+                    "SELECT record FROM asn WHERE asn = ? AND expires > ?", (resource, now)
+                ).fetchone()
+                record = json.loads(row[0]) if row else None
+            else:
+                record = self._longest_prefix(ipaddress.ip_address(resource), now)
+            if record is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return record
+
+    def _longest_prefix(self, ip, now: float) -> Optional[Dict[str, str]]:
+        for length in sorted(self._lengths[ip.version], reverse=True):
+            network = ipaddress.ip_network(f"{ip}/{length}", strict=False)
+            row = self._db.execute(
+                "SELECT record FROM prefix WHERE prefix = ? AND expires > ?", (str(network), now)
+            ).fetchone()
+            if row:
+                record = json.loads(row[0])
+                record["IP"] = str(ip)
+                return record
+        return None
+
+    def put(self, resource: str, record: Dict[str, str]) -> None:
+        """Store the answer of a canonical resource, IPs outside any BGP prefix are not cached"""
+        expires = time.time() + self.ttl
+        with self._lock, self._db:
+            if resource.startswith("AS"):
+                self._db.execute(
+                    "INSERT OR REPLACE INTO asn VALUES (?, ?, ?)", (resource, json.dumps(record), expires)
+                )
+                return
+            try:
+                network = ipaddress.ip_network(record.get("BGP Prefix", ""), strict=False)
+            except ValueError:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO prefix VALUES (?, ?, ?, ?, ?)",
+                (str(network), network.version, network.prefixlen, json.dumps(record), expires),
+            )
+            self._lengths[network.version].add(network.prefixlen)
+
+    def clear(self) -> None:
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM asn")
+            self._db.execute("DELETE FROM prefix")
+            self._lengths = {4: set(), 6: set()}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+_default_cache: Optional[WhoisCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_whois_cache() -> WhoisCache:
+    """Return the process-wide whois cache"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = WhoisCache()
+        return _default_cache
+
+
+def _split(resources: List[str], cache: WhoisCache) -> tuple[Dict, Dict[str, Dict], List[str]]:
+    """Map resources to canonical keys, answer what the cache can, list what must be queried"""
+    keys, results, missing = {}, {}, []
+    for resource in resources:
+        try:
+            keys[resource] = normalize_resource(resource)
+        except ValueError:
+            results[resource] = {"resource": resource, "error": "Not an ASN or IP address"}
+            continue
+        record = cache.get(keys[resource])
+        if record is not None:
+            results[resource] = record
+        elif keys[resource] not in missing:
+            missing.append(keys[resource])
+    return keys, results, missing
+
+
+def _merge(
+    resources: List[str], keys: Dict, results: Dict, answer: str, cache: WhoisCache
+) -> Dict[str, Dict]:
+    rows = parse_bulk(answer)
+    for key, row in rows.items():
+        cache.put(key, row)
+    for resource in resources:
+        if resource not in results:
+            results[resource] = rows.get(keys[resource]) or {"resource": resource, "error": "No answer"}
+    return {resource: results[resource] for resource in resources}
+
+
+def lookup_many(
+    resources: List[str],
+    cache: Optional[WhoisCache] = None,
+    server: Optional[str] = None,
+    port: Optional[int] = None,
+    timeout: float = WHOIS_TIMEOUT,
+) -> Dict[str, Dict[str, str]]:
+    """
+    Whois answers of ASNs and IP addresses, from the cache or from one bulk query.
+
+    Args:
+        resources: ASNs ("AS2497", "2497") and IP addresses.
+        cache: Defaults to the process-wide cache.
+        server: Whois server speaking the bgp.tools bulk protocol. Defaults to `WHOIS_SERVER`.
+        port: Whois port. Defaults to `WHOIS_PORT`.
+        timeout: Wall-clock seconds for the whole bulk query.
+
+    Returns:
+        One bgp.tools row per resource, in order, or a dict with an "error" key.
+
+    Raises:
+        OSError: If the server cannot be reached or does not answer in time.
+    """
+    cache = cache or get_whois_cache()
+    keys, results, missing = _split(resources, cache)
+    answer = ""
+    if missing:
+        deadline = time.monotonic() + timeout
+        chunks = []
+        address = (server or WHOIS_SERVER, port or WHOIS_PORT)
+        with socket.create_connection(address, timeout=timeout) as sock:
+            sock.sendall(bulk_request(missing))
+            while True:
+                sock.settimeout(max(deadline - time.monotonic(), 0.001))
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        answer = b"".join(chunks).decode(errors="replace")
+    return _merge(resources, keys, results, answer, cache)
+
+
+async def alookup_many(
+    resources: List[str],
+    cache: Optional[WhoisCache] = None,
+    server: Optional[str] = None,
+    port: Optional[int] = None,
+    timeout: float = WHOIS_TIMEOUT,
+) -> Dict[str, Dict[str, str]]:
+    """Async version of `lookup_many`"""
+    cache = cache or get_whois_cache()
+    keys, results, missing = _split(resources, cache)
+    answer = ""
+    if missing:
+
+        async def query() -> bytes:
+            reader, writer = await asyncio.open_connection(server or WHOIS_SERVER, port or WHOIS_PORT)
+            try:
+                writer.write(bulk_request(missing))
+                await writer.drain()
+                return await reader.read()
+            finally:
+                writer.close()
+
+        answer = (await asyncio.wait_for(query(), timeout)).decode(errors="replace")
+    return _merge(resources, keys, results, answer, cache)
+
+
+if __name__ == "__main__":
+    for resource, record in lookup_many(["AS2497", "1.1.1.1", "8.8.8.8"]).items():
+        print(resource, record)
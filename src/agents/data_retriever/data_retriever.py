@@ -1,15 +1,61 @@
-import subprocess
 import json
+from typing import Dict, Optional
+
 from langchain_core.tools import tool
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import SystemMessage, HumanMessage
 from langgraph.graph import START, StateGraph
 from langgraph.prebuilt import ToolNode, tools_condition
 from langgraph.graph.state import CompiledStateGraph
+from langgraph.utils.runnable import RunnableCallable
 
 from src.agents.utils.states import SplitThinkingAgentState, serialize_state
 from src.agents.iypchat.iypchat import get_iyp_graph
-from src.agents.utils.models import ModelParams
+from src.agents.utils.models import ModelParams, get_chat_model
+from src.agents.utils.graphs import shared_graph
+from src.agents.data_retriever.bgp_tools import WHOIS_SERVER, WHOIS_TIMEOUT, alookup_many, lookup_many
+from src.agents.utils.asn_index import PFX2AS_PATH, get_asn_index
+from src.agents.utils.commands import arun_command, run_command
+from src.agents.utils.formats import tool_output
+
+
+def whois_command(resource: str) -> list[str]:
+    # fix when LLM call with ASN only (no AS prefix)
+    try:
+        asn = int(resource)
+        resource = f"AS{asn}"
+    except ValueError:
+        pass
+    return ["whois", "-h", WHOIS_SERVER, "-v", resource]
+
+
+def parse_whois(res: str) -> Optional[Dict[str, str]]:
+    """Columns of the first row of the bgp.tools verbose table, None when there is no table"""
+    keys, vals = None, None
+    i = 0
+    for line in res.splitlines():
+        splitted = line.split("|")
+        if not len(splitted) == 7:
+            continue
+        if i == 0:
+            keys = [col_name.strip() for col_name in splitted]
+        elif i == 1:
+            vals = [col_name.strip() for col_name in splitted]
+        else:
+            break
+        i += 1
+
+    if keys is None or vals is None:
+        return None
+    return dict(zip(keys, vals))
+
+
+def whois_output(res: str) -> str:
+    """Format the bgp.tools verbose answer as a tool result"""
+    record = parse_whois(res)
+    if record is None:
+        # No table, e.g. a lookup stopped by its timeout
+        return f"<tool>{res}</tool>"
+    return tool_output([record], raw=str(record))
 
 
 @tool(parse_docstring=True)
@@ -21,7 +67,7 @@ def whois(resource: str) -> str:
         resource (str): The identifier to look up. Can be an ASN (e.g., "AS2497", "2497"), an IPv4/IPv6 address (e.g., "1.1.1.1" or "2a00::"), or a MAC address (e.g., "90:e2:ba:61:c3:88").
 
     Returns:
-        str: A tool-formatted string containing a dictionary of lookup results with the following keys:
+        str: A tool-formatted record of lookup results with the following keys:
             - 'AS': str, the Autonomous System number
             - 'IP': str, the queried IP address
             - 'BGP Prefix': str, the BGP prefix
@@ -31,43 +77,83 @@ def whois(resource: str) -> str:
             - 'AS Name': str, the name of the AS
     """
 
-    # fix when LLM call with ASN only (no AS prefix)
-    try:
-        asn = int(resource)
-        resource = f"AS{asn}"
-    except ValueError:
-        pass
+    result = run_command(whois_command(resource), check=True, timeout=WHOIS_TIMEOUT, host=WHOIS_SERVER)
+    return whois_output(result.output)
+
 
-    result = subprocess.run(
-        ["whois", "-h", "bgp.tools", "-v", resource],
-        check=True,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
+async def _awhois(resource: str) -> str:
+    result = await arun_command(
+        whois_command(resource), check=True, timeout=WHOIS_TIMEOUT, host=WHOIS_SERVER
     )
-    res = result.stdout if result.returncode == 0 else result.stderr
+    return whois_output(result.output)
 
-    i = 0
-    for line in res.splitlines():
-        splitted = line.split("|")
-        if not len(splitted) == 7:
-            continue
-        if i == 0:
-            keys = [col_name.strip() for col_name in line.split("|")]
-        elif i == 1:
-            vals = [col_name.strip() for col_name in line.split("|")]
-        else:
-            break
-        i += 1
 
-    res = dict(zip(keys, vals))
-    return f"<tool>{res}</tool>"
+# Used by ainvoke, instead of running the sync tool in a thread
+whois.coroutine = _awhois
+
+
+@tool(parse_docstring=True)
+def whois_many(resources: list[str]) -> str:
+    """
+    Query WHOIS information from bgp.tools for several ASNs and IP addresses at once.
+
+    Args:
+        resources (list[str]): The ASNs (e.g., "AS2497", "2497") and IPv4/IPv6 addresses to look up.
+
+    Returns:
+        str: One tool-formatted record per resource, with the same keys as the `whois` tool.
+    """
+    return _whois_many_output(lookup_many(resources))
+
+
+async def _awhois_many(resources: list[str]) -> str:
+    return _whois_many_output(await alookup_many(resources))
+
+
+def _whois_many_output(results: Dict[str, Dict[str, str]]) -> str:
+    records = list(results.values())
+    return tool_output(records, raw=str(records))
+
+
+whois_many.coroutine = _awhois_many
+
+
+@tool(parse_docstring=True)
+def ip_to_asn(ips: list[str]) -> str:
+    """
+    Map IP addresses to the most specific announced BGP prefix and its origin ASN, from a local routing table.
+
+    Args:
+        ips (list[str]): The IPv4/IPv6 addresses to map (e.g., the hops of a traceroute).
+
+    Returns:
+        str: One tool-formatted record per IP with its prefix and origin ASN (empty when the IP is not routed).
+    """
+    index = get_asn_index()
+    if index is None:
+        return f"<tool>No local routing table at {PFX2AS_PATH}, use `whois_many` instead</tool>"
+    records = [
+        match.to_dict() if match else {"ip": ip}
+        for ip, match in zip(ips, index.lookup_many(ips))
+    ]
+    return tool_output(records, raw=str(records))
+
+
+DATA_RETRIEVER_PROMPT = SystemMessage(
+    content="""You are an expert in retrieving Internet data.
+You have four tools to answer user message: `ip_to_asn`, `whois`, `whois_many` and `call_iyp`.
+To map IPs to their ASN, use `ip_to_asn` first, it answers instantly from a local routing table.
+Use `whois_many` rather than several `whois` calls to look up several ASNs or IPs.
+Carefully evaluate how `whois` tool is able to answer the user request.
+If not, always assume `call_iyp` has the answer.
+Forward the user message to `call_iyp` without alteration"""
+)
 
 
 def get_data_retriever_graph(debug=False, checkpointer=None, model_params=ModelParams()) -> CompiledStateGraph:
     "Return data_retriever react agent"
 
-    iyp_graph = get_iyp_graph(model_params=model_params)
+    iyp_graph = shared_graph(get_iyp_graph, model_params)
 
     @tool(parse_docstring=True)
     def call_iyp(prompt: str) -> str:
@@ -87,26 +173,29 @@ def get_data_retriever_graph(debug=False, checkpointer=None, model_params=ModelP
         return {"messages": [response], "thoughts": [response]}
         # return response["messages"][-1]    
 
-    data_tools = [call_iyp, whois]
-    data_llm = ChatOpenAI(**model_params.model_dump()).bind_tools(data_tools)
+    async def acall_iyp(prompt: str) -> str:
+        response = await iyp_graph.ainvoke({"messages": [HumanMessage(prompt)]})
+        return {"messages": [response], "thoughts": [response]}
+
+    call_iyp.coroutine = acall_iyp
+
+    data_tools = [call_iyp, ip_to_asn, whois, whois_many]
+    data_llm = get_chat_model(model_params).bind_tools(data_tools)
 
 
     def assistant(state: SplitThinkingAgentState):
         """Note: could be improved by trying out langgraph forward feature"""
-        sys_msg = SystemMessage(
-            content="""You are an expert in retrieving Internet data.
-You have two tools to answer user message: `whois` and `call_iyp`.
-Carefully evaluate how `whois` tool is able to answer the user request.
-If not, always assume `call_iyp` has the answer.
-Forward the user message to `call_iyp` without alteration"""
-        )
-        response = data_llm.invoke([sys_msg] + state["messages"])
+        response = data_llm.invoke([DATA_RETRIEVER_PROMPT] + state["messages"])
+        return {"messages": [response], "thoughts": [response]}
+
+    async def aassistant(state: SplitThinkingAgentState):
+        response = await data_llm.ainvoke([DATA_RETRIEVER_PROMPT] + state["messages"])
         return {"messages": [response], "thoughts": [response]}
 
     builder = StateGraph(SplitThinkingAgentState)
     
     # Define nodes: these do the work
-    builder.add_node("assistant", assistant)
+    builder.add_node("assistant", RunnableCallable(assistant, aassistant))
     builder.add_node("tools", ToolNode(data_tools))
 
     # Define edges: these determine how the control flow moves
@@ -116,7 +205,7 @@ Forward the user message to `call_iyp` without alteration"""
         tools_condition,
     )
     builder.add_edge("tools", "assistant")
-    react_graph = builder.compile(debug=True, checkpointer=checkpointer, name="data_retriever")
+    react_graph = builder.compile(debug=debug, checkpointer=checkpointer, name="data_retriever")
     
     return react_graph
 
@@ -0,0 +1,301 @@
+import asyncio
+import copy
+import json
+import os
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+from neo4j import READ_ACCESS, AsyncGraphDatabase, GraphDatabase
+from neo4j.graph import Node, Path, Relationship
+
+from src.agents.iypchat.iyp_client import (
+    DEFAULT_MAX_CONNECTIONS,
+    IYP_API_BASE,
+    IYPAPIError,
+    IYPClient,
+    get_iyp_client,
+)
+from src.agents.utils.models import IYPSettings
+from src.agents.utils.replay import Latency
+
+
+class IYPBackend:
+    """Runs IYP Cypher statements and answers with the Query API `data` payload.
+
+    Every backend returns `{"fields": [...], "values": [[...], ...]}`, nodes and
+    relationships encoded as the Neo4j Query API does, so the formatting, caching
+    and streaming code is the same whatever answered the query.
+    """
+
+    def query(self, statement: str, use_cache: bool = True, max_rows: Optional[int] = None) -> Dict:
+        """
+        Run a Cypher statement.
+
+        Args:
+            statement: A Cypher query like "MATCH (n) RETURN n LIMIT 5".
+            use_cache: Whether the backend may answer from its own cache.
+            max_rows: Stop fetching past this many rows, when the backend can.
+
+        Returns:
+            Dict: The `data` payload, with `fields` and `values`.
+        """
+        raise NotImplementedError
+
+    async def aquery(self, statement: str, use_cache: bool = True, max_rows: Optional[int] = None) -> Dict:
+        """Async version of `query`"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    async def aclose(self) -> None:
+        self.close()
+
+
+def _data(body: Dict) -> Dict:
+    """`data` payload of a Query API answer, empty when the answer has none"""
+    return body.get("data", {"fields": [], "values": []})
+
+
+class HTTPBackend(IYPBackend):
+    """The IYP query API, through a pooled `IYPClient`"""
+
+    def __init__(self, client: Optional[IYPClient] = None):
+        self.client = client or get_iyp_client()
+
+    def query(self, statement: str, use_cache: bool = True, max_rows: Optional[int] = None) -> Dict:
+        return _data(self.client.query(statement, use_cache=use_cache))
+
+    async def aquery(self, statement: str, use_cache: bool = True, max_rows: Optional[int] = None) -> Dict:
+        return _data(await self.client.aquery(statement, use_cache=use_cache))
+
+    def close(self) -> None:
+        self.client.close()
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+def to_query_api(value: Any) -> Any:
+    """Encode a value of the Neo4j driver as the Query API does in its plain JSON answers"""
+    if isinstance(value, Node):
+        return {
+            "elementId": value.element_id,
+            "labels": sorted(value.labels),
+            "properties": {key: to_query_api(val) for key, val in value.items()},
+        }
+    if isinstance(value, Relationship):
+        return {
+            "elementId": value.element_id,
+            "startNodeElementId": value.start_node.element_id,
+            "endNodeElementId": value.end_node.element_id,
+            "type": value.type,
+            "properties": {key: to_query_api(val) for key, val in value.items()},
+        }
+    if isinstance(value, Path):
+        # Alternating nodes and relationships
+        items = [value.start_node]
+        for relationship, node in zip(value.relationships, value.nodes[1:]):
+            items += [relationship, node]
+        return [to_query_api(item) for item in items]
+    if isinstance(value, dict):
+        return {key: to_query_api(val) for key, val in value.items()}
+    if isinstance(value, (list, tuple)):
+        # Also spatial points, which are tuples of coordinates
+        return [to_query_api(val) for val in value]
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if hasattr(value, "iso_format"):
+        return value.iso_format()
+    return str(value)
+
+
+class BoltBackend(IYPBackend):
+    """A Neo4j server holding an IYP dump, over Bolt.
+
+    The driver keeps a pool of Bolt connections shared by the calls. Like aiohttp
+    sessions, async drivers are bound to an event loop, so one is kept per loop.
+
+    Args:
+        uri: Bolt URI of the server, e.g. "bolt://localhost:7687".
+        auth: (user, password), None when authentication is disabled.
+        database: Database name, defaults to the server default database.
+        max_connections: Size of the Bolt connection pool.
+    """
+
+    def __init__(
+        self,
+        uri: str = "bolt://localhost:7687",
+        auth: Optional[tuple[str, str]] = None,
+        database: Optional[str] = None,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+    ):
+        self.uri = uri
+        self.auth = auth
+        self.database = database
+        self.max_connections = max_connections
+
+        self._lock = threading.Lock()
+        self._driver = None
+        self._adrivers: Dict[int, Any] = {}
+
+    def driver(self):
+        """Return the sync driver, creating it on first use"""
+        with self._lock:
+            if self._driver is None:
+                self._driver = GraphDatabase.driver(
+                    self.uri, auth=self.auth, max_connection_pool_size=self.max_connections
+                )
+            return self._driver
+
+    def adriver(self):
+        """Return the async driver of the running event loop"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            driver = self._adrivers.get(id(loop))
+            if driver is None:
+                driver = AsyncGraphDatabase.driver(
+                    self.uri, auth=self.auth, max_connection_pool_size=self.max_connections
+                )
+                self._adrivers[id(loop)] = driver
+            return driver
+
+    def query(self, statement: str, use_cache: bool = True, max_rows: Optional[int] = None) -> Dict:
+        with self.driver().session(database=self.database, default_access_mode=READ_ACCESS) as session:
+            result = session.run(statement)
+            fields = list(result.keys())
+            # Closing the session discards the records not fetched
+            records = result.fetch(max_rows) if max_rows is not None else list(result)
+            return {"fields": fields, "values": [[to_query_api(value) for value in record.values()] for record in records]}
+
+    async def aquery(self, statement: str, use_cache: bool = True, max_rows: Optional[int] = None) -> Dict:
+        async with self.adriver().session(database=self.database, default_access_mode=READ_ACCESS) as session:
+            result = await session.run(statement)
+            fields = list(result.keys())
+            if max_rows is not None:
+                records = await result.fetch(max_rows)
+            else:
+                records = [record async for record in result]
+            return {"fields": fields, "values": [[to_query_api(value) for value in record.values()] for record in records]}
+
+    def close(self) -> None:
+        with self._lock:
+            driver, self._driver = self._driver, None
+        if driver is not None:
+            driver.close()
+
+    async def aclose(self) -> None:
+        with self._lock:
+            driver = self._adrivers.pop(id(asyncio.get_running_loop()), None)
+        if driver is not None:
+            await driver.close()
+        self.close()
+
+
+def fixture_key(statement: str) -> str:
+    """Recorded answers are keyed by the statement with whitespace collapsed"""
+    return " ".join(statement.split())
+
+
+class FixtureBackend(IYPBackend):
+    """Recorded answers, for offline runs and tests.
+
+    The fixture file maps statements (see `fixture_key`) to their `data` payload.
+    With a `fallback`, unknown statements are run on it and recorded.
+
+    Args:
+        path: JSON fixture file, created when recording.
+        fallback: Backend answering and recording the statements not in the file.
+        latency: Delay of the recorded answers, to load-test as if the API answered.
+    """
+
+    def __init__(self, path: str, fallback: Optional[IYPBackend] = None, latency: Optional[Latency] = None):
+        self.path = path
+        self.fallback = fallback
+        self.latency = latency
+        self._lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self.answers: Dict[str, Dict] = json.load(f)
+        except FileNotFoundError:
+            self.answers = {}
+
+    def _recorded(self, statement: str) -> Optional[Dict]:
+        answer = self.answers.get(fixture_key(statement))
+        if answer is None and self.fallback is None:
+            raise IYPAPIError(404, f"No recorded answer for: {fixture_key(statement)}")
+        return answer
+
+    def record(self, statement: str, data: Dict) -> None:
+        """Add an answer and rewrite the fixture file"""
+        with self._lock:
+            self.answers[fixture_key(statement)] = data
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.answers, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+
+    def query(self, statement: str, use_cache: bool = True, max_rows: Optional[int] = None) -> Dict:
+        answer = self._recorded(statement)
+        if answer is None:
+            answer = self.fallback.query(statement, use_cache=use_cache)
+            self.record(statement, answer)
+        elif self.latency is not None:
+            time.sleep(self.latency.sample(0.0))
+        return _head(answer, max_rows)
+
+    async def aquery(self, statement: str, use_cache: bool = True, max_rows: Optional[int] = None) -> Dict:
+        answer = self._recorded(statement)
+        if answer is None:
+            answer = await self.fallback.aquery(statement, use_cache=use_cache)
+            self.record(statement, answer)
+        elif self.latency is not None:
+            await asyncio.sleep(self.latency.sample(0.0))
+        return _head(answer, max_rows)
+
+    def close(self) -> None:
+        if self.fallback is not None:
+            self.fallback.close()
+
+    async def aclose(self) -> None:
+        if self.fallback is not None:
+            await self.fallback.aclose()
+
+
+def _head(data: Dict, max_rows: Optional[int]) -> Dict:
+    """Copy of a recorded answer, its first `max_rows` rows only"""
+    values = data["values"] if max_rows is None else data["values"][:max_rows]
+    return copy.deepcopy({"fields": data["fields"], "values": values})
+
+
+def create_iyp_backend(settings: IYPSettings) -> IYPBackend:
+    """Build the backend selected by `settings`"""
+    if settings.backend == "bolt":
+        auth = (settings.user, settings.password) if settings.user else None
+        return BoltBackend(settings.bolt_uri, auth, settings.database, settings.max_connections)
+    if settings.backend == "http":
+        if settings.url == IYP_API_BASE and settings.max_connections == DEFAULT_MAX_CONNECTIONS:
+            # Share the pool of the process-wide client
+            return HTTPBackend(get_iyp_client())
+        return HTTPBackend(IYPClient(base_url=settings.url, max_connections=settings.max_connections))
+    fallback = None
+    if settings.record_fixtures:
+        fallback = create_iyp_backend(settings.model_copy(update={"backend": "http"}))
+    latency = None
+    if settings.fixtures_latency or settings.fixtures_jitter:
+        latency = Latency(settings.fixtures_latency, jitter=settings.fixtures_jitter)
+    return FixtureBackend(settings.fixtures_path, fallback, latency)
+
+
+@lru_cache(maxsize=None)
+def get_iyp_backend(settings: IYPSettings = IYPSettings()) -> IYPBackend:
+    """Return the process-wide backend of `settings`"""
+    return create_iyp_backend(settings)
+
+
+if __name__ == "__main__":
+    backend = get_iyp_backend()
+    print(backend.query("MATCH (ixp:IXP)-[:COUNTRY]->(:Country {country_code: 'JP'}) RETURN ixp.name LIMIT 5"))
@@ -0,0 +1,162 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Literal, Optional
+
+from src.agents.iypchat.cypher_lint import LintResult
+from src.agents.iypchat.query_guard import GuardResult
+from src.agents.iypchat.streaming import StreamedResult
+
+# Temperature added for each extra candidate, the first one uses the model temperature
+TEMPERATURE_STEP = 0.3
+MAX_TEMPERATURE = 1.5
+
+Vote = Literal["first", "majority"]
+
+
+@dataclass
+class Candidate:
+    """A generated query and what became of it: linted, guarded, then run or failed"""
+
+    response: Any  # AIMessage of the LLM
+    lint: LintResult
+    guarded: Optional[GuardResult] = None
+    streamed: Optional[StreamedResult] = None
+    error: Optional[Exception] = None
+    temperature: Optional[float] = None
+    seconds: float = 0.0  # spent running the query
+
+    @property
+    def query(self) -> str:
+        return self.guarded.query if self.guarded is not None else self.lint.query
+
+    @property
+    def rows(self) -> Optional[List[Dict]]:
+        return self.streamed.rows if self.streamed is not None else None
+
+    @property
+    def answered(self) -> bool:
+        return bool(self.rows)
+
+
+def candidate_temperatures(n: int, base: float = 0.0) -> List[float]:
+    """Sampling temperatures of `n` candidates, from `base` up by `TEMPERATURE_STEP`"""
+    return [min(base + i * TEMPERATURE_STEP, MAX_TEMPERATURE) for i in range(n)]
+
+
+def _signature(rows: List[Dict]) -> str:
+    """Order-insensitive form of a result, equal for candidates agreeing on the answer"""
+    return json.dumps(sorted(json.dumps(row, sort_keys=True, default=str) for row in rows))
+
+
+def _winner(finished: List[Candidate], failed: int, n: int, vote: Vote) -> Optional[Candidate]:
+    """Candidate taken so far, None while the remaining ones could still change the outcome.
+
+    `failed` counts the candidates that raised, they are done without a result.
+    """
+    answered = [candidate for candidate in finished if candidate.answered]
+    if vote == "first":
+        return answered[0] if answered else None
+    groups: Dict[str, List[Candidate]] = {}
+    for candidate in answered:
+        groups.setdefault(_signature(candidate.rows), []).append(candidate)
+    if not groups:
+        return None
+    # Most agreed result, the earliest one on ties
+    best = max(groups.values(), key=len)
+    if len(best) * 2 > n or len(finished) + failed == n:
+        return best[0]
+    return None
+
+
+def _fallback(finished: List[Candidate], errors: List[Exception]) -> Candidate:
+    """No winner: one that answered, else one that ran, else one matching the schema, else the first"""
+    if not finished:
+        raise errors[0]
+    for usable in (lambda c: c.answered, lambda c: c.streamed is not None, lambda c: c.lint.ok):
+        for candidate in finished:
+            if usable(candidate):
+                return candidate
+    return finished[0]
+
+
+def race_candidates(
+    generate: Callable[[float], Candidate], temperatures: List[float], vote: Vote = "first"
+) -> Candidate:
+    """
+    Generate and run candidates concurrently, keep the first answer or the answer most agree on.
+
+    Args:
+        generate: Generates, checks and runs one candidate at a temperature.
+        temperatures: One candidate per temperature, see `candidate_temperatures`.
+        vote: "first" takes the first non-empty result, "majority" the result most candidates
+            return, as soon as more than half of them agree.
+
+    Returns:
+        Candidate: The winner, or the best failed candidate (see `_fallback`) to repair.
+    """
+    finished: List[Candidate] = []
+    errors: List[Exception] = []
+    executor = ThreadPoolExecutor(max_workers=len(temperatures))
+    try:
+        for future in as_completed([executor.submit(generate, t) for t in temperatures]):
+            try:
+                finished.append(future.result())
+            except Exception as e:
+                errors.append(e)
+                continue
+            winner = _winner(finished, len(errors), len(temperatures), vote)
+            if winner is not None:
+                return winner
+    finally:
+        # Threads cannot be interrupted, the candidates not started yet are dropped
+        executor.shutdown(wait=False, cancel_futures=True)
+    return _fallback(finished, errors)
+
+
+async def arace_candidates(
+    agenerate: Callable[[float], Awaitable[Candidate]], temperatures: List[float], vote: Vote = "first"
+) -> Candidate:
+    """Async version of `race_candidates`, the pending LLM calls and queries are cancelled once a winner is found"""
+    tasks = [asyncio.create_task(agenerate(t)) for t in temperatures]
+    finished: List[Candidate] = []
+    errors: List[Exception] = []
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                finished.append(await next_done)
+            except Exception as e:
+                errors.append(e)
+                continue
+            winner = _winner(finished, len(errors), len(temperatures), vote)
+            if winner is not None:
+                return winner
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return _fallback(finished, errors)
+
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    from src.agents.iypchat.cypher_lint import CypherLinter
+    from src.agents.iypchat.schema.schema import load_schema
+
+    linter = CypherLinter(load_schema("src/agents/iypchat/schema/neo4j-schema.json").index)
+    answers = {0: [], 1: [{"ixp.name": "JPNAP Tokyo"}], 2: [{"ixp.name": "JPNAP Tokyo"}]}
+
+    async def agenerate(temperature: float) -> Candidate:
+        # Stand-in for an LLM call and a query, slower for hotter samples
+        await asyncio.sleep(random.uniform(0.1, 0.3) + temperature)
+        lint = linter.lint("MATCH (a:AS {asn: 2497})-[:MEMBER_OF]->(i:IXP) RETURN i.name")
+        rows = answers[round(temperature / TEMPERATURE_STEP) % 3]
+        return Candidate(None, lint, streamed=StreamedResult(rows), temperature=temperature)
+
+    for vote in ("first", "majority"):
+        start = time.perf_counter()
+        winner = asyncio.run(arace_candidates(agenerate, candidate_temperatures(5), vote))
+        print(vote, winner.temperature, winner.rows, f"{time.perf_counter() - start:.2f}s")
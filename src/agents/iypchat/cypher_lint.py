@@ -0,0 +1,239 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from src.agents.iypchat.cypher_patterns import (
+    NAME_KINDS,
+    Token,
+    apply_edits,
+    bracket_pairs,
+    parse_patterns,
+    tokenize,
+)
+from src.agents.iypchat.schema.schema import SchemaIndex
+
+# Properties listed in the message of an unknown property
+MAX_HINTS = 10
+
+
+@dataclass
+class LintIssue:
+    """One problem found in a query, `fixed` when the repaired query corrects it"""
+
+    kind: str  # "label", "relationship", "direction" or "property"
+    message: str
+    fixed: bool = False
+
+
+@dataclass
+class LintResult:
+    """Outcome of `CypherLinter.lint`: the repaired query and what was wrong with the original"""
+
+    original: str
+    query: str
+    issues: List[LintIssue] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        """The repaired query only uses labels, types, directions and properties of the schema"""
+        return all(issue.fixed for issue in self.issues)
+
+    @property
+    def repaired(self) -> bool:
+        return self.query != self.original
+
+    def feedback(self) -> str:
+        """Errors left in the query, one per line, as told to the user or the LLM"""
+        return "\n".join(issue.message for issue in self.issues if not issue.fixed)
+
+
+def _norm(name: str) -> str:
+    """Spelling-insensitive form of a name: `Hostname`, `hostName` and `HOST_NAME` are the same"""
+    return name.replace("_", "").lower()
+
+
+class CypherLinter:
+    """Checks generated Cypher against the schema, without running it.
+
+    Labels, relationship types, relationship directions and property keys of
+    the node and relationship patterns are compared with the adjacency of a
+    `SchemaIndex`. Names that only differ by case or underscores are repaired,
+    as are relationships written in the wrong direction. Anything else is
+    reported, so the query can be rejected before a remote round trip.
+
+    Args:
+        index: Schema adjacency and properties, see `Neo4jSchema.index`.
+    """
+
+    def __init__(self, index: SchemaIndex):
+        self.index = index
+        self.labels = {_norm(label): label for label in index.labels | {t[0] for t in index.triples} | {t[2] for t in index.triples}}
+        self.types = {_norm(rel): rel for rel in index.relationship_types | set(index.rel_properties)}
+        self.node_keys = {label: {_norm(p): p for p in props} for label, props in index.node_properties.items()}
+        self.rel_keys = {rel: {_norm(p): p for p in props} for rel, props in index.rel_properties.items()}
+        # relationship type -> (source, target) pairs
+        self.ends: Dict[str, set[tuple[str, str]]] = {}
+        for source, rel, target in index.triples:
+            self.ends.setdefault(rel, set()).add((source, target))
+
+    def lint(self, query: str, repair: bool = True) -> LintResult:
+        """
+        Check a Cypher statement against the schema.
+
+        Args:
+            query: A Cypher query like "MATCH (a:AS)-[:COUNTRY]->(c:Country) RETURN c".
+            repair: Rewrite the misspelled names and reversed relationships.
+
+        Returns:
+            LintResult: The query (repaired when `repair`), and the issues found.
+        """
+        tokens = tokenize(query)
+        pairs = bracket_pairs(tokens)
+        nodes, chains = parse_patterns(tokens, pairs)
+
+        issues: List[LintIssue] = []
+        edits: Dict[int, str] = {}  # token index -> replacement text
+
+        def rename(i: int, known: Dict[str, str], kind: str, what: str, where: str = "") -> Optional[str]:
+            name = tokens[i].name
+            if name in known.values():
+                return name
+            fixed = known.get(_norm(name))
+            if fixed is None:
+                issues.append(LintIssue(kind, f"Unknown {what} `{name}`{where}"))
+                return None
+            issues.append(LintIssue(kind, f"{what.capitalize()} `{name}`{where} is spelled `{fixed}`", fixed=repair))
+            edits[i] = fixed
+            return fixed
+
+        # Labels of every variable, gathered over all its patterns
+        node_labels: Dict[Optional[str], set[str]] = {}
+        labels_of: Dict[int, set[str]] = {}
+        for position, node in nodes.items():
+            labels = {name for i in node.labels if (name := rename(i, self.labels, "label", "label"))}
+            labels_of[position] = labels
+            if node.variable:
+                node_labels.setdefault(node.variable, set()).update(labels)
+        for i in self._label_predicates(tokens, pairs, nodes, chains):
+            if (label := rename(i + 2, self.labels, "label", "label")) is not None:
+                node_labels.setdefault(tokens[i].name, set()).add(label)
+
+        rel_types: Dict[str, set[str]] = {}
+        for left, rel, right in (link for chain in chains for link in chain):
+            types = {name for i in rel.types if (name := rename(i, self.types, "relationship", "relationship type"))}
+            if rel.variable:
+                rel_types.setdefault(rel.variable, set()).update(types)
+            if not types or rel.variable_length:
+                continue
+            left_labels = labels_of[left] or node_labels.get(nodes[left].variable, set())
+            right_labels = labels_of[right] or node_labels.get(nodes[right].variable, set())
+            self._check_direction(tokens, rel, types, left_labels, right_labels, issues, edits, repair)
+
+        def check_key(i: int, labels: set[str], keys: Dict[str, Dict[str, str]], owner: str) -> None:
+            known = {}
+            for label in labels:
+                known.update(keys.get(label, {}))
+            if not known:
+                return
+            expected = sorted(known.values())
+            hint = ", ".join(expected[:MAX_HINTS]) + (", ..." if len(expected) > MAX_HINTS else "")
+            rename(i, known, "property", "property", f" of {owner} (properties: {hint})")
+
+        for position, node in nodes.items():
+            labels = labels_of[position] or node_labels.get(node.variable, set())
+            for i in node.keys:
+                check_key(i, labels, self.node_keys, _owner(labels, ":"))
+        for chain in chains:
+            for _, rel, _ in chain:
+                types = rel_types.get(rel.variable, set()) or {self.types.get(_norm(tokens[i].name)) for i in rel.types} - {None}
+                for i in rel.keys:
+                    check_key(i, types, self.rel_keys, _owner(types, ":", "[]"))
+        for i in range(len(tokens) - 2):
+            if tokens[i + 1].text != "." or tokens[i].kind != "ident" or tokens[i + 2].kind not in NAME_KINDS:
+                continue
+            if i > 0 and tokens[i - 1].text == ".":
+                continue
+            variable = tokens[i].name
+            if variable in node_labels:
+                check_key(i + 2, node_labels[variable], self.node_keys, _owner(node_labels[variable], ":"))
+            elif variable in rel_types:
+                check_key(i + 2, rel_types[variable], self.rel_keys, _owner(rel_types[variable], ":", "[]"))
+
+        if not repair or not edits:
+            return LintResult(query, query, issues)
+        return LintResult(query, apply_edits(query, tokens, edits), issues)
+
+    def _check_direction(self, tokens, rel, types, left_labels, right_labels, issues, edits, repair) -> None:
+        if not left_labels and not right_labels:
+            return
+        forward = any(self._connects(rel_type, left_labels, right_labels) for rel_type in types)
+        backward = any(self._connects(rel_type, right_labels, left_labels) for rel_type in types)
+        left_owner, rel_owner, right_owner = _owner(left_labels, ":"), _owner(types, ":", "[]"), _owner(right_labels, ":")
+        missing = f"No {left_owner}-{rel_owner}-{right_owner} relationship in the schema"
+        if rel.direction == "both":
+            if not forward and not backward:
+                issues.append(LintIssue("relationship", missing))
+            return
+        right = forward if rel.direction == "right" else backward
+        wrong = backward if rel.direction == "right" else forward
+        if right:
+            return
+        if not wrong:
+            issues.append(LintIssue("relationship", missing))
+            return
+        source, target = (right_owner, left_owner) if rel.direction == "right" else (left_owner, right_owner)
+        issues.append(
+            LintIssue("direction", f"Reversed relationship, the schema has {source}-{rel_owner}->{target}", fixed=repair)
+        )
+        left, right_arrow = rel.arrows
+        if rel.direction == "right":
+            edits[left], edits[right_arrow] = "<-", "-"
+        else:
+            edits[left], edits[right_arrow] = "-", "->"
+
+    def _connects(self, rel_type: str, sources: set[str], targets: set[str]) -> bool:
+        return any(
+            (not sources or source in sources) and (not targets or target in targets)
+            for source, target in self.ends.get(rel_type, ())
+        )
+
+    def _label_predicates(self, tokens, pairs, nodes, chains) -> List[int]:
+        """Token indexes of the variables of `WHERE var:Label` predicates"""
+        inside = set()
+        for start in nodes:
+            inside.update(range(start, pairs[start] + 1))
+        for chain in chains:
+            for _, rel, _ in chain:
+                inside.update(range(rel.arrows[0], rel.arrows[1] + 1))
+        found, depth = [], 0
+        for i, token in enumerate(tokens[:-2]):
+            if token.text == "{":
+                depth += 1
+            elif token.text == "}":
+                depth -= 1
+            elif (
+                depth == 0
+                and i not in inside
+                and token.kind == "ident"
+                and tokens[i + 1].text == ":"
+                and tokens[i + 2].kind in NAME_KINDS
+            ):
+                found.append(i)
+        return found
+
+
+def _owner(names: set[str], prefix: str, brackets: str = "()") -> str:
+    """`(:AS|IXP)` of a set of labels, `[:RANK]` of relationship types"""
+    return brackets[0] + (prefix + "|".join(sorted(names)) if names else "") + brackets[1]
+
+
+if __name__ == "__main__":
+    from src.agents.iypchat.schema.schema import load_schema
+
+    linter = CypherLinter(load_schema("src/agents/iypchat/schema/neo4j-schema.json").index)
+    for query in [
+        "MATCH (a:AS {asn: 2497})-[:COUNTRY]->(c:Country) RETURN c.country_code",
+        "MATCH (c:Country {country_code: 'JP'})-[:COUNTRY]->(a:as) RETURN a.asn",
+        "MATCH (a:AS)-[:MEMBER_OF]->(i:IXP) WHERE a.name = 'IIJ' RETURN i.name",
+    ]:
+        result = linter.lint(query)
+        print(result.query, result.ok, result.issues, sep="\n", end="\n\n")
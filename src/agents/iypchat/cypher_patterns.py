@@ -0,0 +1,199 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from src.agents.iypchat.result_cache import CYPHER_KEYWORDS, CYPHER_TOKEN_RE
+
+# Tokens a label, relationship type or property key can be (AS is also a keyword)
+NAME_KINDS = {"ident", "keyword"}
+# Tokens opening and closing a relationship pattern
+_LEFT_ARROWS = {"-", "<-"}
+_RIGHT_ARROWS = {"-", "->"}
+
+
+@dataclass
+class Token:
+    kind: str
+    text: str
+    start: int
+    end: int
+
+    @property
+    def name(self) -> str:
+        return self.text.strip("`")
+
+
+@dataclass
+class NodePattern:
+    variable: Optional[str]
+    labels: List[int]  # token indexes of the labels
+    keys: List[int]  # token indexes of the inline property keys
+
+
+@dataclass
+class RelationshipPattern:
+    variable: Optional[str]
+    types: List[int]
+    keys: List[int]
+    direction: str  # "right", "left" or "both"
+    arrows: tuple[int, int]  # token indexes of the left and right arrows
+    # (min, max) hops of a variable-length relationship, max None when unbounded
+    hops: Optional[tuple[int, Optional[int]]] = None
+    # Token indexes of the first (`*`) and last tokens of the hops range
+    hops_span: Optional[tuple[int, int]] = None
+
+    @property
+    def variable_length(self) -> bool:
+        return self.hops is not None
+
+
+# Chain of a path pattern, as (left node, relationship, right node), nodes by index of their `(`
+Chain = List[tuple[int, RelationshipPattern, int]]
+
+
+def tokenize(query: str) -> List[Token]:
+    """Tokens of a Cypher statement with their position, without whitespace and comments"""
+    tokens = []
+    for match in CYPHER_TOKEN_RE.finditer(query):
+        kind = match.lastgroup
+        if kind in ("ws", "comment"):
+            continue
+        text = match.group()
+        if kind == "ident" and text.upper() in CYPHER_KEYWORDS:
+            kind = "keyword"
+        tokens.append(Token(kind, text, match.start(), match.end()))
+    return tokens
+
+
+def bracket_pairs(tokens: List[Token]) -> Dict[int, int]:
+    """Index of the closing bracket of every opening one"""
+    closing = {")": "(", "]": "[", "}": "{"}
+    pairs, stack = {}, []
+    for i, token in enumerate(tokens):
+        if token.text in ("(", "[", "{"):
+            stack.append(i)
+        elif token.text in closing and stack and tokens[stack[-1]].text == closing[token.text]:
+            pairs[stack.pop()] = i
+    return pairs
+
+
+def parse_patterns(tokens: List[Token], pairs: Dict[int, int]) -> tuple[Dict[int, NodePattern], List[Chain]]:
+    """Node patterns by index of their `(`, and the chains of the path patterns"""
+    nodes: Dict[int, NodePattern] = {}
+    chains: List[Chain] = []
+    i = 0
+    while i < len(tokens):
+        node = _node(tokens, pairs, i)
+        if node is None:
+            i += 1
+            continue
+        nodes[i] = node
+        chain = []
+        left, i = i, pairs[i] + 1
+        while (link := _relationship(tokens, pairs, i)) is not None:
+            rel, right = link
+            right_node = _node(tokens, pairs, right)
+            if right_node is None:
+                break
+            nodes[right] = right_node
+            chain.append((left, rel, right))
+            left, i = right, pairs[right] + 1
+        chains.append(chain)
+    return nodes, chains
+
+
+def _node(tokens: List[Token], pairs: Dict[int, int], i: int) -> Optional[NodePattern]:
+    """Node pattern opening at `i`: `(var:Label:Other {key: value})`, every part optional"""
+    if tokens[i].text != "(" or i not in pairs:
+        return None
+    # `count(n)` is a function call
+    if i > 0 and tokens[i - 1].kind == "ident":
+        return None
+    end = pairs[i]
+    j = i + 1
+    variable = None
+    # A variable can be named like a keyword, `(as:AS)`
+    if j < end and tokens[j].kind in NAME_KINDS and tokens[j + 1].text in (":", ")", "{"):
+        variable, j = tokens[j].name, j + 1
+    labels = []
+    while j + 1 < end and tokens[j].text in (":", "&", "|") and tokens[j + 1].kind in NAME_KINDS:
+        labels.append(j + 1)
+        j += 2
+    keys = []
+    if j < end and tokens[j].text == "{":
+        keys = map_keys(tokens, pairs, j)
+        j = pairs.get(j, end) + 1
+    return NodePattern(variable, labels, keys) if j == end else None
+
+
+def _hops(tokens: List[Token], star: int, end: int) -> tuple[tuple[int, Optional[int]], int]:
+    """Range of `*`, `*3`, `*2..`, `*..4` or `*2..4` starting at `star`, and its last token"""
+    j = star + 1
+    low = high = None
+    if j < end and tokens[j].kind == "number":
+        low = high = int(tokens[j].text)
+        j += 1
+    if j < end and tokens[j].text == "..":
+        high = None
+        j += 1
+        if j < end and tokens[j].kind == "number":
+            high = int(tokens[j].text)
+            j += 1
+    return (1 if low is None else low, high), j - 1
+
+
+def _relationship(tokens: List[Token], pairs: Dict[int, int], i: int):
+    """Relationship pattern at `i`, `-[var:TYPE*1..2 {key: value}]->` or `--`, and the index of the next node"""
+    if i + 1 >= len(tokens) or tokens[i].text not in _LEFT_ARROWS:
+        return None
+    variable, types, keys, hops, hops_span = None, [], [], None, None
+    j = i + 1
+    if tokens[j].text == "[" and j in pairs:
+        end = pairs[j]
+        j += 1
+        if j < end and tokens[j].kind == "ident":
+            variable, j = tokens[j].name, j + 1
+        while j + 1 < end and tokens[j].text in (":", "|"):
+            if tokens[j + 1].text == ":":
+                j += 1
+            if tokens[j + 1].kind not in NAME_KINDS:
+                break
+            types.append(j + 1)
+            j += 2
+        if j < end and tokens[j].text == "*":
+            hops, last = _hops(tokens, j, end)
+            hops_span = (j, last)
+            j = last + 1
+        if j < end and tokens[j].text == "{":
+            keys = map_keys(tokens, pairs, j)
+            j = pairs.get(j, end) + 1
+        if j != end:
+            return None
+        j = end + 1
+    if j + 1 >= len(tokens) or tokens[j].text not in _RIGHT_ARROWS or tokens[j + 1].text != "(":
+        return None
+    left, right = tokens[i].text, tokens[j].text
+    if left == "<-" and right == "->":
+        return None
+    direction = "left" if left == "<-" else "right" if right == "->" else "both"
+    return RelationshipPattern(variable, types, keys, direction, (i, j), hops, hops_span), j + 1
+
+
+def map_keys(tokens: List[Token], pairs: Dict[int, int], i: int) -> List[int]:
+    """Token indexes of the keys of the map literal opening at `i`"""
+    keys = []
+    end = pairs.get(i, i)
+    j = i + 1
+    while j + 1 < end:
+        if tokens[j].kind in NAME_KINDS and tokens[j + 1].text == ":" and tokens[j - 1].text in ("{", ","):
+            keys.append(j)
+        j = pairs.get(j, j) + 1
+    return keys
+
+
+def apply_edits(query: str, tokens: List[Token], edits: Dict[int, str]) -> str:
+    """Replace the text of the tokens of `edits` (token index -> text), keeping the rest of the query as is"""
+    out, last = [], 0
+    for i in sorted(edits):
+        out += [query[last : tokens[i].start], edits[i]]
+        last = tokens[i].end
+    return "".join(out) + query[last:]
@@ -0,0 +1,259 @@
+import ast
+import ipaddress
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from src.agents.iypchat.schema.schema import ENTITIES_EXPLANATIONS
+
+# Entity labels the extractor may return, in the order of ENTITIES_EXPLANATIONS
+ENTITY_LABELS = re.findall(r"^- (\w+):", ENTITIES_EXPLANATIONS, flags=re.MULTILINE)
+
+# Identifiers recognized by their syntax, checked in this order so that a URL
+# is not also read as a hostname and a prefix as an IP
+IDENTIFIER_PATTERNS = [
+    ("URL", re.compile(r"\bhttps?://[^\s'\"<>]+", re.IGNORECASE)),
+    ("Prefix", re.compile(r"(?<![\w.:])(?:\d{1,3}\.){3}\d{1,3}/\d{1,2}\b")),
+    ("Prefix", re.compile(r"(?<![\w:])[0-9a-fA-F]{0,4}(?::[0-9a-fA-F]{0,4}){1,7}/\d{1,3}\b")),
+    ("IP", re.compile(r"(?<![\w.:])(?:\d{1,3}\.){3}\d{1,3}(?![\w.:/])")),
+    ("IP", re.compile(r"(?<![\w:])[0-9a-fA-F]{0,4}(?::[0-9a-fA-F]{0,4}){2,7}(?![\w:/])")),
+    ("AS", re.compile(r"\bAS\s?\d+\b|\b[Aa][Ss][Nn]\s?:?\s?\d+\b")),
+    ("BGPCollector", re.compile(r"\b(?:rrc\d{2}|route-views[\w.]*)\b", re.IGNORECASE)),
+    ("Hostname", re.compile(r"\b(?:www|ns\d*|mail|smtp)\.(?:[a-z0-9-]+\.)+[a-z]{2,}\b", re.IGNORECASE)),
+    ("DomainName", re.compile(r"(?<![\w.@/-])(?:[a-z0-9-]+\.)+[a-z]{2,}\b(?![.\w]*/)", re.IGNORECASE)),
+    ("DomainName", re.compile(r"(?<![\w.])\.[a-z]{2,}\b(?=\s+(?:domains?|tld|top level|names?)\b|['\"])", re.IGNORECASE)),
+    ("Name", re.compile(r"\bAS(?:es)?\s+names?\b|\bnames?\s+(?:\w+\s+){0,2}?(?:of|for)\s+(?:the\s+)?(?:AS|ASes|ASNs?)\b")),
+]
+
+# Words naming a label, matched case-insensitively on whole words
+KEYWORDS: Dict[str, List[str]] = {
+    "AS": ["ases", "asn", "asns", "autonomous system", "autonomous systems"],
+    "Country": ["country", "countries", "country code", "country codes", "country_code"],
+    "Prefix": ["prefix", "prefixes"],
+    "IP": ["ip", "ips", "ip address", "ip addresses", "ipv4", "ipv6"],
+    "URL": ["url", "urls"],
+    "DomainName": ["domain", "domains", "domain name", "domain names"],
+    "Hostname": ["hostname", "hostnames", "host name", "host names"],
+    "IXP": ["ixp", "ixps", "internet exchange", "internet exchanges", "exchange point", "exchange points"],
+    "Facility": ["facility", "facilities", "data center", "data centers", "datacenter", "datacenters"],
+    "AuthoritativeNameServer": ["authoritative", "nameserver", "nameservers", "name server", "name servers"],
+    "Ranking": ["ranking", "rankings", "rank", "ranks", "ranked"],
+    "BGPCollector": ["collector", "collectors"],
+    "Organization": ["organization", "organizations", "organisation", "organisations"],
+    "Tag": ["tag", "tags", "rpki", "irr", "anycast"],
+    "AtlasProbe": ["atlas probe", "atlas probes"],
+    "AtlasMeasurement": ["atlas measurement", "atlas measurements"],
+    "Estimate": ["population", "estimate", "estimates"],
+}
+# Label names themselves (DomainName, hostname...) are keywords too, except AS:
+# "as" is English, upper case AS is matched by AS_WORD_RE
+for _label in ENTITY_LABELS:
+    if _label != "AS":
+        KEYWORDS.setdefault(_label, []).append(_label.lower())
+
+KEYWORD_RE = re.compile(
+    r"\b(?:"
+    + "|".join(
+        sorted((re.escape(k) for ks in KEYWORDS.values() for k in ks), key=len, reverse=True)
+    )
+    + r")\b",
+    re.IGNORECASE,
+)
+_KEYWORD_LABELS = {k: label for label, ks in KEYWORDS.items() for k in ks}
+
+# "top 100", "top 10k", "top100": a Ranking
+TOP_RE = re.compile(r"\btop\s?\d+[km]?\b", re.IGNORECASE)
+# Upper case "AS"/"ASes" as a word, lower case "as" is English
+AS_WORD_RE = re.compile(r"\bAS(?:es|s)?\b")
+# Clues the rules cannot resolve: proper nouns and quoted values
+CAPITALIZED_RE = re.compile(r"(?<![\w.'-])[A-Z][\w.-]*")
+QUOTED_RE = re.compile(r"'[^']*'|\"[^\"]*\"")
+LOWERCASE_WORD_RE = re.compile(r"(?<![\w.'/@:-])[a-z]+(?:-[a-z]+)*\b(?![.:/@-]\w)")
+SENTENCE_START_RE = re.compile(r"(?:^|[.!?:]\s+)\W*$")
+# Relationship types like PEERS_WITH
+REL_TYPE_RE = re.compile(r"[A-Z]+(?:_[A-Z]+)+")
+# Quoted country codes like 'JP'
+COUNTRY_CODE_RE = re.compile(r"['\"][A-Z]{2}['\"]")
+# Capitalized words carrying no entity
+STOPWORDS = {"I", "Return", "Find", "Get", "Give", "List", "Show", "What", "Which", "Who", "Is", "Are"}
+# Lower case words carrying no entity. Other lower case words may be names written
+# without capitals ("google", "japan"), so the rules leave those questions to the LLM
+COMMON_WORDS = frozenset(
+    """
+    a about above according across after against all along also among an and another any appear are as at
+    available be been before belong below between both but by can could did do does each either else entire
+    every everything few first for from given had has have having here how if in including into is it its
+    least less like many may me more most much must my no not of on once one only or other our out over own
+    per same self should since so some such than that the their them then there these they this those
+    through to together too under until up upon us using via was we well were what when where whether which
+    while who whom whose why will with within without would you your
+    account add announce announced announces announcing appears assigned associated based belongs
+    categorize categorized categorizes collect collected collection comes common compute connect connected
+    connecting connection contain contained containing contains correspond corresponding corresponds count
+    covered delegated depend depended dependency dependencies depending depends describe direct direction
+    directly display distinct distinctly distribution ending ends ensuring equal estimated exclude exist
+    exists find found footprint get give graph greater group grouped highest host hosted hosting
+    hosts include includes largest link linked links list located location lowest made main manage
+    managed manages managing map mapped mapping maps mark marked marks match matching measure measurement
+    node nodes number numbers order ordered ordering originate originated originates originating pair pairs
+    part participate participates path paths percent percentage property properties proportion provide
+    queried queries query rank registered registration related relation relationship relationships
+    reported resolve resolved resolves resolving respective result results return returned select
+    set share shortest show showing shows specified specific stats sum take target targeted targets term
+    terms times top topology total type types unique use used valid value values whole word
+    customer customers connections co-location dataset datasets downstream geographical
+    geolocation hege hegemony id ids label labels million name names neighbor neighbors opaque peer
+    peering peerings peers peer-to-peer present provider providers reference rel route routes routing
+    settlement-free sibling siblings self-dependencies transit upstream competitors member members
+    """.split()
+)
+
+
+def _is_valid(label: str, text: str) -> bool:
+    """Filter regex candidates that are not valid IPs or prefixes"""
+    try:
+        if label == "IP":
+            ipaddress.ip_address(text)
+        elif label == "Prefix":
+            ipaddress.ip_network(text, strict=False)
+    except ValueError:
+        return False
+    return True
+
+
+@dataclass
+class Extraction:
+    """Entities found by the rules, and whether they can be used without the LLM"""
+
+    entities: List[str] = field(default_factory=list)
+    confident: bool = False
+    unresolved: List[str] = field(default_factory=list)
+
+
+def extract_entities(text: str) -> Extraction:
+    """
+    Find IYP entity labels in a question with regexes and a keyword table.
+
+    The extraction is confident when at least one entity is found and nothing in
+    the question looks like an entity the rules cannot name (a capitalized word,
+    a quoted value or an uncommon lower case word that no rule matched).
+    """
+    found: Dict[str, int] = {}
+    covered = [False] * len(text)
+
+    def add(label: str, start: int, end: int) -> None:
+        if label not in found or start < found[label]:
+            found[label] = start
+        covered[start:end] = [True] * (end - start)
+
+    for label, pattern in IDENTIFIER_PATTERNS:
+        for match in pattern.finditer(text):
+            start, end = match.span()
+            if any(covered[start:end]) or not _is_valid(label, match.group()):
+                continue
+            add(label, start, end)
+    for match in KEYWORD_RE.finditer(text):
+        add(_KEYWORD_LABELS[match.group().lower()], *match.span())
+    for match in TOP_RE.finditer(text):
+        add("Ranking", *match.span())
+    for match in AS_WORD_RE.finditer(text):
+        add("AS", *match.span())
+
+    unresolved = []
+    for match in QUOTED_RE.finditer(text):
+        start, end = match.span()
+        is_country_code = "Country" in found and COUNTRY_CODE_RE.fullmatch(match.group())
+        if not is_country_code and not all(covered[start + 1 : end - 1]):
+            unresolved.append(match.group())
+        covered[start:end] = [True] * (end - start)
+    for match in CAPITALIZED_RE.finditer(text):
+        start, end = match.span()
+        if any(covered[start:end]) or match.group() in STOPWORDS:
+            continue
+        if REL_TYPE_RE.fullmatch(match.group()):
+            continue
+        if SENTENCE_START_RE.search(text[:start]):
+            continue
+        unresolved.append(match.group())
+    for match in LOWERCASE_WORD_RE.finditer(text):
+        start, end = match.span()
+        word = match.group()
+        if any(covered[start:end]) or word in COMMON_WORDS or word[:-1] in COMMON_WORDS:
+            continue
+        unresolved.append(word)
+
+    entities = sorted(found, key=found.get)
+    return Extraction(entities, confident=bool(entities) and not unresolved, unresolved=unresolved)
+
+
+def parse_entity_list(content: str, fallback: Optional[List[str]] = None) -> List[str]:
+    """
+    Read the python list answered by the LLM, ignoring text around it.
+
+    Unknown labels are dropped. Returns `fallback` (or an empty list) when no
+    list can be read.
+    """
+    for match in re.finditer(r"\[[^\[\]]*\]", content):
+        try:
+            value = ast.literal_eval(match.group())
+        except (ValueError, SyntaxError):
+            continue
+        if isinstance(value, list):
+            return [label for label in value if label in ENTITY_LABELS]
+    return list(fallback or [])
+
+
+class ExtractionStats:
+    """How often entities come from the rules or the LLM, and what each path costs"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"rules": 0, "llm": 0}
+        self.seconds = {"rules": 0.0, "llm": 0.0}
+
+    def record(self, path: str, seconds: float) -> None:
+        with self._lock:
+            self.counts[path] += 1
+            self.seconds[path] += seconds
+
+    def summary(self) -> Dict[str, float]:
+        """Counts, mean latencies, and the time saved by the rules, estimated with the mean LLM latency"""
+        with self._lock:
+            total = sum(self.counts.values())
+            mean = {
+                path: self.seconds[path] / self.counts[path] if self.counts[path] else 0.0
+                for path in self.counts
+            }
+            return {
+                "rules": self.counts["rules"],
+                "llm": self.counts["llm"],
+                "rules_share": self.counts["rules"] / total if total else 0.0,
+                "rules_mean_seconds": mean["rules"],
+                "llm_mean_seconds": mean["llm"],
+                "saved_seconds": self.counts["rules"] * mean["llm"] - self.seconds["rules"],
+            }
+
+
+_default_stats: Optional[ExtractionStats] = None
+_default_stats_lock = threading.Lock()
+
+
+def get_extraction_stats() -> ExtractionStats:
+    """Return the process-wide entity extraction stats"""
+    global _default_stats
+    with _default_stats_lock:
+        if _default_stats is None:
+            _default_stats = ExtractionStats()
+        return _default_stats
+
+
+if __name__ == "__main__":
+    for question in [
+        "Find the IXPs' names where the AS with asn 2497 is present.",
+        "Return everything that is related with 8.8.8.0/24.",
+        "Get the names and ASN of the AS peering with rrc25",
+        "Find the Japanese IXPs' names where the AS with asn 2497 is present",
+        "What are the IP addresses for google.com?",
+    ]:
+        print(question, extract_entities(question))
@@ -0,0 +1,254 @@
+import asyncio
+import atexit
+import threading
+from typing import Dict, Optional
+
+import aiohttp
+from aiohttp import ClientTimeout, TCPConnector
+import aiohttp_client_cache
+import requests
+import requests_cache
+from requests.adapters import HTTPAdapter
+
+# Base url for api
+IYP_API_BASE = "https://iyp.iijlab.net/iyp/db/neo4j/query/v2"
+# Default timeout before api calls are considered failed
+DEFAULT_TIMEOUT = 1800  # 180 seconds
+# Max simultaneous connections to the IYP host, shared by every caller
+DEFAULT_MAX_CONNECTIONS = 10
+# Seconds an idle connection is kept open for reuse
+DEFAULT_KEEPALIVE = 60.0
+
+
+class IYPAPIError(aiohttp.ClientError):
+    """Non-202 answer from the IYP query API"""
+
+    def __init__(self, status: int, text: str, retry_after: Optional[float] = None):
+        super().__init__(f"API Error {status}: {text}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+def _retry_after(value: Optional[str]) -> Optional[float]:
+    return float(value) if value and value.isdigit() else None
+
+
+def raise_for_status(response: requests.Response) -> None:
+    """Raise IYPAPIError unless the API accepted the query, sync version of `check_status`"""
+    if response.status_code != 202:
+        raise IYPAPIError(response.status_code, response.text, _retry_after(response.headers.get("Retry-After")))
+
+
+async def check_status(response: aiohttp.ClientResponse) -> None:
+    """Raise IYPAPIError unless the API accepted the query"""
+    if response.status != 202:  # Neo4j Query API returns 202 for success
+        error_text = await response.text()
+        raise IYPAPIError(response.status, error_text, _retry_after(response.headers.get("Retry-After")))
+
+
+def _discard_asession(session: aiohttp.ClientSession) -> None:
+    """Drop a session whose event loop is gone, without awaiting its close"""
+    connector = session.connector
+    if connector is not None and not connector.closed:
+        try:
+            connector.close()
+        except RuntimeError:
+            # Transports of a closed loop cannot be closed anymore
+            pass
+
+
+class IYPClient:
+    """Process-wide HTTP client for the IYP query API.
+
+    Sessions (and the sqlite HTTP cache behind them) are created lazily and then
+    reused, so consecutive queries share keep-alive connections instead of paying
+    a TCP+TLS handshake each. aiohttp sessions are bound to an event loop, so one
+    async session is kept per loop.
+    """
+
+    def __init__(
+        self,
+        base_url: str = IYP_API_BASE,
+        timeout: float = DEFAULT_TIMEOUT,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        keepalive_timeout: float = DEFAULT_KEEPALIVE,
+        cache_name: str = "iyp_cache",
+    ):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.keepalive_timeout = keepalive_timeout
+        self.cache_name = cache_name
+
+        self._lock = threading.Lock()
+        self._sessions: Dict[bool, requests.Session] = {}
+        self._asessions: Dict[tuple, aiohttp.ClientSession] = {}
+
+    # Sync
+
+    def session(self, use_cache: bool = True) -> requests.Session:
+        """Return the pooled requests session, creating it on first use"""
+        with self._lock:
+            session = self._sessions.get(use_cache)
+            if session is None:
+                if use_cache:
+                    session = requests_cache.CachedSession(
+                        cache_name=self.cache_name,
+                        backend="sqlite",
+                        expire_after=None,
+                    )
+                else:
+                    session = requests.Session()
+                # pool_block caps the connections opened to the IYP host
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=self.max_connections,
+                    pool_block=True,
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._sessions[use_cache] = session
+            return session
+
+    def post(
+        self, statement: str, use_cache: bool = True, stream: bool = False
+    ) -> requests.Response:
+        """
+        POST a Cypher statement and return the HTTP response.
+
+        Raises:
+            IYPAPIError: If the API response status is not 202 (accepted).
+            requests.exceptions.RequestException: If the HTTP request fails.
+        """
+        payload = {"statement": statement, "parameters": {}}
+        resp = self.session(use_cache).post(
+            self.base_url, json=payload, timeout=self.timeout, stream=stream
+        )
+        raise_for_status(resp)
+        return resp
+
+    def query(self, statement: str, use_cache: bool = True) -> Dict:
+        """
+        POST a Cypher statement and return the decoded JSON body.
+
+        Raises:
+            IYPAPIError: If the API response status is not 202 (accepted).
+            requests.exceptions.RequestException: If the HTTP request fails.
+        """
+        return self.post(statement, use_cache=use_cache).json()
+
+    # Async
+
+    def asession(self, use_cache: bool = True) -> aiohttp.ClientSession:
+        """Return the pooled aiohttp session of the running event loop"""
+        loop = asyncio.get_running_loop()
+        key = (id(loop), use_cache)
+        with self._lock:
+            # Forget sessions left behind by loops that are gone
+            for other_key, other in list(self._asessions.items()):
+                if other.closed or other._loop.is_closed():
+                    _discard_asession(other)
+                    del self._asessions[other_key]
+
+            session = self._asessions.get(key)
+            if session is None:
+                timeout = ClientTimeout(total=self.timeout)
+                connector = TCPConnector(
+                    limit=self.max_connections,
+                    limit_per_host=self.max_connections,
+                    keepalive_timeout=self.keepalive_timeout,
+                )
+                if use_cache:
+                    session = aiohttp_client_cache.CachedSession(
+                        cache=aiohttp_client_cache.SQLiteBackend(self.cache_name),
+                        timeout=timeout,
+                        connector=connector,
+                    )
+                else:
+                    session = aiohttp.ClientSession(timeout=timeout, connector=connector)
+                self._asessions[key] = session
+            return session
+
+    async def aquery(self, statement: str, use_cache: bool = True) -> Dict:
+        """
+        POST a Cypher statement asynchronously and return the decoded JSON body.
+
+        Raises:
+            IYPAPIError: If the API response status is not 202 (accepted).
+            aiohttp.ClientError: If the HTTP request fails.
+        """
+        async with self.apost(statement, use_cache=use_cache) as response:
+            await check_status(response)
+            return await response.json()
+
+    def apost(self, statement: str, use_cache: bool = True):
+        """Return the `session.post` context manager of a Cypher statement.
+
+        The status is not checked, call `check_status` on the response.
+        """
+        request_body = {"statement": statement, "parameters": {}}
+        return self.asession(use_cache).post(self.base_url, json=request_body)
+
+    # Shutdown
+
+    def close(self) -> None:
+        """Close sync sessions, and async sessions whose loop is idle"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            asessions = list(self._asessions.values())
+            self._sessions.clear()
+            self._asessions.clear()
+
+        for session in sessions:
+            session.close()
+        for asession in asessions:
+            loop = asession._loop
+            if asession.closed or loop.is_running():
+                continue
+            if loop.is_closed():
+                _discard_asession(asession)
+            else:
+                loop.run_until_complete(asession.close())
+
+    async def aclose(self) -> None:
+        """Close every session, awaiting the ones bound to the running loop"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            asessions = [
+                session
+                for (loop_id, _), session in self._asessions.items()
+                if loop_id == id(loop)
+            ]
+            self._asessions = {
+                key: session
+                for key, session in self._asessions.items()
+                if key[0] != id(loop)
+            }
+        for asession in asessions:
+            await asession.close()
+        self.close()
+
+
+_default_client: Optional[IYPClient] = None
+_default_client_lock = threading.Lock()
+
+
+def get_iyp_client() -> IYPClient:
+    """Return the process-wide IYP client"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = IYPClient()
+        return _default_client
+
+
+def close_iyp_client() -> None:
+    """Shutdown hook: release the pooled connections of the default client"""
+    global _default_client
+    with _default_client_lock:
+        client, _default_client = _default_client, None
+    if client is not None:
+        client.close()
+
+
+atexit.register(close_iyp_client)
@@ -1,12 +1,19 @@
-import ast
 import json
+import logging
+import time
 from langgraph.graph import StateGraph, START, END
-from langchain_core.messages import SystemMessage, HumanMessage
-from langchain_openai import ChatOpenAI
+from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage
 from langgraph.graph.state import CompiledStateGraph
+from langgraph.utils.runnable import RunnableCallable
 
-from src.agents.iypchat.schema.schema import Neo4jSchema
-from src.agents.iypchat.query_iyp import run_iyp_query
+from src.agents.iypchat.schema.schema import load_schema
+from src.agents.iypchat.query_iyp import astream_iyp_query, stream_iyp_query
+from src.agents.iypchat.backends import get_iyp_backend
+from src.agents.iypchat.candidates import Candidate, arace_candidates, candidate_temperatures, race_candidates
+from src.agents.iypchat.cypher_lint import CypherLinter
+from src.agents.iypchat.query_guard import QueryGuard
+from src.agents.iypchat.repair import STRATEGIES, QueryFailure, classify_failure, repair_messages
+from src.agents.iypchat.entities import extract_entities, get_extraction_stats, parse_entity_list
 from src.agents.iypchat.prompts.templates import (
     create_entity_prompt,
     create_cypher_template,
@@ -14,8 +21,9 @@ from src.agents.iypchat.prompts.templates import (
 )
 from src.agents.iypchat.prompts.examples import entity_examples, presenter_examples
 from src.agents.utils.states import SplitThinkingAgentState, remove_thoughts, serialize_state
-from src.agents.utils.models import ModelParams
+from src.agents.utils.models import ModelParams, get_chat_model
 
+logger = logging.getLogger(__name__)
 
 
 class GraphState(SplitThinkingAgentState):
@@ -23,78 +31,239 @@ class GraphState(SplitThinkingAgentState):
     user_query: str
     cypher_query: str
     cypher_result: str
+    cypher_note: str
     cypher_thoughts: str
+    # Generation prompt, reused as is by the repairs
+    cypher_prompt: list[AnyMessage]
+    # Failure of the last query (see `classify_failure`), "" when it answered
+    cypher_failure: str
+    cypher_error: str
+    cypher_repairs: int
+    # Seconds spent running the queries on IYP, repairs included
+    cypher_seconds: float
     
     
-def get_iyp_graph(debug=False, checkpointer=None, model_params=ModelParams()) -> CompiledStateGraph:
-    """Return IYP graph agent"""
-    llm = ChatOpenAI(**model_params.model_dump())
-
-    schema = Neo4jSchema.from_json("src/agents/iypchat/schema/neo4j-schema.json")
-
-    def entity_extractor(state: GraphState) -> list:
-        sysprompt = create_entity_prompt(entity_examples)
-        user_query = state["messages"][-1]
-        response = llm.invoke([SystemMessage(sysprompt), state["messages"][-1]])
-        entities = ast.literal_eval(remove_thoughts(response.content))
-        
+def get_iyp_graph(
+    debug=False,
+    checkpointer=None,
+    model_params=ModelParams(),
+    few_shot="overlap",
+    max_repairs=2,
+    candidates=1,
+    vote="first",
+) -> CompiledStateGraph:
+    """Return IYP graph agent, `few_shot` is the CypherEval example selector (see `get_example_selector`).
+
+    A failed query is regenerated up to `max_repairs` times (0 disables it), see `STRATEGIES`.
+    With `candidates` > 1, that many queries are sampled at increasing temperatures and
+    run concurrently, keeping the first answer or, with `vote="majority"`, the answer
+    most of them agree on (see `race_candidates`).
+    """
+    llm = get_chat_model(model_params)
+
+    schema = load_schema("src/agents/iypchat/schema/neo4j-schema.json")
+    iyp_backend = get_iyp_backend(model_params.iyp)
+    use_cache = model_params.iyp.result_cache
+    linter = CypherLinter(schema.index)
+    guard = QueryGuard.from_settings(schema.index, model_params.iyp)
+    extraction_stats = get_extraction_stats()
+
+    def entity_messages(state: GraphState) -> list:
+        return [SystemMessage(create_entity_prompt(entity_examples)), state["messages"][-1]]
+
+    def rules_update(state: GraphState, extraction, start: float) -> dict:
+        # Obvious entities, skip the LLM round-trip
+        extraction_stats.record("rules", time.perf_counter() - start)
+        return {"entities": extraction.entities, "user_query": state["messages"][-1].content}
+
+    def llm_update(state: GraphState, response, extraction, start: float) -> dict:
+        entities = parse_entity_list(remove_thoughts(response.content), fallback=extraction.entities)
+        extraction_stats.record("llm", time.perf_counter() - start)
         return {
             "entities": entities,
             "thoughts": [response],
-            "user_query": user_query.content,
+            "user_query": state["messages"][-1].content,
         }
 
+    def entity_extractor(state: GraphState) -> dict:
+        start = time.perf_counter()
+        extraction = extract_entities(state["messages"][-1].content)
+        if extraction.confident:
+            return rules_update(state, extraction, start)
+        response = llm.invoke(entity_messages(state))
+        return llm_update(state, response, extraction, start)
+
+    async def aentity_extractor(state: GraphState) -> dict:
+        start = time.perf_counter()
+        extraction = extract_entities(state["messages"][-1].content)
+        if extraction.confident:
+            return rules_update(state, extraction, start)
+        response = await llm.ainvoke(entity_messages(state))
+        return llm_update(state, response, extraction, start)
 
-    def iyp_assistant(state: GraphState) -> list:
-        cypher_template = create_cypher_template(schema, state["entities"])
+
+    def cypher_messages(state: GraphState) -> list:
+        cypher_template = create_cypher_template(schema, state["entities"], few_shot=few_shot)
         sysprompt = cypher_template.format(
             schema=schema,
             entities=state["entities"],
             topK=5,
+            question=state["user_query"],
         )
+        return [SystemMessage(sysprompt), HumanMessage(state["user_query"])]
 
-        response = llm.invoke(
-            [SystemMessage(sysprompt), HumanMessage(state["user_query"])]
-        )
-        cypher_query = remove_thoughts(response.content)
-        try:
-            cypher_result = run_iyp_query(cypher_query)
-        except Exception as e:
-            print(f"{e}")
-            print(cypher_query)
+    def check_query(response, temperature=None) -> Candidate:
+        """Lint the generated query, then bound it, the guard only sees queries matching the schema"""
+        lint = linter.lint(remove_thoughts(response.content))
+        return Candidate(response, lint, guard.check(lint.query) if lint.ok else None, temperature=temperature)
 
+    def assistant_update(candidate: Candidate) -> dict:
+        lint, guarded, streamed, error = candidate.lint, candidate.guarded, candidate.streamed, candidate.error
+        if streamed is not None:
+            cypher_result = streamed.rows
+            cypher_note = "\n".join(note for note in (guarded.note(), streamed.note()) if note)
+        elif error is not None:
+            cypher_result, cypher_note = [], f"Note: the query failed: {error}"
+        elif guarded is not None:
+            # Too expensive, the query was not sent
+            cypher_result, cypher_note = [], guarded.note()
+        else:
+            # Rejected offline, the query was not sent
+            cypher_result = []
+            cypher_note = f"Note: the query was not run, it does not match the IYP schema:\n{lint.feedback()}"
+        failure = classify_failure(lint, guarded, candidate.rows, error)
         return {
-            "cypher_query": cypher_query,
+            "cypher_query": candidate.query,
             "cypher_result": cypher_result,
-            "thoughts": [response],
+            "cypher_note": cypher_note,
+            "thoughts": [candidate.response],
+            **(failure.to_state() if failure else {"cypher_failure": "", "cypher_error": ""}),
+        }
+
+    def run_query(response, temperature=None) -> Candidate:
+        candidate = check_query(response, temperature)
+        if candidate.guarded is not None and not candidate.guarded.rejected:
+            start = time.perf_counter()
+            try:
+                candidate.streamed = stream_iyp_query(candidate.query, use_cache=use_cache, backend=iyp_backend)
+            except Exception as e:
+                candidate.error = e
+                logger.warning("IYP query failed: %s\n%s", e, candidate.query)
+            candidate.seconds = time.perf_counter() - start
+        return candidate
+
+    async def arun_query(response, temperature=None) -> Candidate:
+        candidate = check_query(response, temperature)
+        if candidate.guarded is not None and not candidate.guarded.rejected:
+            start = time.perf_counter()
+            try:
+                candidate.streamed = await astream_iyp_query(candidate.query, use_cache=use_cache, backend=iyp_backend)
+            except Exception as e:
+                candidate.error = e
+                logger.warning("IYP query failed: %s\n%s", e, candidate.query)
+            candidate.seconds = time.perf_counter() - start
+        return candidate
+
+    def generate(messages: list, temperature=None) -> Candidate:
+        model = llm if temperature is None else llm.bind(temperature=temperature)
+        return run_query(model.invoke(messages), temperature)
+
+    async def agenerate(messages: list, temperature=None) -> Candidate:
+        model = llm if temperature is None else llm.bind(temperature=temperature)
+        return await arun_query(await model.ainvoke(messages), temperature)
+
+    temperatures = candidate_temperatures(candidates, model_params.temperature)
+
+    def iyp_assistant(state: GraphState) -> dict:
+        messages = cypher_messages(state)
+        if candidates > 1:
+            candidate = race_candidates(lambda t: generate(messages, t), temperatures, vote)
+        else:
+            candidate = generate(messages)
+        return {
+            **assistant_update(candidate),
+            "cypher_prompt": messages,
+            "cypher_repairs": 0,
+            "cypher_seconds": candidate.seconds,
+        }
+
+    async def aiyp_assistant(state: GraphState) -> dict:
+        messages = cypher_messages(state)
+        if candidates > 1:
+            candidate = await arace_candidates(lambda t: agenerate(messages, t), temperatures, vote)
+        else:
+            candidate = await agenerate(messages)
+        return {
+            **assistant_update(candidate),
+            "cypher_prompt": messages,
+            "cypher_repairs": 0,
+            "cypher_seconds": candidate.seconds,
+        }
+
+    def repair_prompt(state: GraphState) -> list:
+        # Entities and generation prompt come from the state, a repair is a single LLM call
+        failure = QueryFailure(state["cypher_failure"], state["cypher_error"])
+        return repair_messages(state["cypher_prompt"], state["cypher_query"], failure, schema.index, state["entities"])
+
+    def cypher_repair(state: GraphState) -> dict:
+        candidate = generate(repair_prompt(state))
+        return {
+            **assistant_update(candidate),
+            "cypher_repairs": state["cypher_repairs"] + 1,
+            "cypher_seconds": state["cypher_seconds"] + candidate.seconds,
         }
 
+    async def acypher_repair(state: GraphState) -> dict:
+        candidate = await agenerate(repair_prompt(state))
+        return {
+            **assistant_update(candidate),
+            "cypher_repairs": state["cypher_repairs"] + 1,
+            "cypher_seconds": state["cypher_seconds"] + candidate.seconds,
+        }
+
+    def route_query(state: GraphState) -> str:
+        failure = state.get("cypher_failure")
+        repairs = state.get("cypher_repairs", 0)
+        if failure and repairs < min(STRATEGIES[failure].retries, max_repairs):
+            return "cypher_repair"
+        return "iyp_presenter"
+
 
-    def iyp_presenter(state: GraphState) -> list:
+    def presenter_messages(state: GraphState) -> list:
         sysprompt = create_presenter_prompt(presenter_examples, state["entities"])
-        response = llm.invoke(
-            [
-                SystemMessage(sysprompt),
-                HumanMessage("\n".join([state["user_query"],
-                                        str(state["cypher_query"]),
-                                        str(state["cypher_result"])]))
-            ]
-        )
+        return [
+            SystemMessage(sysprompt),
+            HumanMessage("\n".join([state["user_query"],
+                                    str(state["cypher_query"]),
+                                    str(state["cypher_result"]),
+                                    state.get("cypher_note", "")]))
+        ]
+
+    def iyp_presenter(state: GraphState) -> dict:
+        response = llm.invoke(presenter_messages(state))
+        return {"messages": [response], "thoughts": [response]}
+
+    async def aiyp_presenter(state: GraphState) -> dict:
+        response = await llm.ainvoke(presenter_messages(state))
         return {"messages": [response], "thoughts": [response]}
 
 
     builder = StateGraph(GraphState)
 
-    builder.add_node("entity_extractor", entity_extractor)
-    builder.add_node("iyp_assistant", iyp_assistant)
-    builder.add_node("iyp_presenter", iyp_presenter)
+    # Sync nodes serve invoke/stream, async ones ainvoke/astream
+    builder.add_node("entity_extractor", RunnableCallable(entity_extractor, aentity_extractor))
+    builder.add_node("iyp_assistant", RunnableCallable(iyp_assistant, aiyp_assistant))
+    builder.add_node("cypher_repair", RunnableCallable(cypher_repair, acypher_repair))
+    builder.add_node("iyp_presenter", RunnableCallable(iyp_presenter, aiyp_presenter))
 
 
     builder.add_edge(START, "entity_extractor")
     builder.add_edge("entity_extractor", "iyp_assistant")
-    builder.add_edge("iyp_assistant", "iyp_presenter")
-    builder.add_edge("iyp_assistant", END)
-    iyp_graph = builder.compile(debug=True, checkpointer=checkpointer, name="iypchat")
+    # Failed queries loop through cypher_repair, a bounded number of times
+    builder.add_conditional_edges("iyp_assistant", route_query, ["cypher_repair", "iyp_presenter"])
+    builder.add_conditional_edges("cypher_repair", route_query, ["cypher_repair", "iyp_presenter"])
+    builder.add_edge("iyp_presenter", END)
+    iyp_graph = builder.compile(debug=debug, checkpointer=checkpointer, name="iypchat")
     
     return iyp_graph
 
@@ -117,3 +286,4 @@ if __name__ == "__main__":
     response = iyp_graph.invoke({"messages": [HumanMessage(user_msg)]})
     
     print(json.dumps(serialize_state(response), indent=4))
+    print(get_extraction_stats().summary())
@@ -1,6 +1,8 @@
+import itertools
 import re
+from functools import lru_cache
 from langchain_core.example_selectors.base import BaseExampleSelector
-import random
+import numpy as np
 import pandas as pd
 
 from langchain_core.prompts.few_shot import FewShotPromptTemplate
@@ -8,6 +10,7 @@ from langchain_core.prompts.prompt import PromptTemplate
 
 from src.agents.iypchat.schema.schema import ENTITIES_EXPLANATIONS, Neo4jSchema, filtered_explanations
 from src.agents.iypchat.prompts.examples import entity_examples, presenter_examples
+from src.agents.iypchat.prompts.vector_index import DEFAULT_INDEX_DIR, get_embedder, load_index
 
 
 def get_cypher_labels(cypher: str) -> list[str]:
@@ -70,7 +73,10 @@ Here are some examples of user message and expected assistant answer:
 
 example_prompt = PromptTemplate.from_template("Input: {input} -> Output: {output}")
 
-cyphereval = pd.read_csv("src/agents/iypchat/cyphereval/CypherEval/variation-A.csv")
+CYPHEREVAL_PATHS = [
+    "src/agents/iypchat/cyphereval/CypherEval/variation-A.csv",
+    "src/agents/iypchat/cyphereval/CypherEval/variation-B.csv",
+]
 ordered_levels = [
     "Easy technical prompt",
     "Easy general prompt",
@@ -79,18 +85,52 @@ ordered_levels = [
     "Hard technical prompt",
     "Hard general prompt",
 ]
-cyphereval["Difficulty Level"] = pd.Categorical(
-    cyphereval["Difficulty Level"], categories=ordered_levels, ordered=True
-)
+
+
+def load_cyphereval(paths: list[str] = CYPHEREVAL_PATHS) -> pd.DataFrame:
+    """Load the CypherEval variations in a single frame"""
+    cyphereval = pd.concat([pd.read_csv(path) for path in paths], ignore_index=True)
+    cyphereval["Difficulty Level"] = pd.Categorical(
+        cyphereval["Difficulty Level"], categories=ordered_levels, ordered=True
+    )
+    return cyphereval
 
 
 class CypherEvalExampleSelector(BaseExampleSelector):
-    def __init__(self, cyphereval: pd.DataFrame):
-        self.cyphereval = cyphereval.copy(deep=True)
+    """Pick the CypherEval examples sharing the most labels with the extracted entities.
 
-    @staticmethod
-    def _get_score(cypher: str, entities: list[str]) -> int:
-        return len(set(entities) & set(get_cypher_labels(cypher)))
+    The labels of every canonical solution are computed once into bitmasks, with
+    an inverted index label -> rows, so selecting is a popcount over the rows
+    containing one of the entities. Rows are pre-ordered by difficulty then file
+    order, which makes ties deterministic. Selection never mutates the selector,
+    a single instance is shared by all sessions.
+    """
+
+    def __init__(self, cyphereval: pd.DataFrame):
+        # Easiest first, file order among equals
+        ordered = cyphereval.sort_values(by="Difficulty Level", kind="stable")
+
+        self.label_bits: dict[str, int] = {}
+        self.row_masks: list[int] = []
+        self.inverted_index: dict[str, list[int]] = {}
+        self.task_ids: list = ordered["Task ID"].astype(str).tolist()
+        self.examples: list[dict] = []
+
+        for rank, (prompt, cypher) in enumerate(
+            zip(ordered["Prompt"], ordered["Canonical Solution"])
+        ):
+            mask = 0
+            for label in set(get_cypher_labels(cypher)):
+                bit = self.label_bits.setdefault(label, 1 << len(self.label_bits))
+                mask |= bit
+                self.inverted_index.setdefault(label, []).append(rank)
+            self.row_masks.append(mask)
+            self.examples.append(
+                {"question": prompt, "query": cypher.replace("{", "{{").replace("}", "}}")}
+            )
+
+    def _get_score(self, rank: int, entities_mask: int) -> int:
+        return (self.row_masks[rank] & entities_mask).bit_count()
 
     def add_example(self, example: dict) -> None:
         pass
@@ -101,38 +141,119 @@ class CypherEvalExampleSelector(BaseExampleSelector):
         # Number of examples
         topK = input_variables["topK"]
 
-        # Score the best match based on shared entities with cypher
-        self.cyphereval["Score"] = self.cyphereval["Canonical Solution"].apply(
-            self._get_score, args=(entities,)
-        )
-        # Break ties by Diffculty Level
-        self.cyphereval.sort_values(
-            by=["Score", "Difficulty Level"], ascending=[False, True], inplace=True
+        entities_mask = 0
+        candidates = set()
+        for entity in set(entities):
+            entities_mask |= self.label_bits.get(entity, 0)
+            candidates.update(self.inverted_index.get(entity, ()))
+
+        # Best match on shared entities, ties broken by difficulty then file order
+        scored = sorted(candidates, key=lambda rank: (-self._get_score(rank, entities_mask), rank))
+        # If there are too few examples, complete with the easiest ones
+        others = (rank for rank in range(len(self.examples)) if rank not in candidates)
+
+        selected, seen_tasks = [], set()
+        for rank in itertools.chain(scored, others):
+            if len(selected) == topK:
+                break
+            # Variations A and B of a task only differ by their constants
+            if self.task_ids[rank] in seen_tasks:
+                continue
+            seen_tasks.add(self.task_ids[rank])
+            selected.append(self.examples[rank])
+
+        return [dict(example) for example in selected]
+
+
+class EmbeddingExampleSelector(CypherEvalExampleSelector):
+    """Rank CypherEval examples by prompt similarity with the user question.
+
+    The cosine similarity between the question and every CypherEval prompt is
+    blended with the entity overlap score: `alpha * cosine + (1 - alpha) * overlap`,
+    the overlap being the fraction of extracted entities used by the example.
+    Falls back to the overlap ranking when no `question` is given.
+
+    Args:
+        cyphereval: CypherEval examples, as returned by `load_cyphereval`.
+        sources: CSV files of the examples, the index is rebuilt when they change.
+        embedder: "tfidf" or "sentence-transformers".
+        alpha: Weight of the similarity in the blended score.
+        index_dir: Directory of the persisted index.
+    """
+
+    def __init__(
+        self,
+        cyphereval: pd.DataFrame,
+        sources: list[str] = CYPHEREVAL_PATHS,
+        embedder: str = "tfidf",
+        alpha: float = 0.7,
+        index_dir: str = DEFAULT_INDEX_DIR,
+    ):
+        super().__init__(cyphereval)
+        self.alpha = alpha
+        self.index = load_index(
+            f"cyphereval-{embedder}",
+            [example["question"] for example in self.examples],
+            sources,
+            get_embedder(embedder),
+            index_dir=index_dir,
         )
+        # labels[i, j] is 1 when example i uses the label of column j
+        self.label_columns = {label: bit.bit_length() - 1 for label, bit in self.label_bits.items()}
+        self.labels = np.zeros((len(self.examples), len(self.label_columns)), dtype=np.float32)
+        for rank, mask in enumerate(self.row_masks):
+            for label, column in self.label_columns.items():
+                if mask & self.label_bits[label]:
+                    self.labels[rank, column] = 1
+        self.ranks = np.arange(len(self.examples))
 
-        top_idxs = self.cyphereval.loc[self.cyphereval["Score"] > 0].head(topK).index
-        examples = self.cyphereval.loc[top_idxs, "Canonical Solution"].values.tolist()
-        prompts = self.cyphereval.loc[top_idxs, "Prompt"].values.tolist()
+    def select_examples(self, input_variables: dict):
+        question = input_variables.get("question")
+        if not question:
+            return super().select_examples(input_variables)
+        entities: list[str] = input_variables["entities"]
+        topK = input_variables["topK"]
 
-        # If there are too few examples, pick random ones
-        n_missing_examples = topK - len(top_idxs)
-        other_examples = self.cyphereval.loc[~self.cyphereval.index.isin(top_idxs)]
-        idxs = random.sample(range(len(other_examples)), n_missing_examples)
-        examples += other_examples.loc[idxs, "Canonical Solution"].values.tolist()
-        prompts += other_examples.loc[idxs, "Prompt"].values.tolist()
+        columns = [self.label_columns[entity] for entity in set(entities) if entity in self.label_columns]
+        overlap = self.labels[:, columns].sum(axis=1) / max(len(columns), 1)
+        scores = self.alpha * self.index.similarities(question) + (1 - self.alpha) * overlap
 
-        return [
-            {"question": prompt, "query": example.replace("{", "{{").replace("}", "}}")}
-            for prompt, example in zip(prompts, examples)
-        ]
+        # A task appears at most twice (variations A and B), 2 * topK rows are enough
+        n_best = min(2 * topK, len(scores))
+        best = np.argpartition(-scores, n_best - 1)[:n_best]
+        # Highest score first, ties broken by difficulty then file order
+        best = best[np.lexsort((self.ranks[best], -scores[best]))]
 
+        selected, seen_tasks = [], set()
+        for rank in best:
+            if len(selected) == topK:
+                break
+            if self.task_ids[rank] in seen_tasks:
+                continue
+            seen_tasks.add(self.task_ids[rank])
+            selected.append(self.examples[rank])
+
+        return [dict(example) for example in selected]
 
-def create_cypher_template(schema: Neo4jSchema, entities: list[str]):
-    """Few shot with dymanically loaded examples"""
-    
-    example_selector = CypherEvalExampleSelector(cyphereval)
-    example_selector.select_examples(input_variables={"entities": entities, "topK": 5})
 
+@lru_cache(maxsize=None)
+def get_example_selector(kind: str = "overlap") -> CypherEvalExampleSelector:
+    """
+    Selector over CypherEval, loaded on first use and shared.
+
+    Args:
+        kind: "overlap" ranks by shared entities, "tfidf" and "sentence-transformers"
+            blend it with the embedding similarity of the user question.
+    """
+    if kind == "overlap":
+        return CypherEvalExampleSelector(load_cyphereval())
+    return EmbeddingExampleSelector(load_cyphereval(), embedder=kind)
+
+
+def create_cypher_template(schema: Neo4jSchema, entities: list[str], few_shot: str = "overlap"):
+    """Few shot with dymanically loaded examples, `few_shot` picks the example selector"""
+    
+    example_selector = get_example_selector(few_shot)
 
     # # Configure a formatter
     example_prompt = PromptTemplate(
@@ -148,7 +269,7 @@ Node labels explanation:
 {filtered_explanations(labels=entities)}
 
 Neo4j schema:
-{schema.filter_labels(entities, common_rel_mode="and").to_llm()}    
+{schema.index.to_llm(entities, common_rel_mode="and")}    
 
 Note: Do not include any explanations or apologies in your responses.
 Do not respond to any questions that might ask anything else than for you to construct a Cypher statement.
@@ -162,7 +283,7 @@ Examples: Here are a few examples of generated Cypher statements for some questi
         example_prompt=example_prompt,
         prefix=prefix,
         suffix="",
-        input_variables=["schema", "entities", "topK"],
+        input_variables=["schema", "entities", "topK", "question"],
     )
     return prompt_template
 
@@ -174,6 +295,7 @@ def create_presenter_prompt(examples: dict, entities: list[str]):
     
     prefix = f"""You are a helpful assistant that present the results of a Cypher query to the user.
 The user will provide his query in natural language, the cypher query and the result, and your role is to present it in a clear and professional way.
+If the result comes with a note saying it was truncated, tell the user that only part of the result is shown.
 Cypher queries are made to a neo4j knowledge graph called Internet Yellow Pages (IYP). 
 IYP is a knowledge database that gathers information about Internet resources (for example ASNs, IP prefixes, and domain names).
 
@@ -0,0 +1,196 @@
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Bump when the on-disk layout or the embedding code changes
+INDEX_VERSION = 1
+# Where indexes are persisted, one .npy matrix and one .json metadata file each
+DEFAULT_INDEX_DIR = "src/agents/iypchat/cyphereval/index"
+# Local CPU model used by the "sentence-transformers" embedder
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+WORD_RE = re.compile(r"[a-z][a-z0-9_]+")
+
+
+def _tokens(text: str) -> List[str]:
+    """Lowercased words and bigrams"""
+    words = WORD_RE.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+class TfidfEmbedder:
+    """TF-IDF over words and bigrams, fitted on the indexed texts. Needs no download."""
+
+    name = "tfidf"
+
+    def __init__(self, vocabulary: Optional[Dict[str, int]] = None, idf: Optional[List[float]] = None):
+        self.vocabulary = vocabulary or {}
+        self.idf = np.asarray(idf or [], dtype=np.float32)
+
+    def fit(self, texts: List[str]) -> "TfidfEmbedder":
+        df = Counter(token for text in texts for token in set(_tokens(text)))
+        self.vocabulary = {token: i for i, token in enumerate(sorted(df))}
+        # Smoothed idf, as scikit-learn does
+        self.idf = np.array(
+            [math.log((1 + len(texts)) / (1 + df[token])) + 1 for token in self.vocabulary],
+            dtype=np.float32,
+        )
+        return self
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), len(self.vocabulary)), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token, count in Counter(_tokens(text)).items():
+                col = self.vocabulary.get(token)
+                if col is not None:
+                    # Sublinear tf
+                    matrix[row, col] = (1 + math.log(count)) * self.idf[col]
+        return _normalize(matrix)
+
+    def state(self) -> Dict:
+        return {"vocabulary": self.vocabulary, "idf": self.idf.tolist()}
+
+    def load_state(self, state: Dict) -> None:
+        self.vocabulary = state["vocabulary"]
+        self.idf = np.asarray(state["idf"], dtype=np.float32)
+
+
+class SentenceTransformerEmbedder:
+    """Local CPU sentence embedding model, requires `sentence-transformers`"""
+
+    def __init__(self, model_name: str = DEFAULT_EMBEDDING_MODEL):
+        self.model_name = model_name
+        self.name = f"sentence-transformers:{model_name}"
+        self._model = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            try:
+                from sentence_transformers import SentenceTransformer
+            except ImportError as e:
+                raise ImportError(
+                    "The sentence-transformers embedder needs `pip install sentence-transformers`, "
+                    "use the tfidf embedder otherwise"
+                ) from e
+            self._model = SentenceTransformer(self.model_name, device="cpu")
+        return self._model
+
+    def fit(self, texts: List[str]) -> "SentenceTransformerEmbedder":
+        return self
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        embeddings = self.model.encode(texts, normalize_embeddings=True, show_progress_bar=False)
+        return np.asarray(embeddings, dtype=np.float32)
+
+    def state(self) -> Dict:
+        return {}
+
+    def load_state(self, state: Dict) -> None:
+        pass
+
+
+def get_embedder(name: str = "tfidf"):
+    """Return the embedder called `name`: "tfidf" or "sentence-transformers"""
+    if name == "tfidf":
+        return TfidfEmbedder()
+    if name == "sentence-transformers":
+        return SentenceTransformerEmbedder()
+    raise ValueError(f"Unknown embedder {name!r}, expected 'tfidf' or 'sentence-transformers'")
+
+
+def fingerprint(paths: List[str], embedder_name: str) -> str:
+    """Hash of the source files content, the embedder and the index layout"""
+    digest = hashlib.sha256(f"{INDEX_VERSION}:{embedder_name}".encode())
+    for path in paths:
+        with open(path, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+class VectorIndex:
+    """Unit-norm embeddings of a list of texts, persisted as a memory-mapped `.npy`.
+
+    The index is rebuilt only when the fingerprint of its source files (or the
+    embedder) changes, otherwise the matrix is mapped from disk without copying.
+
+    Args:
+        name: Basename of the `.npy` and `.json` files in `index_dir`.
+        texts: Texts to index, row i of the matrix embeds texts[i].
+        sources: Files the texts come from, hashed to detect changes.
+        embedder: Embedder with `fit`, `embed`, `state` and `load_state`.
+        index_dir: Directory of the index files.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        texts: List[str],
+        sources: List[str],
+        embedder,
+        index_dir: str = DEFAULT_INDEX_DIR,
+    ):
+        self.embedder = embedder
+        self.matrix_path = os.path.join(index_dir, f"{name}.npy")
+        self.meta_path = os.path.join(index_dir, f"{name}.json")
+        self.fingerprint = fingerprint(sources, embedder.name)
+        self.rebuilt = False
+
+        if not self._load(len(texts)):
+            self._build(texts)
+            self.rebuilt = True
+
+    def _load(self, n_texts: int) -> bool:
+        try:
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            if meta.get("fingerprint") != self.fingerprint:
+                return False
+            matrix = np.load(self.matrix_path, mmap_mode="r")
+        except (OSError, ValueError):
+            return False
+        if matrix.shape[0] != n_texts:
+            return False
+        self.embedder.load_state(meta.get("embedder", {}))
+        self.matrix = matrix
+        return True
+
+    def _build(self, texts: List[str]) -> None:
+        matrix = self.embedder.fit(texts).embed(texts)
+        os.makedirs(os.path.dirname(self.matrix_path), exist_ok=True)
+        # Write then rename, so concurrent readers never map a partial file
+        tmp_matrix = f"{self.matrix_path}.{os.getpid()}.tmp.npy"
+        tmp_meta = f"{self.meta_path}.{os.getpid()}.tmp"
+        np.save(tmp_matrix, matrix)
+        with open(tmp_meta, "w") as f:
+            json.dump({"fingerprint": self.fingerprint, "embedder": self.embedder.state()}, f)
+        os.replace(tmp_matrix, self.matrix_path)
+        os.replace(tmp_meta, self.meta_path)
+        self.matrix = np.load(self.matrix_path, mmap_mode="r")
+
+    def similarities(self, text: str) -> np.ndarray:
+        """Cosine similarity of `text` with every indexed text"""
+        query = self.embedder.embed([text])[0]
+        return self.matrix @ query
+
+
+_build_lock = threading.Lock()
+
+
+def load_index(name: str, texts: List[str], sources: List[str], embedder, index_dir: str = DEFAULT_INDEX_DIR) -> VectorIndex:
+    """Open (or build) an index, one thread at a time"""
+    with _build_lock:
+        return VectorIndex(name, texts, sources, embedder, index_dir=index_dir)
@@ -0,0 +1,389 @@
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Literal, Optional
+
+from src.agents.iypchat.cypher_patterns import (
+    NAME_KINDS,
+    Chain,
+    NodePattern,
+    RelationshipPattern,
+    Token,
+    apply_edits,
+    bracket_pairs,
+    parse_patterns,
+    tokenize,
+)
+from src.agents.iypchat.schema.schema import SchemaIndex
+from src.agents.utils.models import IYPSettings
+
+logger = logging.getLogger(__name__)
+
+# Rough node counts of the IYP labels, orders of magnitude are enough
+LABEL_SIZES = {
+    "AS": 120_000, "Prefix": 1_500_000, "BGPPrefix": 1_200_000, "RPKIPrefix": 500_000,
+    "IP": 5_000_000, "HostName": 5_000_000, "DomainName": 5_000_000, "URL": 1_000_000,
+    "AuthoritativeNameServer": 500_000, "Organization": 200_000, "Name": 200_000,
+    "OpaqueID": 100_000, "AtlasMeasurement": 50_000, "AtlasProbe": 30_000,
+    "Facility": 5_000, "IXP": 1_500, "Ranking": 300, "Country": 250, "Estimate": 250,
+    "Tag": 200, "BGPCollector": 60,
+}
+DEFAULT_LABEL_SIZE = 100_000
+# Unlabeled node patterns scan the whole graph
+ALL_NODES = 100_000_000
+# Average neighbours reached through a relationship, (from its source, from its target).
+# RANK, CATEGORIZED or COUNTRY are cheap to follow from a HostName or an AS, and
+# huge from the Ranking, Tag or Country they point to.
+FANOUT = {
+    "RANK": (3, 1_000_000), "QUERIED_FROM": (50, 100_000), "CATEGORIZED": (2, 100_000),
+    "PART_OF": (2, 10_000), "COUNTRY": (1, 5_000), "DEPENDS_ON": (10, 1_000),
+    "RESOLVES_TO": (3, 100), "MANAGED_BY": (1, 1_000), "PARENT": (1, 1_000),
+    "CENSORED": (10, 1_000), "MEMBER_OF": (3, 300), "LOCATED_IN": (1, 100),
+    "TARGET": (1, 100), "PEERS_WITH": (40, 40), "ORIGINATE": (10, 2),
+    "ROUTE_ORIGIN_AUTHORIZATION": (10, 2), "ALIAS_OF": (1, 10), "SIBLING_OF": (2, 2),
+    "NAME": (1, 1), "EXTERNAL_ID": (1, 1), "WEBSITE": (1, 1), "POPULATION": (1, 1),
+    "ASSIGNED": (1, 1), "RESERVED": (1, 1), "AVAILABLE": (1, 1),
+    # (source, type, target) entries override the type ones
+    ("HostName", "PART_OF", "DomainName"): (1, 20), ("AuthoritativeNameServer", "PART_OF", "DomainName"): (1, 5),
+    ("URL", "PART_OF", "HostName"): (1, 100), ("AtlasProbe", "PART_OF", "AtlasMeasurement"): (100, 500),
+    ("Tag", "PART_OF", "Tag"): (1, 10),
+}
+DEFAULT_FANOUT = (10, 10)
+# Functions and clauses needing every row, the query cannot stop at its LIMIT
+AGGREGATIONS = {"count", "collect", "sum", "avg", "min", "max", "stdev", "percentilecont", "percentiledisc"}
+BLOCKING_KEYWORDS = {"ORDER", "DISTINCT"}
+# Share of the rows kept by a range or string filter, `r.rank < 100`
+FILTER_SELECTIVITY = 0.01
+# Tokens an equality compares a property with to anchor a variable
+_CONSTANT_KINDS = {"string", "number", "param"}
+_FILTER_OPERATORS = {"<", "<=", ">", ">=", "STARTS", "ENDS", "CONTAINS"}
+
+
+@dataclass
+class GuardResult:
+    """Outcome of `QueryGuard.check`: the query to run and the decisions taken"""
+
+    original: str
+    query: str
+    cost: float = 0.0
+    decisions: List[str] = field(default_factory=list)
+    rejected: bool = False
+
+    def note(self) -> str:
+        """Sentence telling the presenter what the guard did, "" when nothing"""
+        if self.rejected:
+            return f"Note: the query was not run: {self.decisions[-1]}."
+        if self.decisions:
+            return f"Note: the query was rewritten before running: {'; '.join(self.decisions)}."
+        return ""
+
+
+class QueryGuard:
+    """Bounds generated Cypher before it runs.
+
+    Adds a LIMIT to the final RETURN (or clamps a larger one), bounds
+    variable-length relationships, and estimates the rows the query touches from
+    the relationship fan-out of `FANOUT` and the label sizes of `LABEL_SIZES`,
+    starting from the most selective node of each pattern. A query over
+    `max_cost` is rejected unless it can stop at its LIMIT, i.e. it has no
+    aggregation, DISTINCT or ORDER BY. Every decision is logged.
+
+    Args:
+        index: Schema adjacency, for the fan-out of untyped relationships.
+        mode: "rewrite" fixes missing or large bounds, "reject" refuses the query instead, "off" lets everything through.
+        max_limit: Max rows returned.
+        max_hops: Max length of variable-length relationships.
+        max_cost: Max estimated rows touched by a query that cannot stop at its LIMIT.
+    """
+
+    def __init__(
+        self,
+        index: SchemaIndex,
+        mode: Literal["off", "rewrite", "reject"] = "rewrite",
+        max_limit: int = 200,
+        max_hops: int = 4,
+        max_cost: float = 1e8,
+    ):
+        self.index = index
+        self.mode = mode
+        self.max_limit = max_limit
+        self.max_hops = max_hops
+        self.max_cost = max_cost
+        # _steps memo, the same few (types, labels) pairs come back in every query
+        self._step_cache: Dict[tuple, Dict[tuple[str, int], float]] = {}
+
+    @classmethod
+    def from_settings(cls, index: SchemaIndex, settings: IYPSettings) -> "QueryGuard":
+        return cls(index, settings.guard, settings.max_limit, settings.max_hops, settings.max_cost)
+
+    def check(self, query: str) -> GuardResult:
+        """
+        Bound a Cypher statement and estimate its cost.
+
+        Returns:
+            GuardResult: The query to run (rewritten in "rewrite" mode), or `rejected` with the reason as last decision.
+        """
+        if self.mode == "off":
+            return GuardResult(query, query)
+        tokens = tokenize(query)
+        pairs = bracket_pairs(tokens)
+        nodes, chains = parse_patterns(tokens, pairs)
+        result = GuardResult(query, query)
+        edits: Dict[int, str] = {}
+
+        bounds = self._limits(tokens) + self._hops(tokens, chains)
+        for decision, token_edits in bounds:
+            if self.mode == "reject" or token_edits is None:
+                return self._reject(result, decision)
+            result.decisions.append(decision)
+            edits.update(token_edits)
+            logger.info("Query guard: %s in %r", decision, query)
+
+        result.cost = self.estimate_cost(tokens, nodes, chains)
+        # Past this point every RETURN has a LIMIT, which bounds the queries read lazily
+        if result.cost > self.max_cost and not self._lazy(tokens):
+            return self._reject(
+                result, f"an estimated {result.cost:.0e} rows would be read, over the {self.max_cost:.0e} budget"
+            )
+        if edits:
+            result.query = apply_edits(query, tokens, edits)
+        return result
+
+    def _reject(self, result: GuardResult, reason: str) -> GuardResult:
+        result.decisions.append(reason)
+        result.rejected = True
+        logger.warning("Query guard rejected %r: %s", result.original, reason)
+        return result
+
+    def _limits(self, tokens: List[Token]) -> List[tuple[str, Optional[Dict[int, str]]]]:
+        """Missing or too large LIMIT of the RETURN closing each UNION part"""
+        decisions = []
+        for start, end in _union_parts(tokens):
+            returns = [i for i in range(start, end) if _depth0(tokens, i, start) and tokens[i].text.upper() == "RETURN"]
+            if not returns:
+                continue
+            limits = [i for i in range(returns[-1], end) if _depth0(tokens, i, start) and tokens[i].text.upper() == "LIMIT"]
+            if not limits:
+                last = end - 1
+                edits = {last: f"{tokens[last].text} LIMIT {self.max_limit}"}
+                decisions.append((f"LIMIT {self.max_limit} added", edits))
+                continue
+            value = tokens[limits[-1] + 1] if limits[-1] + 1 < end else None
+            if value is not None and value.kind == "number" and int(float(value.text)) > self.max_limit:
+                edits = {limits[-1] + 1: str(self.max_limit)}
+                decisions.append((f"LIMIT {value.text} lowered to {self.max_limit}", edits))
+        return decisions
+
+    def _hops(self, tokens: List[Token], chains: List[Chain]) -> List[tuple[str, Optional[Dict[int, str]]]]:
+        """Unbounded or too long variable-length relationships"""
+        decisions = []
+        for chain in chains:
+            for _, rel, _ in chain:
+                if rel.hops is None:
+                    continue
+                low, high = rel.hops
+                if high is not None and high <= self.max_hops:
+                    continue
+                span = "".join(tokens[i].text for i in range(rel.hops_span[0], rel.hops_span[1] + 1))
+                if low > self.max_hops:
+                    decisions.append((f"`{span}` needs more than {self.max_hops} hops", None))
+                    continue
+                bounded = f"*{low if low != 1 else ''}..{self.max_hops}"
+                edits = {i: "" for i in range(rel.hops_span[0] + 1, rel.hops_span[1] + 1)}
+                edits[rel.hops_span[0]] = bounded
+                decisions.append((f"`{span}` bounded to `{bounded}`", edits))
+        return decisions
+
+    def estimate_cost(self, tokens: List[Token], nodes: Dict[int, NodePattern], chains: List[Chain]) -> float:
+        """Rows touched by the patterns, each expanded from its cheapest starting node"""
+        anchored, filtered = _predicates(tokens)
+        known: Dict[str, float] = {}
+        cost = 0.0
+        for chain in chains:
+            if not chain:
+                continue
+            order = [chain[0][0]] + [right for _, _, right in chain]
+            cards = [self._cardinality(tokens, nodes[position], anchored, known) for position in order]
+            kept = [filtered.get(nodes[position].variable, 1.0) for position in order]
+            labels = [{tokens[i].name for i in nodes[position].labels} for position in order]
+            rels = [rel for _, rel, _ in chain]
+            steps = [
+                (
+                    self._fanout(tokens, rel, True, labels[k], labels[k + 1]),
+                    self._fanout(tokens, rel, False, labels[k + 1], labels[k]),
+                    filtered.get(rel.variable, 1.0),
+                )
+                for k, rel in enumerate(rels)
+            ]
+            best_work, best_rows = float("inf"), 0.0
+            for start in range(len(order)):
+                rows = work = max(cards[start] * kept[start], 1.0)
+                for k in range(start, len(rels)):
+                    rows = min(rows * steps[k][0] * steps[k][2], rows * cards[k + 1]) * kept[k + 1]
+                    work += rows
+                for k in range(start - 1, -1, -1):
+                    rows = min(rows * steps[k][1] * steps[k][2], rows * cards[k]) * kept[k]
+                    work += rows
+                if work < best_work:
+                    best_work, best_rows = work, rows
+            cost += best_work
+            for position in order:
+                if nodes[position].variable:
+                    known[nodes[position].variable] = min(known.get(nodes[position].variable, best_rows), best_rows)
+        # Single node patterns
+        in_chains = {position for chain in chains for left, _, right in chain for position in (left, right)}
+        for position, node in nodes.items():
+            if position not in in_chains and node.variable not in known:
+                cost += self._cardinality(tokens, node, anchored, known)
+        return cost
+
+    def _cardinality(
+        self,
+        tokens: List[Token],
+        node: NodePattern,
+        anchored: Dict[str, float],
+        known: Dict[str, float],
+    ) -> float:
+        if node.keys:
+            return 1.0
+        if node.variable in anchored:
+            return anchored[node.variable]
+        if node.variable in known:
+            return max(known[node.variable], 1.0)
+        sizes = [LABEL_SIZES.get(tokens[i].name, DEFAULT_LABEL_SIZE) for i in node.labels]
+        return float(min(sizes)) if sizes else float(ALL_NODES)
+
+    def _fanout(
+        self, tokens: List[Token], rel: RelationshipPattern, forward: bool, labels: set[str], other: set[str]
+    ) -> float:
+        """Neighbours reached from one node of `labels`, walking the pattern left to right when `forward`"""
+        if rel.direction == "both":
+            sides = (0, 1)
+        else:
+            # Walking from the source of the relationship
+            sides = (0,) if (rel.direction == "right") == forward else (1,)
+        types = {tokens[i].name for i in rel.types}
+        steps = self._steps(types, sides, labels, other)
+        if not steps:
+            # Not in the schema, assume the worst
+            steps = {
+                (rel_type, side): FANOUT.get(rel_type, DEFAULT_FANOUT)[side]
+                for rel_type in types or self.index.relationship_types
+                for side in sides
+            }
+        per_hop = max(sum(steps.values()), 1)
+        if rel.hops is None:
+            return float(per_hop)
+        high = rel.hops[1] if rel.hops[1] is not None else self.max_hops
+        return float(per_hop) ** min(high, self.max_hops)
+
+    def _steps(
+        self, types: set[str], sides: tuple[int, ...], labels: set[str], other: set[str]
+    ) -> Dict[tuple[str, int], float]:
+        """Fan-out of the (relationship type, side) pairs of the schema from a node of `labels` to one of `other`.
+
+        Side 0 follows the relationship from its source, side 1 from its target.
+        Empty sets of labels or types match anything.
+        """
+        key = (frozenset(types), sides, frozenset(labels), frozenset(other))
+        if key in self._step_cache:
+            return self._step_cache[key]
+        steps: Dict[tuple[str, int], float] = {}
+        for triple in self.index.triples:
+            source, rel_type, target = triple
+            if types and rel_type not in types:
+                continue
+            fanout = FANOUT.get(triple) or FANOUT.get(rel_type, DEFAULT_FANOUT)
+            for side in sides:
+                start, end = (source, target) if side == 0 else (target, source)
+                if (not labels or start in labels) and (not other or end in other):
+                    steps[rel_type, side] = max(steps.get((rel_type, side), 0), fanout[side])
+        self._step_cache[key] = steps
+        return steps
+
+    @staticmethod
+    def _lazy(tokens: List[Token]) -> bool:
+        """No aggregation, DISTINCT or ORDER BY: rows are streamed and the query stops at its LIMIT"""
+        for i, token in enumerate(tokens):
+            if token.kind == "keyword" and token.text.upper() in BLOCKING_KEYWORDS:
+                return False
+            if token.kind == "ident" and token.text.lower() in AGGREGATIONS and i + 1 < len(tokens) and tokens[i + 1].text == "(":
+                return False
+        return True
+
+
+def _union_parts(tokens: List[Token]) -> List[tuple[int, int]]:
+    """Token ranges of the queries joined by UNION, without a trailing `;`"""
+    end = len(tokens)
+    while end and tokens[end - 1].text == ";":
+        end -= 1
+    parts, start, depth = [], 0, 0
+    for i in range(end):
+        if tokens[i].text in ("(", "[", "{"):
+            depth += 1
+        elif tokens[i].text in (")", "]", "}"):
+            depth -= 1
+        elif depth == 0 and tokens[i].text.upper() == "UNION":
+            parts.append((start, i))
+            start = i + 2 if i + 1 < end and tokens[i + 1].text.upper() == "ALL" else i + 1
+    parts.append((start, end))
+    return parts
+
+
+def _depth0(tokens: List[Token], i: int, start: int) -> bool:
+    """Token `i` is a keyword outside any bracket, counting from `start`"""
+    if tokens[i].kind != "keyword":
+        return False
+    depth = 0
+    for token in tokens[start:i]:
+        if token.text in ("(", "[", "{"):
+            depth += 1
+        elif token.text in (")", "]", "}"):
+            depth -= 1
+    return depth == 0
+
+
+def _predicates(tokens: List[Token]) -> tuple[Dict[str, float], Dict[str, float]]:
+    """Variables a WHERE clause narrows down.
+
+    Returns:
+        The rows of the variables compared to constants, `a.asn = 2497` or
+        `a.asn IN [2497, 2914]`, matched through an index; and the selectivity of
+        the variables filtered by ranges or string matches, `r.rank < 100`.
+    """
+    anchored: Dict[str, float] = {}
+    filtered: Dict[str, float] = {}
+    for i in range(len(tokens) - 4):
+        if tokens[i].kind == "ident" and tokens[i + 1].text == "." and tokens[i + 2].kind in NAME_KINDS:
+            variable, operator, value = tokens[i].name, tokens[i + 3], tokens[i + 4]
+        elif tokens[i].kind in _CONSTANT_KINDS and tokens[i + 2].kind == "ident" and tokens[i + 3].text == ".":
+            variable, operator, value = tokens[i + 2].name, tokens[i + 1], tokens[i]
+        else:
+            continue
+        if operator.text == "=" and value.kind in _CONSTANT_KINDS:
+            anchored[variable] = min(anchored.get(variable, 1.0), 1.0)
+        elif operator.text.upper() == "IN" and value.text == "[":
+            # One index lookup per element of the list
+            size = 1
+            for token in tokens[i + 5 :]:
+                if token.text == "]":
+                    break
+                size += token.text == ","
+            anchored[variable] = min(anchored.get(variable, float(size)), float(size))
+        elif operator.text.upper() in _FILTER_OPERATORS and (value.kind in _CONSTANT_KINDS or value.text.upper() == "WITH"):
+            filtered[variable] = FILTER_SELECTIVITY
+    return anchored, filtered
+
+
+if __name__ == "__main__":
+    from src.agents.iypchat.schema.schema import load_schema
+
+    logging.basicConfig(level=logging.INFO)
+    guard = QueryGuard(load_schema("src/agents/iypchat/schema/neo4j-schema.json").index)
+    for query in [
+        "MATCH (a:AS {asn: 2497})-[:MEMBER_OF]->(i:IXP) RETURN i.name",
+        "MATCH p = (a:AS {asn: 2497})-[:PEERS_WITH*]-(b:AS) RETURN p LIMIT 1000",
+        "MATCH (h:HostName)-[r:RANK]->(:Ranking) RETURN h.name, r.rank ORDER BY r.rank",
+        "MATCH (a:AS)-[:PEERS_WITH]-(:AS)-[:PEERS_WITH]-(c:AS) RETURN a.asn, count(DISTINCT c) AS n ORDER BY n DESC",
+    ]:
+        result = guard.check(query)
+        print(result.query, f"cost={result.cost:.0f}", result.note(), sep="\n", end="\n\n")
@@ -1,18 +1,36 @@
 import asyncio
-from typing import List, Dict
+import random
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Dict, Optional
 import aiohttp
-from aiohttp import ClientTimeout
-import aiohttp_client_cache
 from langchain_core.tools import tool
-import requests
-import requests_cache
+from neo4j.exceptions import ServiceUnavailable, SessionExpired, TransientError
 import csv
 import io
 
-# Base url for api
-IYP_API_BASE = "https://iyp.iijlab.net/iyp/db/neo4j/query/v2"
-# Default timeout before api calls are considered failed
-DEFAULT_TIMEOUT = 1800  # 180 seconds
+from src.agents.iypchat.backends import HTTPBackend, IYPBackend, get_iyp_backend
+from src.agents.iypchat.iyp_client import (
+    IYP_API_BASE,
+    DEFAULT_TIMEOUT,
+    IYPAPIError,
+    IYPClient,
+    check_status,
+)
+from src.agents.iypchat.result_cache import get_result_cache
+from src.agents.iypchat.streaming import QueryResultParser, StreamedResult
+from src.agents.utils.telemetry import timed
+
+# Max queries of a batch in flight at once
+DEFAULT_BATCH_CONCURRENCY = 8
+# Retries of a query answered with 429/5xx or a connection error
+DEFAULT_MAX_RETRIES = 3
+# Base and cap, in seconds, of the exponential backoff between retries
+DEFAULT_BACKOFF = 0.5
+MAX_BACKOFF = 30.0
+# Budgets of streamed queries, past them the connection is dropped
+STREAM_MAX_ROWS = 200
+STREAM_MAX_BYTES = 2_000_000
+STREAM_CHUNK_SIZE = 64 * 1024
 
 SCHEMA = """Node properties are the following:
 "labels","properties"
@@ -136,23 +154,46 @@ Relationship point from source to target nodes:
 "AS","WEBSITE","URL"
 "Facility","WEBSITE","URL"""
 
-TO_REMOVE = [
+# Provenance metadata carried by every IYP relationship
+TO_REMOVE = frozenset(
+    [
         "reference_org",
         "reference_url",
         "reference_url_info",
         "reference_time_fetch",
         "reference_name",
         "reference_time_modification",
-        "reference_url_data"
+        "reference_url_data",
     ]
+)
+_CONTAINERS = {dict, list}
+
+
+def _clean_value(val):
+    """Unwrap nodes/relationships to their properties and drop internal fields, at any depth"""
+    if type(val) is dict:
+        props = val.get("properties")
+        if type(props) is dict:
+            # Node or relationship, property values are scalars or lists of scalars.
+            # Copy only the ones with internal fields, the payload may be kept by the caller
+            if props.keys().isdisjoint(TO_REMOVE):
+                return props
+            return {k: v for k, v in props.items() if k not in TO_REMOVE}
+        return {
+            k: _clean_value(v) if type(v) in _CONTAINERS else v
+            for k, v in val.items()
+            if k not in TO_REMOVE
+        }
+    if type(val) is list:
+        return [_clean_value(v) if type(v) in _CONTAINERS else v for v in val]
+    return val
+
 
 def filter_internal_fields(api_result: list):
     """Remove non essential fields that might confuse the LLM"""
-    for elem in api_result:
-        for key, val in elem.items():
-            for remove_me in TO_REMOVE:
-                val.pop(remove_me, None)
-    return api_result
+    return [
+        {key: _clean_value(val) for key, val in elem.items()} for elem in api_result
+    ]
 
 def parse_node_schema(schema_str: str) -> Dict[str, List[str]]:
     """
@@ -199,191 +240,415 @@ def get_filtered_node_schema(
     return filtered
 
 
-def format_response(results: Dict) -> List[Dict]:
-    """Format the response data"""
-    result_list = []
+def format_row(keys: List[str], row: list) -> Dict:
+    """Format one row of the response data, without internal fields"""
+    return {
+        key: _clean_value(val) if type(val) in _CONTAINERS else val
+        for key, val in zip(keys, row)
+    }
+
+
+def format_response(results: Dict, columnar: bool = False):
+    """
+    Format the response data in a single pass.
+
+    Nodes and relationships are replaced by their properties and the reference_*
+    metadata of TO_REMOVE is dropped at any nesting level.
+
+    Args:
+        results (Dict): The `data` payload of the API, with `fields` and `values`.
+        columnar (bool, optional): Return a dict of column lists instead of a list of rows. Defaults to False.
+
+    Returns:
+        List[Dict] | Dict[str, list]: Rows as dictionaries, or columns as lists.
+    """
     keys = results["fields"]
+    values = results["values"]
+    if columnar:
+        columns = {key: [] for key in keys}
+        appends = [columns[key].append for key in keys]
+        for row in values:
+            for append, val in zip(appends, row):
+                append(_clean_value(val) if type(val) in _CONTAINERS else val)
+        return columns
+    return [format_row(keys, row) for row in values]
+
+
+def response_to_dataframe(results: Dict):
+    """Format the response data as a pandas DataFrame"""
+    import pandas as pd
+
+    return pd.DataFrame(format_response(results, columnar=True))
+
 
-    for row in results["values"]:
-        obj = {}
-        count_elements_in_row = 0
-
-        for row_val in row:
-            if isinstance(row_val, dict):
-                if "properties" in row_val:
-                    obj[keys[count_elements_in_row]] = row_val["properties"]
-                else:
-                    obj[keys[count_elements_in_row]] = row_val
-            elif isinstance(row_val, list):
-                obj[keys[count_elements_in_row]] = [
-                    val["properties"]
-                    if isinstance(val, dict) and "properties" in val
-                    else val
-                    for val in row_val
-                ]
-            else:
-                obj[keys[count_elements_in_row]] = row_val
-
-            count_elements_in_row += 1
-
-        # Convert None values properly
-        result_list.append(obj)
-
-    return result_list
-
-def run_iyp_query(query: str, use_cache: bool = True) -> Dict:
+def _backend(client: Optional[IYPClient], backend: Optional[IYPBackend]) -> IYPBackend:
+    """`backend`, else the HTTP API through `client`, else the process-wide backend"""
+    if backend is not None:
+        return backend
+    return HTTPBackend(client) if client is not None else get_iyp_backend()
+
+
+def run_iyp_query(
+    query: str,
+    use_cache: bool = True,
+    client: Optional[IYPClient] = None,
+    backend: Optional[IYPBackend] = None,
+) -> Dict:
     """
     Executes an IYP (Internet Yellow Pages) Cypher query synchronously, with optional caching.
 
     Args:
         query (str): A Cypher query like "MATCH (n) RETURN n LIMIT 5".
-        use_cache (bool, optional): Whether to cache the HTTP responses. Defaults to True.
+        use_cache (bool, optional): Whether to cache the formatted results and HTTP responses. Defaults to True.
+        client (IYPClient, optional): Pooled client to send the query with over HTTP.
+        backend (IYPBackend, optional): Backend running the query. Defaults to the process-wide backend, or HTTP through `client`.
 
     Returns:
         Dict: Formatted query result.
 
     Raises:
-        requests.exceptions.RequestException: If the HTTP request fails or returns a non-202 status.
+        IYPAPIError: If the API response status is not 202 (accepted).
+        requests.exceptions.RequestException: If the HTTP request fails.
+        neo4j.exceptions.Neo4jError: If the query fails on the Bolt backend.
     """
-    timeout = DEFAULT_TIMEOUT  # seconds
+    if use_cache and (cached := get_result_cache().get(query)) is not None:
+        return cached
 
-    # Set up session: cached or plain
+    backend = _backend(client, backend)
+    with timed("iyp_seconds", backend=type(backend).__name__):
+        data = backend.query(query, use_cache=use_cache)
+    result = format_response(data)
     if use_cache:
-        session = requests_cache.CachedSession(
-            cache_name="iyp_cache",
-            backend="sqlite",
-            expire_after=None,  # you can set a TTL here if desired
-        )
-    else:
-        session = requests.Session()
-
-    try:
-        # Prepare payload
-        payload = {"statement": query, "parameters": {}}
-        resp = session.post(IYP_API_BASE, json=payload, timeout=timeout)
+        get_result_cache().put(query, result)
+    return result
 
-        # Raise for any HTTP error
-        if resp.status_code != 202:
-            resp.raise_for_status()
-
-        data = resp.json().get("data", [])
-        try:
-            return filter_internal_fields(format_response(data))
-        except AttributeError:
-            return format_response(data)
-
-    finally:
-        session.close()
 
-
-async def arun_iyp_query(query: str, use_cache: bool = True) -> Dict:
+async def arun_iyp_query(
+    query: str,
+    use_cache: bool = True,
+    client: Optional[IYPClient] = None,
+    backend: Optional[IYPBackend] = None,
+) -> Dict:
     """
     Executes a IYP (Internet Yellow Pages) Cypher query asynchronously, with optional caching.
 
     Args:
         query (str): A Cypher query like "MATCH (n) RETURN n LIMIT 5".
-        use_cache (bool, optional): Whether to cache the HTTP responses. Defaults to True.
+        use_cache (bool, optional): Whether to cache the formatted results and HTTP responses. Defaults to True.
+        client (IYPClient, optional): Pooled client to send the query with over HTTP.
+        backend (IYPBackend, optional): Backend running the query. Defaults to the process-wide backend, or HTTP through `client`.
 
     Returns:
         Dict: Formatted query result.
 
     Raises:
         aiohttp.ClientError: If the API response status is not 202 (accepted).
+        neo4j.exceptions.Neo4jError: If the query fails on the Bolt backend.
     """
+    if use_cache and (cached := get_result_cache().get(query)) is not None:
+        return cached
 
-    timeout = ClientTimeout(total=DEFAULT_TIMEOUT)
-
-    # Use cached session if requested, otherwise regular session
+    backend = _backend(client, backend)
+    with timed("iyp_seconds", backend=type(backend).__name__):
+        data = await backend.aquery(query, use_cache=use_cache)
+    result = format_response(data)
     if use_cache:
-        session = aiohttp_client_cache.CachedSession(
-            cache=aiohttp_client_cache.SQLiteBackend(), timeout=timeout
-        )
-    else:
-        session = aiohttp.ClientSession(timeout=timeout)
-
-    try:
-        async with session:
-
-            # Convert query format if needed (query -> statement)
-            request_body = {"statement": query, "parameters": {}}
-
-            response = await session.post(IYP_API_BASE, json=request_body)
-            if response.status != 202:  # Neo4j Query API returns 202 for success
-                error_text = await response.text()
-                raise aiohttp.ClientError(
-                    f"API Error {response.status}: {error_text}"
-                )
-            
-            response = await response.json() 
-        try:
-            return filter_internal_fields(format_response(response["data"]))
-        except AttributeError:
-            return format_response(response["data"])
-            
+        get_result_cache().put(query, result)
+    return result
+
+
+class _StreamBudget:
+    """Turns streamed chunks into formatted rows until a budget is exhausted"""
+
+    def __init__(self, max_rows: int, max_bytes: int):
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.parser = QueryResultParser()
+        self.result = StreamedResult()
+
+    def feed(self, chunk: bytes) -> bool:
+        """Parse a chunk, return False once the rest of the body is not wanted"""
+        self.result.bytes_read += len(chunk)
+        self._add(self.parser.feed(chunk))
+        if self.result.truncated:
+            return False
+        if self.result.bytes_read > self.max_bytes and not self.parser.done:
+            self.result.truncated, self.result.reason = True, "max_bytes"
+            return False
+        return True
+
+    def close(self) -> StreamedResult:
+        if not self.result.truncated:
+            self._add(self.parser.close())
+        return self.result
+
+    def _add(self, rows: list) -> None:
+        for row in rows:
+            if len(self.result.rows) >= self.max_rows:
+                self.result.truncated, self.result.reason = True, "max_rows"
+                return
+            self.result.rows.append(format_row(self.parser.fields, row))
+
+
+def _cached_stream(query: str, max_rows: int) -> Optional[StreamedResult]:
+    cached = get_result_cache().get(query)
+    if cached is None:
+        return None
+    if len(cached) > max_rows:
+        return StreamedResult(cached[:max_rows], truncated=True, reason="max_rows")
+    return StreamedResult(cached)
+
+
+def _fetched_stream(data: Dict, max_rows: int) -> StreamedResult:
+    """Result of a backend asked for `max_rows + 1` rows, the extra one tells it was truncated"""
+    rows = format_response(data)
+    if len(rows) > max_rows:
+        return StreamedResult(rows[:max_rows], truncated=True, reason="max_rows")
+    return StreamedResult(rows)
+
+
+def stream_iyp_query(
+    query: str,
+    max_rows: int = STREAM_MAX_ROWS,
+    max_bytes: int = STREAM_MAX_BYTES,
+    use_cache: bool = True,
+    client: Optional[IYPClient] = None,
+    backend: Optional[IYPBackend] = None,
+) -> StreamedResult:
+    """
+    Executes an IYP Cypher query, parsing the answer as it is received and dropping the connection past a budget.
 
-    finally:
-        if not session.closed:
-            await session.close()
+    Args:
+        query (str): A Cypher query like "MATCH (n) RETURN n LIMIT 5".
+        max_rows (int, optional): Max rows kept. Defaults to STREAM_MAX_ROWS.
+        max_bytes (int, optional): Max response bytes read over HTTP. Defaults to STREAM_MAX_BYTES.
+        use_cache (bool, optional): Whether to use the formatted result cache. Defaults to True.
+        client (IYPClient, optional): Pooled client to send the query with over HTTP.
+        backend (IYPBackend, optional): Backend running the query. Defaults to the process-wide backend, or HTTP through `client`.
+            Other backends than HTTP fetch at most `max_rows + 1` rows instead of streaming.
 
+    Returns:
+        StreamedResult: Formatted rows, with `truncated` set when a budget was hit.
 
-async def run_iyp_queries(
-    queries: List[str], use_cache: bool = True
-) -> List[List[Dict]]:
+    Raises:
+        IYPAPIError: If the API response status is not 202 (accepted).
+        requests.exceptions.RequestException: If the HTTP request fails.
+        neo4j.exceptions.Neo4jError: If the query fails on the Bolt backend.
     """
-    Executes a list of IYP (Internet Yellow Pages) Cypher queries asynchronously, with optional caching.
+    if use_cache and (cached := _cached_stream(query, max_rows)) is not None:
+        return cached
+
+    backend = _backend(client, backend)
+    if not isinstance(backend, HTTPBackend):
+        with timed("iyp_seconds", backend=type(backend).__name__):
+            data = backend.query(query, use_cache, max_rows=max_rows + 1)
+        result = _fetched_stream(data, max_rows)
+        if use_cache and not result.truncated:
+            get_result_cache().put(query, result.rows)
+        return result
+
+    client = backend.client
+    budget = _StreamBudget(max_rows, max_bytes)
+    with timed("iyp_seconds", backend=type(backend).__name__):
+        # The HTTP cache needs whole bodies, stream on the plain session
+        resp = client.post(query, use_cache=False, stream=True)
+        try:
+            for chunk in resp.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                if not budget.feed(chunk):
+                    break
+        finally:
+            # Closing an unfinished response aborts the connection
+            resp.close()
+
+    result = budget.close()
+    if use_cache and not result.truncated:
+        get_result_cache().put(query, result.rows)
+    return result
+
+
+async def astream_iyp_query(
+    query: str,
+    max_rows: int = STREAM_MAX_ROWS,
+    max_bytes: int = STREAM_MAX_BYTES,
+    use_cache: bool = True,
+    client: Optional[IYPClient] = None,
+    backend: Optional[IYPBackend] = None,
+) -> StreamedResult:
+    """
+    Executes an IYP Cypher query asynchronously, parsing the answer as it is received and dropping the connection past a budget.
 
     Args:
-        queries (List[str]): A list of Cypher queries like
-            "MATCH (n) RETURN n LIMIT 5".
-        use_cache (bool, optional): Whether to cache the HTTP responses. Defaults to True.
+        query (str): A Cypher query like "MATCH (n) RETURN n LIMIT 5".
+        max_rows (int, optional): Max rows kept. Defaults to STREAM_MAX_ROWS.
+        max_bytes (int, optional): Max response bytes read over HTTP. Defaults to STREAM_MAX_BYTES.
+        use_cache (bool, optional): Whether to use the formatted result cache. Defaults to True.
+        client (IYPClient, optional): Pooled client to send the query with over HTTP.
+        backend (IYPBackend, optional): Backend running the query. Defaults to the process-wide backend, or HTTP through `client`.
+            Other backends than HTTP fetch at most `max_rows + 1` rows instead of streaming.
 
     Returns:
-        List[List[Dict]]: A list of formatted query result sets. Each result set is a list of dictionaries.
+        StreamedResult: Formatted rows, with `truncated` set when a budget was hit.
 
     Raises:
         aiohttp.ClientError: If the API response status is not 202 (accepted).
+        neo4j.exceptions.Neo4jError: If the query fails on the Bolt backend.
     """
+    if use_cache and (cached := _cached_stream(query, max_rows)) is not None:
+        return cached
+
+    backend = _backend(client, backend)
+    if not isinstance(backend, HTTPBackend):
+        with timed("iyp_seconds", backend=type(backend).__name__):
+            data = await backend.aquery(query, use_cache, max_rows=max_rows + 1)
+        result = _fetched_stream(data, max_rows)
+        if use_cache and not result.truncated:
+            get_result_cache().put(query, result.rows)
+        return result
+
+    client = backend.client
+    budget = _StreamBudget(max_rows, max_bytes)
+    with timed("iyp_seconds", backend=type(backend).__name__):
+        async with client.apost(query, use_cache=False) as response:
+            await check_status(response)
+            async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                if not budget.feed(chunk):
+                    # Drop the connection instead of draining the body
+                    response.close()
+                    break
+
+    result = budget.close()
+    if use_cache and not result.truncated:
+        get_result_cache().put(query, result.rows)
+    return result
+
+
+@dataclass
+class IYPQueryResult:
+    """Outcome of one query of a batch: either `result` or `error` is set"""
+
+    index: int
+    query: str
+    result: Optional[List[Dict]] = None
+    error: Optional[Exception] = None
+    attempts: int = 1
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, IYPAPIError):
+        return error.status == 429 or error.status >= 500
+    return isinstance(
+        error,
+        (aiohttp.ClientConnectionError, asyncio.TimeoutError, ServiceUnavailable, SessionExpired, TransientError),
+    )
+
+
+def _backoff_delay(error: Exception, attempt: int, backoff: float) -> float:
+    """Full-jitter exponential backoff, unless the server said when to retry"""
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is not None:
+        return min(retry_after, MAX_BACKOFF)
+    return random.uniform(0, min(MAX_BACKOFF, backoff * 2**attempt))
+
+
+async def iter_iyp_queries(
+    queries: List[str],
+    use_cache: bool = True,
+    concurrency: int = DEFAULT_BATCH_CONCURRENCY,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    backoff: float = DEFAULT_BACKOFF,
+    client: Optional[IYPClient] = None,
+    backend: Optional[IYPBackend] = None,
+) -> AsyncIterator[IYPQueryResult]:
+    """
+    Executes a batch of IYP Cypher queries with bounded concurrency, yielding results as they finish.
 
-    timeout = ClientTimeout(total=DEFAULT_TIMEOUT)
-
-    # Use cached session if requested, otherwise regular session
-    if use_cache:
-        session = aiohttp_client_cache.CachedSession(
-            cache=aiohttp_client_cache.SQLiteBackend(), timeout=timeout
-        )
-    else:
-        session = aiohttp.ClientSession(timeout=timeout)
+    A failing query never interrupts the others: its exception is returned in
+    its `IYPQueryResult`. 429/5xx answers and connection errors are retried with
+    jittered exponential backoff.
 
+    Args:
+        queries (List[str]): A list of Cypher queries like "MATCH (n) RETURN n LIMIT 5".
+        use_cache (bool, optional): Whether to cache the formatted results and HTTP responses. Defaults to True.
+        concurrency (int, optional): Max queries in flight at once. Defaults to DEFAULT_BATCH_CONCURRENCY.
+        max_retries (int, optional): Retries of a retryable failure. Defaults to DEFAULT_MAX_RETRIES.
+        backoff (float, optional): Base backoff delay in seconds. Defaults to DEFAULT_BACKOFF.
+        client (IYPClient, optional): Pooled client to send the queries with over HTTP.
+        backend (IYPBackend, optional): Backend running the queries. Defaults to the process-wide backend, or HTTP through `client`.
+
+    Yields:
+        IYPQueryResult: One result per query, in completion order. `index` is the position in `queries`.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(index: int, query: str) -> IYPQueryResult:
+        async with semaphore:
+            attempt = 0
+            while True:
+                try:
+                    result = await arun_iyp_query(query, use_cache, client, backend)
+                    return IYPQueryResult(
+                        index, query, result=result, attempts=attempt + 1
+                    )
+                except Exception as e:
+                    if attempt >= max_retries or not _is_retryable(e):
+                        return IYPQueryResult(
+                            index, query, error=e, attempts=attempt + 1
+                        )
+                    await asyncio.sleep(_backoff_delay(e, attempt, backoff))
+                    attempt += 1
+
+    tasks = [asyncio.create_task(run_one(i, query)) for i, query in enumerate(queries)]
     try:
-        async with session:
-            tasks = []
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # Consumer stopped early or was cancelled
+        for task in tasks:
+            task.cancel()
 
-            for query in queries:
-                # Convert query format if needed (query -> statement)
-                request_body = {"statement": query, "parameters": {}}
-                print(request_body)
 
-                async def fetch_query(q=request_body):
-                    async with session.post(IYP_API_BASE, json=q) as response:
-                        if (
-                            response.status != 202
-                        ):  # Neo4j Query API returns 202 for success
-                            error_text = await response.text()
-                            raise aiohttp.ClientError(
-                                f"API Error {response.status}: {error_text}"
-                            )
-                        return await response.json()
+async def run_iyp_queries(
+    queries: List[str],
+    use_cache: bool = True,
+    client: Optional[IYPClient] = None,
+    concurrency: int = DEFAULT_BATCH_CONCURRENCY,
+    return_exceptions: bool = False,
+    backend: Optional[IYPBackend] = None,
+) -> List[List[Dict]]:
+    """
+    Executes a list of IYP (Internet Yellow Pages) Cypher queries asynchronously, with optional caching.
 
-                tasks.append(fetch_query())
+    Args:
+        queries (List[str]): A list of Cypher queries like
+            "MATCH (n) RETURN n LIMIT 5".
+        use_cache (bool, optional): Whether to cache the formatted results and HTTP responses. Defaults to True.
+        client (IYPClient, optional): Pooled client to send the queries with over HTTP.
+        concurrency (int, optional): Max queries in flight at once. Defaults to DEFAULT_BATCH_CONCURRENCY.
+        return_exceptions (bool, optional): Put the exception of a failed query in its slot instead of raising. Defaults to False.
+        backend (IYPBackend, optional): Backend running the queries. Defaults to the process-wide backend, or HTTP through `client`.
 
-            responses = await asyncio.gather(*tasks)
+    Returns:
+        List[List[Dict]]: A list of formatted query result sets, in the order of `queries`. Each result set is a list of dictionaries.
 
-        return [format_response(res["data"]) for res in responses]
+    Raises:
+        aiohttp.ClientError: If a query still fails after retries and `return_exceptions` is False.
+    """
+    results: List = [None] * len(queries)
+    async for res in iter_iyp_queries(
+        queries, use_cache=use_cache, concurrency=concurrency, client=client, backend=backend
+    ):
+        results[res.index] = res.result if res.ok else res.error
+
+    if not return_exceptions:
+        for res in results:
+            if isinstance(res, Exception):
+                raise res
+    return results
 
-    finally:
-        if not session.closed:
-            await session.close()
-            
 
 if __name__ == "__main__":
         
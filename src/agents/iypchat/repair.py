@@ -0,0 +1,166 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Dict, List, Literal, Optional
+
+import requests
+from langchain_core.messages import AIMessage, AnyMessage, HumanMessage
+from neo4j.exceptions import CypherSyntaxError, Neo4jError
+
+from src.agents.iypchat.cypher_lint import LintResult
+from src.agents.iypchat.iyp_client import IYPAPIError
+from src.agents.iypchat.query_guard import GuardResult
+from src.agents.iypchat.schema.schema import SchemaIndex
+
+FailureKind = Literal["syntax", "unknown_label", "timeout", "empty"]
+
+# Characters of a Neo4j error message fed back to the LLM, their stack traces are long
+MAX_ERROR_CHARS = 600
+# Neo4j status codes, as found in driver errors and Query API error bodies
+_SYNTAX_CODES = ("Neo.ClientError.Statement.SyntaxError", "Neo.ClientError.Statement.SemanticError",
+                 "Neo.ClientError.Statement.TypeError", "Neo.ClientError.Statement.ArgumentError")
+_TIMEOUT_CODES = ("Neo.ClientError.Transaction.TransactionTimedOut", "TransactionTimedOut", "MemoryPoolOutOfMemoryError")
+
+
+@dataclass(frozen=True)
+class RepairStrategy:
+    """How a failed query is regenerated: what to ask, with which schema, and how many times"""
+
+    instruction: str
+    schema_mode: Optional[Literal["and", "or"]]  # `SchemaIndex.to_llm` mode of the schema sent back, None for none
+    retries: int
+
+
+STRATEGIES: Dict[FailureKind, RepairStrategy] = {
+    "syntax": RepairStrategy(
+        "The query is not valid Cypher. Fix the error and keep the same meaning.",
+        schema_mode=None,
+        retries=2,
+    ),
+    "unknown_label": RepairStrategy(
+        "The query uses labels, relationships or properties that are not in the schema. "
+        "Rewrite it with the names and directions of the schema below only.",
+        schema_mode="or",
+        retries=2,
+    ),
+    "timeout": RepairStrategy(
+        "The query is too expensive to run. Start from a node matched on a property value, "
+        "use typed relationships, avoid variable-length paths and aggregations over whole labels, "
+        "and return fewer rows.",
+        schema_mode=None,
+        retries=1,
+    ),
+    "empty": RepairStrategy(
+        "The query ran but returned no rows. Check the relationship directions, the property names "
+        "and the format of the values (case, prefix length, ASN as an integer), and relax filters "
+        "that may be too strict. If no rows is the right answer, return the same query.",
+        schema_mode="or",
+        retries=1,
+    ),
+}
+
+
+@dataclass
+class QueryFailure:
+    """Why a generated query gave no usable result, see `classify_failure`"""
+
+    kind: FailureKind
+    detail: str
+
+    def to_state(self) -> dict:
+        return {"cypher_failure": self.kind, "cypher_error": self.detail}
+
+
+def classify_failure(
+    lint: LintResult,
+    guarded: Optional[GuardResult] = None,
+    rows: Optional[List[Dict]] = None,
+    error: Optional[Exception] = None,
+) -> Optional[QueryFailure]:
+    """
+    Classify the outcome of a generated query.
+
+    Args:
+        lint: Schema check of the query.
+        guarded: Guard decision, None when the lint rejected the query.
+        rows: Rows of the query, when it ran.
+        error: Exception raised running it.
+
+    Returns:
+        Optional[QueryFailure]: None when the query answered, or failed in a way
+        regenerating it cannot fix (network errors, server errors).
+    """
+    if not lint.ok:
+        return QueryFailure("unknown_label", lint.feedback())
+    if guarded is not None and guarded.rejected:
+        return QueryFailure("timeout", guarded.decisions[-1])
+    if error is not None:
+        kind = _error_kind(error)
+        return QueryFailure(kind, _error_message(error)) if kind else None
+    if rows is not None and not rows:
+        return QueryFailure("empty", "The query returned no rows.")
+    return None
+
+
+def _error_kind(error: Exception) -> Optional[FailureKind]:
+    if isinstance(error, (asyncio.TimeoutError, requests.Timeout)):
+        return "timeout"
+    code = getattr(error, "code", None) or ""
+    text = f"{code} {error}"
+    if any(timeout in text for timeout in _TIMEOUT_CODES):
+        return "timeout"
+    if isinstance(error, CypherSyntaxError) or any(syntax in text for syntax in _SYNTAX_CODES):
+        return "syntax"
+    # Other client errors of the query API are about the statement
+    if isinstance(error, IYPAPIError) and error.status == 400:
+        return "syntax"
+    if isinstance(error, Neo4jError) and code.startswith("Neo.ClientError.Statement"):
+        return "syntax"
+    return None
+
+
+def _error_message(error: Exception) -> str:
+    message = getattr(error, "message", None) or str(error)
+    if len(message) > MAX_ERROR_CHARS:
+        message = message[:MAX_ERROR_CHARS] + "..."
+    return message
+
+
+def repair_messages(
+    prompt: List[AnyMessage],
+    query: str,
+    failure: QueryFailure,
+    index: SchemaIndex,
+    entities: List[str],
+) -> List[AnyMessage]:
+    """
+    Messages asking the LLM to fix `query`.
+
+    The generation prompt is sent unchanged, followed by the failed query and
+    the feedback, so servers caching prompt prefixes only process the new turn.
+
+    Args:
+        prompt: Messages the query was generated from.
+        query: The failed query.
+        failure: What went wrong.
+        index: Schema, projected on `entities` when the strategy sends it.
+        entities: Labels extracted from the question.
+    """
+    strategy = STRATEGIES[failure.kind]
+    feedback = [strategy.instruction, f"Error:\n{failure.detail}"]
+    if strategy.schema_mode is not None:
+        feedback.append(f"Neo4j schema:\n{index.to_llm(entities, common_rel_mode=strategy.schema_mode)}")
+    feedback.append("Answer with the corrected Cypher statement only.")
+    return [*prompt, AIMessage(query), HumanMessage("\n\n".join(feedback))]
+
+
+if __name__ == "__main__":
+    from src.agents.iypchat.cypher_lint import CypherLinter
+    from src.agents.iypchat.schema.schema import load_schema
+
+    index = load_schema("src/agents/iypchat/schema/neo4j-schema.json").index
+    query = "MATCH (a:AS {asn: 2497})-[:MEMBER_OF]->(i:Exchange) RETURN i.name"
+    failure = classify_failure(CypherLinter(index).lint(query))
+    for message in repair_messages([HumanMessage("Which IXPs is AS2497 a member of?")], query, failure, index, ["AS", "IXP"]):
+        print(f"{message.type}: {message.content}\n")
+    print(classify_failure(CypherLinter(index).lint("MATCH (a:AS) RETURN a"), rows=[]))
+    print(classify_failure(CypherLinter(index).lint("MATCH (a:AS) RETURN a"), error=CypherSyntaxError("Invalid input 'RETRUN'")))
@@ -0,0 +1,349 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+# IYP is rebuilt from fresh datasets once a week, cached results are stale after that
+IYP_REFRESH_WEEKDAY = 0  # Monday
+IYP_REFRESH_HOUR = 0  # UTC
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_MAX_ROWS = 200_000
+
+CYPHER_TOKEN_RE = re.compile(
+    r"""
+    (?P<ws>\s+)
+    |(?P<comment>//[^\n]*|/\*.*?\*/)
+    |(?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+    |(?P<ident>`[^`]*`|[A-Za-z_][A-Za-z0-9_]*)
+    |(?P<param>\$[A-Za-z_][A-Za-z0-9_]*)
+    |(?P<number>\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+    |(?P<op>\.\.|<=|>=|<>|=~|->|<-|.)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+CYPHER_KEYWORDS = {
+    "MATCH", "OPTIONAL", "WHERE", "RETURN", "WITH", "UNWIND", "AS", "DISTINCT",
+    "ORDER", "BY", "ASC", "DESC", "ASCENDING", "DESCENDING", "SKIP", "LIMIT",
+    "AND", "OR", "XOR", "NOT", "IN", "STARTS", "ENDS", "CONTAINS", "IS", "NULL",
+    "TRUE", "FALSE", "CASE", "WHEN", "THEN", "ELSE", "END", "CALL", "YIELD",
+    "UNION", "ALL", "EXISTS",
+}
+
+# Keywords opening a clause, used to split a query into clauses
+CLAUSE_KEYWORDS = {
+    "OPTIONAL", "MATCH", "WHERE", "RETURN", "WITH", "UNWIND", "ORDER", "SKIP",
+    "LIMIT", "UNION", "CALL",
+}
+
+# Tokens after which an identifier opening a pattern element is a variable
+_BINDING_FOLLOWERS = {":", ")", "]", "{", "*"}
+
+
+@dataclass
+class _Token:
+    kind: str
+    text: str
+
+
+def tokenize_cypher(query: str) -> List[_Token]:
+    """Split a Cypher statement into tokens, dropping whitespace and comments"""
+    tokens = []
+    for match in CYPHER_TOKEN_RE.finditer(query):
+        kind = match.lastgroup
+        if kind in ("ws", "comment"):
+            continue
+        text = match.group()
+        if kind == "ident" and text.upper() in CYPHER_KEYWORDS:
+            kind, text = "keyword", text.upper()
+        tokens.append(_Token(kind, text))
+    return tokens
+
+
+def _bound_variables(tokens: List[_Token]) -> set[str]:
+    """Names introduced by patterns `(a:...)`, `[r]`, `p = (...)` and `AS alias`"""
+    variables = set()
+    for i, token in enumerate(tokens):
+        if token.kind != "ident":
+            continue
+        prev = tokens[i - 1].text if i > 0 else ""
+        nxt = tokens[i + 1].text if i + 1 < len(tokens) else ""
+        if prev in ("(", "[") and nxt in _BINDING_FOLLOWERS:
+            variables.add(token.text)
+        elif prev == "AS":
+            variables.add(token.text)
+        elif nxt == "=" and i + 2 < len(tokens) and tokens[i + 2].text == "(":
+            variables.add(token.text)
+    return variables
+
+
+def _is_variable_use(tokens: List[_Token], i: int, brace_depth: int) -> bool:
+    prev = tokens[i - 1].text if i > 0 else ""
+    nxt = tokens[i + 1].text if i + 1 < len(tokens) else ""
+    if prev in (".", ":", "|"):  # property key, label or relationship type
+        return False
+    if nxt == "(":  # function name
+        return False
+    if brace_depth > 0 and nxt == ":":  # map key
+        return False
+    return True
+
+
+def _rename_variables(tokens: List[_Token], variables: set[str]) -> Dict[str, str]:
+    """Rename variables in place to _v0, _v1... in order of first appearance"""
+    mapping: Dict[str, str] = {}
+    brace_depth = 0
+    for i, token in enumerate(tokens):
+        if token.text == "{":
+            brace_depth += 1
+        elif token.text == "}":
+            brace_depth -= 1
+        elif token.kind == "ident" and token.text in variables:
+            if _is_variable_use(tokens, i, brace_depth):
+                mapping.setdefault(token.text, f"_v{len(mapping)}")
+                token.text = mapping[token.text]
+    return mapping
+
+
+def _render(tokens: List[_Token]) -> str:
+    """Join tokens with a space only where two words would otherwise merge"""
+    wordy = {"ident", "keyword", "param", "number", "string"}
+    out = []
+    prev_kind = None
+    for token in tokens:
+        if prev_kind in wordy and token.kind in wordy:
+            out.append(" ")
+        out.append(token.text)
+        prev_kind = token.kind
+    return "".join(out)
+
+
+def _split_depth0(tokens: List[_Token], separators: set[str]) -> List[List[_Token]]:
+    parts, current, depth = [], [], 0
+    for token in tokens:
+        if token.text in ("(", "[", "{"):
+            depth += 1
+        elif token.text in (")", "]", "}"):
+            depth -= 1
+        if depth == 0 and token.text in separators:
+            parts.append(current)
+            current = []
+            continue
+        current.append(token)
+    parts.append(current)
+    return parts
+
+
+def _sort_commutative(tokens: List[_Token]) -> List[_Token]:
+    """Sort comma-separated MATCH patterns and AND-ed WHERE conjuncts"""
+    clauses: List[List[_Token]] = [[]]
+    depth = 0
+    for token in tokens:
+        if token.text in ("(", "[", "{"):
+            depth += 1
+        elif token.text in (")", "]", "}"):
+            depth -= 1
+        if depth == 0 and token.kind == "keyword" and token.text in CLAUSE_KEYWORDS:
+            # OPTIONAL MATCH is a single clause
+            after_optional = [t.text for t in clauses[-1]] == ["OPTIONAL"]
+            if not (token.text == "MATCH" and after_optional):
+                clauses.append([])
+        clauses[-1].append(token)
+
+    out: List[_Token] = []
+    for clause in clauses:
+        n_head = 2 if clause and clause[0].text == "OPTIONAL" else 1
+        head, body = clause[:n_head], clause[n_head:]
+        if head and head[-1].text == "MATCH":
+            parts = _split_depth0(body, {","})
+            parts.sort(key=_render)
+            body = _join(parts, _Token("op", ","))
+        elif head and head[0].text == "WHERE":
+            if not _has_depth0(body, {"OR", "XOR"}):
+                parts = _split_depth0(body, {"AND"})
+                parts.sort(key=_render)
+                body = _join(parts, _Token("keyword", "AND"))
+        out.extend(head + body)
+    return out
+
+
+def _has_depth0(tokens: List[_Token], texts: set[str]) -> bool:
+    depth = 0
+    for token in tokens:
+        if token.text in ("(", "[", "{"):
+            depth += 1
+        elif token.text in (")", "]", "}"):
+            depth -= 1
+        elif depth == 0 and token.kind == "keyword" and token.text in texts:
+            return True
+    return False
+
+
+def _join(parts: List[List[_Token]], separator: _Token) -> List[_Token]:
+    out: List[_Token] = []
+    for i, part in enumerate(parts):
+        if i:
+            out.append(separator)
+        out.extend(part)
+    return out
+
+
+def normalize_cypher(query: str) -> tuple[str, Dict[str, str]]:
+    """
+    Return a canonical form of a Cypher statement, and the variable renaming used.
+
+    Whitespace, comments, keyword case, trailing semicolons, variable names and the
+    order of MATCH patterns / WHERE conjuncts do not change the canonical form.
+    """
+    tokens = tokenize_cypher(query)
+    while tokens and tokens[-1].text == ";":
+        tokens.pop()
+
+    # Rename, sort, then rename again so canonical names follow the sorted order
+    first = _rename_variables(tokens, _bound_variables(tokens))
+    tokens = _sort_commutative(tokens)
+    second = _rename_variables(tokens, set(first.values()))
+    tokens = _sort_commutative(tokens)
+
+    mapping = {name: second[renamed] for name, renamed in first.items()}
+    return _render(tokens), mapping
+
+
+def rename_columns(text: str, mapping: Dict[str, str]) -> str:
+    """Apply a variable renaming to a result column name like `ixp.name` or `count(ixp)`"""
+    tokens = [(match.lastgroup, match.group()) for match in CYPHER_TOKEN_RE.finditer(text)]
+    words = [i for i, (kind, _) in enumerate(tokens) if kind != "ws"]
+    out = [token for _, token in tokens]
+    for j, i in enumerate(words):
+        kind, token = tokens[i]
+        prev = tokens[words[j - 1]][1] if j else ""
+        nxt = tokens[words[j + 1]][1] if j + 1 < len(words) else ""
+        # Property keys and function names are not variables, even when an alias has their name
+        if kind == "ident" and token in mapping and prev != "." and nxt != "(":
+            out[i] = mapping[token]
+    return "".join(out)
+
+
+def next_iyp_refresh(now: Optional[datetime] = None) -> datetime:
+    """Next weekly IYP snapshot refresh after `now`"""
+    now = now or datetime.now(timezone.utc)
+    refresh = now.replace(hour=IYP_REFRESH_HOUR, minute=0, second=0, microsecond=0)
+    refresh += timedelta(days=(IYP_REFRESH_WEEKDAY - now.weekday()) % 7)
+    if refresh <= now:
+        refresh += timedelta(days=7)
+    return refresh
+
+
+@dataclass
+class _Entry:
+    result: List[Dict]
+    expires_at: float
+
+
+class CypherResultCache:
+    """In-memory cache of formatted IYP results, keyed on normalized Cypher.
+
+    Entries expire at the next weekly IYP refresh (or after `ttl` seconds when
+    given) and the least recently used ones are evicted past `max_entries` or
+    `max_rows` cached rows. Cached results are shared: treat them as read-only.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_rows: int = DEFAULT_MAX_ROWS,
+        ttl: Optional[float] = None,
+    ):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._rows = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _expires_at(self) -> float:
+        if self.ttl is not None:
+            return time.time() + self.ttl
+        return next_iyp_refresh().timestamp()
+
+    def get(self, query: str) -> Optional[List[Dict]]:
+        """Return the cached result of `query`, with its own column names, or None"""
+        key, mapping = normalize_cypher(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.time():
+                self._pop(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        inverse = {canonical: name for name, canonical in mapping.items()}
+        return _rekey(entry.result, inverse)
+
+    def put(self, query: str, result: List[Dict]) -> None:
+        if not isinstance(result, list) or len(result) > self.max_rows:
+            return
+        key, mapping = normalize_cypher(query)
+        entry = _Entry(_rekey(result, mapping), self._expires_at())
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = entry
+            self._rows += len(entry.result)
+            while len(self._entries) > self.max_entries or self._rows > self.max_rows:
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _pop(self, key: str) -> None:
+        self._rows -= len(self._entries.pop(key).result)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._rows = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "rows": self._rows,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+def _rekey(result: List[Dict], mapping: Dict[str, str]) -> List[Dict]:
+    """Rename the columns of a formatted result, sharing it when nothing changes"""
+    if not result or not isinstance(result[0], dict):
+        return result
+    columns = {col: rename_columns(col, mapping) for col in result[0]}
+    if all(col == renamed for col, renamed in columns.items()):
+        return result
+    return [{columns.get(k, k): v for k, v in row.items()} for row in result]
+
+
+_default_cache: Optional[CypherResultCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> CypherResultCache:
+    """Return the process-wide Cypher result cache"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = CypherResultCache()
+        return _default_cache
@@ -1,7 +1,10 @@
+import copy
 import json
+import threading
 import pandas as pd
 from dataclasses import dataclass
-from typing import Literal
+from functools import cached_property, lru_cache
+from typing import Iterable, Literal
 
 ENTITIES_EXPLANATIONS = """- AS: Autonomous System involved in BGP traffic (e.g., 2497, AS2497, IIJ (ASN2497))
 - Country: Country name or code (e.g., France, Japan, JP, jp).
@@ -105,16 +108,20 @@ class Neo4jSchema:
 
     def filter_labels(
         self, labels: list[str], common_rel_mode: Literal["or", "and"] = "and"
-    ):
-        """Project the schema only for the `labels` of interest"""
+    ) -> "Neo4jSchema":
+        """Project the schema only for the `labels` of interest.
+
+        Returns a projected copy, `self` is left untouched.
+        """
+        projected = copy.copy(self)
 
         if common_rel_mode == "or":
-            self.updated_relationships = self.relationships.loc[
+            projected.updated_relationships = self.relationships.loc[
                 self.relationships["source"].isin(labels)
                 | self.relationships["target"].isin(labels)
             ]
         elif common_rel_mode == "and":
-            self.updated_relationships = self.relationships.loc[
+            projected.updated_relationships = self.relationships.loc[
                 self.relationships["source"].isin(labels)
                 & self.relationships["target"].isin(labels)
             ]
@@ -123,17 +130,17 @@ class Neo4jSchema:
                 f"Provide or/and instead of {common_rel_mode} for common_rel_mode"
             )
 
-        self.updated_rel_props = self.updated_rel_props.loc[
-            self.updated_rel_props["type"].isin(
-                self.updated_relationships["relationship"]
+        projected.updated_rel_props = self.rel_props.loc[
+            self.rel_props["type"].isin(
+                projected.updated_relationships["relationship"]
             )
         ]
 
-        self.updated_node_props = self.node_props.loc[
-            self.node_props["labels"].isin(self.updated_relationships["source"])
-            | self.node_props["labels"].isin(self.updated_relationships["target"]),
+        projected.updated_node_props = self.node_props.loc[
+            self.node_props["labels"].isin(projected.updated_relationships["source"])
+            | self.node_props["labels"].isin(projected.updated_relationships["target"]),
         ]
-        return self
+        return projected
 
     def to_llm(self, full=False, include_rel_metadata=False) -> str:
         """Convert schema to LLM-friendly string"""
@@ -178,6 +185,151 @@ class Neo4jSchema:
     def get_labels(self) -> list[str]:
         return list(self.node_props["labels"].unique())
 
+    @cached_property
+    def index(self) -> "SchemaIndex":
+        """Precomputed, read-only index of the schema"""
+        return SchemaIndex(self)
+
+
+@lru_cache(maxsize=None)
+def load_schema(json_path: str) -> Neo4jSchema:
+    """Read a schema once per process, projections never modify it"""
+    return Neo4jSchema.from_json(json_path)
+
+
+def _markdown_table(headers: list[str], rows: list[tuple[str, ...]]) -> str:
+    """Same output as `DataFrame.to_markdown(index=False)` for string cells"""
+    widths = [
+        max([len(header) + 2] + [len(row[i]) for row in rows])
+        for i, header in enumerate(headers)
+    ]
+    lines = ["|" + "|".join(f" {h.ljust(w)} " for h, w in zip(headers, widths)) + "|"]
+    if rows:
+        lines.append("|" + "|".join(":" + "-" * (w + 1) for w in widths) + "|")
+    else:
+        lines.append("|" + "|".join("-" * (w + 2) for w in widths) + "|")
+    for row in rows:
+        lines.append("|" + "|".join(f" {c.ljust(w)} " for c, w in zip(row, widths)) + "|")
+    return "\n".join(lines)
+
+
+class SchemaIndex:
+    """Immutable index of a Neo4jSchema, built once and shared by every session.
+
+    Holds label -> relationship -> targets adjacency maps and the comma-joined
+    property strings of each label and relationship type. `to_llm` renders the
+    same text as `Neo4jSchema.filter_labels(...).to_llm()` and is memoized per
+    label set, without touching pandas or any shared mutable state.
+    """
+
+    def __init__(self, schema: Neo4jSchema):
+        # label -> relationship type -> targets, in schema order
+        self.outgoing: dict[str, dict[str, tuple[str, ...]]] = {}
+        # label -> relationship type -> sources, in schema order
+        self.incoming: dict[str, dict[str, tuple[str, ...]]] = {}
+        # (source, relationship, target) triples, in schema order
+        self.triples: tuple[tuple[str, str, str], ...] = tuple(
+            schema.relationships[["source", "relationship", "target"]].itertuples(
+                index=False, name=None
+            )
+        )
+        for source, rel, target in self.triples:
+            self.outgoing.setdefault(source, {}).setdefault(rel, ())
+            self.outgoing[source][rel] += (target,)
+            self.incoming.setdefault(target, {}).setdefault(rel, ())
+            self.incoming[target][rel] += (source,)
+
+        self.node_properties = _group(schema.node_props[["labels", "properties"]])
+        self.rel_properties = _group(schema.rel_props[["type", "properties"]])
+        self.node_props_str = {k: ",".join(v) for k, v in self.node_properties.items()}
+        rel_metadata = set(schema.REL_METADATA)
+        self.rel_props_str = {k: ",".join(v) for k, v in self.rel_properties.items()}
+        self.rel_props_str_no_metadata = {
+            k: ",".join(p for p in v if p not in rel_metadata)
+            for k, v in self.rel_properties.items()
+            if any(p not in rel_metadata for p in v)
+        }
+        self.labels = frozenset(self.node_properties)
+        self.relationship_types = frozenset(rel for _, rel, _ in self.triples)
+
+        self._cache: dict[tuple, str] = {}
+        self._lock = threading.Lock()
+
+    def to_llm(
+        self,
+        labels: Iterable[str] | None = None,
+        common_rel_mode: Literal["or", "and"] = "and",
+        include_rel_metadata: bool = False,
+    ) -> str:
+        """Convert the schema projected on `labels` (whole schema if None) to LLM-friendly string"""
+        if common_rel_mode not in ("or", "and"):
+            raise ValueError(
+                f"Provide or/and instead of {common_rel_mode} for common_rel_mode"
+            )
+        key = (
+            None if labels is None else tuple(sorted(set(labels))),
+            common_rel_mode,
+            include_rel_metadata,
+        )
+        output = self._cache.get(key)
+        if output is None:
+            output = self._render(*key)
+            with self._lock:
+                self._cache[key] = output
+        return output
+
+    def _render(self, labels, common_rel_mode, include_rel_metadata) -> str:
+        if labels is None:
+            triples = self.triples
+            node_labels = set(self.node_properties)
+        else:
+            wanted = set(labels)
+            if common_rel_mode == "or":
+                triples = [t for t in self.triples if t[0] in wanted or t[2] in wanted]
+            else:
+                triples = [t for t in self.triples if t[0] in wanted and t[2] in wanted]
+            node_labels = {t[0] for t in triples} | {t[2] for t in triples}
+        rel_types = {t[1] for t in triples}
+
+        output = "Node properties are the following:\n"
+        rows = [
+            (label, self.node_props_str[label])
+            for label in sorted(node_labels)
+            if label in self.node_props_str
+        ]
+        output += _markdown_table(["labels", "properties"], rows)
+
+        output += "\n\nRelationship properties are the following:\n"
+        rel_props = (
+            self.rel_props_str if include_rel_metadata else self.rel_props_str_no_metadata
+        )
+        rows = [(rel, rel_props[rel]) for rel in sorted(rel_types) if rel in rel_props]
+        output += _markdown_table(["type", "properties"], rows)
+
+        output += "\n\nRelationship point from source to target nodes:\n"
+        grouped: dict[tuple[str, str], list[str]] = {}
+        for source, rel, target in triples:
+            grouped.setdefault((source, rel), []).append(target)
+        rows = [
+            (source, rel, ",".join(grouped[(source, rel)]))
+            for source, rel in sorted(grouped)
+        ]
+        if rows:
+            output += _markdown_table(["source", "relationship", "target"], rows)
+        else:
+            # Mirrors the pandas groupby/apply output on an empty projection
+            output += _markdown_table(["target"], [])
+
+        return output
+
+
+def _group(df: pd.DataFrame) -> dict[str, tuple[str, ...]]:
+    """First column -> values of the second column, in order"""
+    grouped: dict[str, tuple[str, ...]] = {}
+    for key, value in df.itertuples(index=False, name=None):
+        grouped[key] = grouped.get(key, ()) + (value,)
+    return grouped
+
 if __name__ == "__main__":
     
     node_props = pd.read_csv("src/agents/iypchat/schema/node_properties.csv")
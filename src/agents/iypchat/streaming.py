@@ -0,0 +1,118 @@
+import codecs
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+_VALUES_START = ',"values":['
+_VALUES_START_RE = re.compile(r'\s*,\s*"values"\s*:\s*\[')
+_decoder = json.JSONDecoder()
+
+
+@dataclass
+class StreamedResult:
+    """Rows parsed from a streamed IYP answer, possibly cut short by a budget"""
+
+    rows: List[Dict] = field(default_factory=list)
+    truncated: bool = False
+    reason: Optional[str] = None  # "max_rows" or "max_bytes"
+    bytes_read: int = 0
+
+    def note(self) -> str:
+        """Sentence telling the presenter the result is partial"""
+        if not self.truncated:
+            return ""
+        budget = "row" if self.reason == "max_rows" else "size"
+        return (
+            f"Note: the query result was truncated to its first {len(self.rows)} rows "
+            f"because it exceeded the {budget} limit."
+        )
+
+
+class QueryResultParser:
+    """Incremental parser of Neo4j Query API bodies.
+
+    Feed raw chunks of `{"data": {"fields": [...], "values": [[...], ...]}, ...}`
+    and get back complete rows as soon as they are received, without holding the
+    whole body in memory. Bodies where `values` does not directly follow `fields`
+    are buffered and parsed in one go by `close`.
+    """
+
+    def __init__(self):
+        self.fields: Optional[List[str]] = None
+        self.done = False
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._state = "fields"
+        self._fallback = False
+
+    def feed(self, chunk: bytes) -> List[list]:
+        """Consume a chunk and return the rows it completed"""
+        self._buffer += self._decoder.decode(chunk)
+        if self._fallback or self.done:
+            return []
+
+        rows = []
+        buf, pos = self._buffer, self._pos
+        while True:
+            if self._state == "fields":
+                start = buf.find('"fields"')
+                colon = buf.find(":", start + 8) if start != -1 else -1
+                if colon == -1:
+                    break
+                try:
+                    start = _skip_ws(buf, colon + 1)
+                    self.fields, pos = _decoder.raw_decode(buf, start)
+                except json.JSONDecodeError:
+                    break
+                self._state = "values"
+            elif self._state == "values":
+                match = _VALUES_START_RE.match(buf, pos)
+                if match is None:
+                    if not _VALUES_START.startswith(re.sub(r"\s+", "", buf[pos:])):
+                        # Unexpected layout, parse the whole body at the end
+                        self._fallback = True
+                    break
+                pos = match.end()
+                self._state = "rows"
+            elif self._state == "rows":
+                pos = _skip_ws(buf, pos)
+                if pos < len(buf) and buf[pos] == ",":
+                    pos = _skip_ws(buf, pos + 1)
+                if pos >= len(buf):
+                    break
+                if buf[pos] == "]":
+                    self.done = True
+                    pos += 1
+                    break
+                try:
+                    row, pos = _decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    break
+                rows.append(row)
+
+        if self._state == "rows":
+            # Rows are consumed, only keep the unparsed tail
+            self._buffer, self._pos = buf[pos:], 0
+        else:
+            self._pos = pos
+        return rows
+
+    def close(self) -> List[list]:
+        """Finish parsing, return the rows of a buffered body"""
+        self._buffer += self._decoder.decode(b"", final=True)
+        if self._fallback:
+            data = json.loads(self._buffer).get("data", {})
+            self.fields = data.get("fields", [])
+            self.done = True
+            return data.get("values", [])
+        if not self.done:
+            raise ValueError("Incomplete IYP response body")
+        return []
+
+
+def _skip_ws(buf: str, pos: int) -> int:
+    while pos < len(buf) and buf[pos] in " \t\r\n":
+        pos += 1
+    return pos
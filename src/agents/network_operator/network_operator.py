@@ -1,39 +1,45 @@
 
 import json
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import SystemMessage, HumanMessage
 from langgraph.graph import START, StateGraph
 from langgraph.prebuilt import ToolNode, tools_condition
 from langgraph.graph.state import CompiledStateGraph
+from langgraph.utils.runnable import RunnableCallable
 
 from src.agents.utils.states import SplitThinkingAgentState, serialize_state
 from src.agents.network_operator.tools import NETWORKING_TOOLS
-from src.agents.utils.models import ModelParams
+from src.agents.utils.models import ModelParams, get_chat_model
+
+NETWORK_OPERATOR_PROMPT = SystemMessage(
+    content="""You are an Internet expert with many tool to get real-time information about the Internet. 
+Use tools if related to the user question.
+Use tools one at a time, and process the output of the previous tool before running a new one.
+If you dont need any more tool call, reply to the user in a professional tone.
+Reply to the user question only, no apologies and no follow-up questions"""
+)
+
 
 def get_network_operator_graph(debug=False, checkpointer=None, model_params=ModelParams()) -> CompiledStateGraph:
     """Return network_operator react agent"""
 
-    llm = ChatOpenAI(**model_params.model_dump()).bind_tools(
+    llm = get_chat_model(model_params).bind_tools(
         NETWORKING_TOOLS, parallel_tool_calls=False
     )
 
 
     def assistant(state: SplitThinkingAgentState):
-        print("state in network agent", state)
-        sys_msg = SystemMessage(
-            content="""You are an Internet expert with many tool to get real-time information about the Internet. 
-Use tools if related to the user question.
-Use tools one at a time, and process the output of the previous tool before running a new one.
-If you dont need any more tool call, reply to the user in a professional tone.
-Reply to the user question only, no apologies and no follow-up questions"""
-        )
-        response = llm.invoke([sys_msg] + state["messages"])
+        response = llm.invoke([NETWORK_OPERATOR_PROMPT] + state["messages"])
+
+        return {"messages": [response], "thoughts": [response]}
+
+    async def aassistant(state: SplitThinkingAgentState):
+        response = await llm.ainvoke([NETWORK_OPERATOR_PROMPT] + state["messages"])
 
         return {"messages": [response], "thoughts": [response]}
     
     builder = StateGraph(SplitThinkingAgentState)
     
-    builder.add_node("assistant", assistant)
+    builder.add_node("assistant", RunnableCallable(assistant, aassistant))
     builder.add_node("tools", ToolNode(NETWORKING_TOOLS))
 
     builder.add_edge(START, "assistant")
@@ -0,0 +1,197 @@
+import math
+import re
+import statistics
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+# traceroute to google.com (142.250.196.110), 30 hops max, 60 byte packets
+TRACEROUTE_HEADER_RE = re.compile(r"^traceroute to (?P<host>\S+) \((?P<ip>[^)]+)\)")
+# " 3  ae-1.r01.tokyjp05.jp.bb.gin.ntt.net (129.250.2.1)  1.234 ms *  1.301 ms"
+HOP_RE = re.compile(r"^\s*(?P<hop>\d+)\s+(?P<probes>.*)$")
+PROBE_RE = re.compile(
+    r"(?P<star>\*)"
+    r"|(?P<rtt>\d+(?:\.\d+)?)\s*ms(?:\s+!\S*)?"
+    r"|(?P<name>\S+)\s+\((?P<ip>[^)]+)\)"
+    r"|(?P<addr>[0-9a-fA-F.:]+)"
+)
+# PING google.com (142.250.196.110) 56(84) bytes of data.
+PING_HEADER_RE = re.compile(r"^PING (?P<host>\S+) \((?P<ip>[^)]+)\)")
+# 64 bytes from 142.250.196.110: icmp_seq=1 ttl=116 time=2.34 ms
+PING_REPLY_RE = re.compile(r"icmp_seq=(?P<seq>\d+) .*time[=<](?P<rtt>\d+(?:\.\d+)?) ms")
+# 4 packets transmitted, 4 received, 0% packet loss, time 3005ms
+PING_SUMMARY_RE = re.compile(r"^(?P<sent>\d+) packets transmitted")
+# `ip route show` keywords followed by a value, and the Route attribute they fill
+ROUTE_KEYS = {
+    "via": "gateway",
+    "dev": "device",
+    "proto": "protocol",
+    "scope": "scope",
+    "src": "source",
+    "metric": "metric",
+}
+# Keywords without value, e.g. "linkdown"
+ROUTE_FLAGS = {"onlink", "linkdown", "pervasive", "offload", "trap", "dead", "notify"}
+# Route types that may precede the destination, e.g. "unreachable 10.0.0.0/8"
+ROUTE_TYPES = {
+    "unicast", "local", "broadcast", "multicast", "throw",
+    "unreachable", "prohibit", "blackhole", "nat", "anycast",
+}
+
+
+@dataclass
+class TracerouteHop:
+    """One traceroute hop: the first router that answered, and one rtt per probe (None when lost)"""
+
+    hop: int
+    ip: Optional[str] = None
+    hostname: Optional[str] = None
+    rtts: List[Optional[float]] = field(default_factory=list)
+
+    @property
+    def silent(self) -> bool:
+        """No probe got an answer (`* * *`)"""
+        return self.ip is None
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+    def __str__(self) -> str:
+        if self.silent:
+            return f"{self.hop:>2}  " + " ".join("*" for _ in self.rtts)
+        where = self.ip if self.hostname in (None, self.ip) else f"{self.hostname} ({self.ip})"
+        rtts = "  ".join("*" if rtt is None else f"{rtt:.3f} ms" for rtt in self.rtts)
+        return f"{self.hop:>2}  {where}  {rtts}"
+
+
+@dataclass
+class PingStats:
+    """RTT statistics of the echo requests sent to one target, in milliseconds"""
+
+    target: str
+    address: Optional[str] = None
+    sent: int = 0
+    rtts: List[float] = field(default_factory=list)
+    error: Optional[str] = None
+
+    @property
+    def received(self) -> int:
+        return len(self.rtts)
+
+    @property
+    def loss(self) -> float:
+        """Lost share of the echo requests, in percent"""
+        return 100.0 * (self.sent - self.received) / self.sent if self.sent else 100.0
+
+    def to_dict(self) -> Dict:
+        stats = {
+            "target": self.target,
+            "address": self.address,
+            "sent": self.sent,
+            "received": self.received,
+            "loss": round(self.loss, 1),
+        }
+        if self.rtts:
+            mean = statistics.fmean(self.rtts)
+            stats.update(
+                min=round(min(self.rtts), 3),
+                avg=round(mean, 3),
+                max=round(max(self.rtts), 3),
+                # Same definition as iputils ping
+                mdev=round(math.sqrt(max(statistics.fmean(r * r for r in self.rtts) - mean * mean, 0.0)), 3),
+            )
+        if self.error:
+            stats["error"] = self.error
+        return stats
+
+
+def parse_ping(output: str, host: str) -> Optional[PingStats]:
+    """Parse iputils ping output, None when the host could not be pinged at all"""
+    stats = PingStats(host)
+    last_seq = 0
+    for line in output.splitlines():
+        if match := PING_HEADER_RE.match(line):
+            stats.address = match.group("ip")
+        elif match := PING_REPLY_RE.search(line):
+            stats.rtts.append(float(match.group("rtt")))
+            last_seq = max(last_seq, int(match.group("seq")))
+        elif match := PING_SUMMARY_RE.match(line):
+            stats.sent = int(match.group("sent"))
+    if stats.address is None:
+        return None
+    # No summary when ping was stopped, count the requests seen so far
+    stats.sent = stats.sent or max(last_seq, len(stats.rtts))
+    return stats
+
+
+@dataclass
+class Route:
+    """One line of `ip route show`"""
+
+    destination: str
+    type: Optional[str] = None
+    gateway: Optional[str] = None
+    device: Optional[str] = None
+    protocol: Optional[str] = None
+    scope: Optional[str] = None
+    source: Optional[str] = None
+    metric: Optional[int] = None
+    flags: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+def parse_route_line(line: str) -> Optional[Route]:
+    """Parse a line of `ip route show`, None for blank lines"""
+    tokens = line.split()
+    if not tokens:
+        return None
+    route_type = tokens.pop(0) if tokens[0] in ROUTE_TYPES and len(tokens) > 1 else None
+    route = Route(tokens[0], route_type)
+    i = 1
+    while i < len(tokens):
+        token = tokens[i]
+        if token in ROUTE_FLAGS:
+            route.flags.append(token)
+            i += 1
+        elif token in ROUTE_KEYS and i + 1 < len(tokens):
+            value = tokens[i + 1]
+            setattr(route, ROUTE_KEYS[token], int(value) if token == "metric" else value)
+            i += 2
+        else:
+            # Other attributes come in pairs too, e.g. "pref medium" or "mtu 1500"
+            i += 2
+    return route
+
+
+def parse_routes(output: str) -> List[Route]:
+    """Parse the output of `ip route show`"""
+    return [route for line in output.splitlines() if (route := parse_route_line(line))]
+
+
+def parse_traceroute_header(line: str) -> Optional[str]:
+    """Destination IP announced on the first traceroute line"""
+    match = TRACEROUTE_HEADER_RE.match(line)
+    return match.group("ip") if match else None
+
+
+def parse_traceroute_line(line: str) -> Optional[TracerouteHop]:
+    """Parse a hop line of Linux/BSD traceroute output, None for other lines"""
+    match = HOP_RE.match(line)
+    if match is None:
+        return None
+    hop = TracerouteHop(int(match.group("hop")))
+    for probe in PROBE_RE.finditer(match.group("probes")):
+        if probe.group("star"):
+            hop.rtts.append(None)
+        elif probe.group("rtt"):
+            hop.rtts.append(float(probe.group("rtt")))
+        elif hop.ip is None:
+            # Only the first responding router is kept
+            if probe.group("ip"):
+                hop.ip = probe.group("ip")
+                # traceroute prints the address twice when it has no name
+                hop.hostname = probe.group("name") if probe.group("name") != hop.ip else None
+            else:
+                hop.ip = probe.group("addr")
+    return hop
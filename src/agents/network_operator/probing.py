@@ -0,0 +1,339 @@
+import asyncio
+import itertools
+import os
+import socket
+import struct
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Union
+
+from src.agents.network_operator.parsers import PingStats, TracerouteHop
+
+ECHO_REQUEST = {socket.AF_INET: 8, socket.AF_INET6: 128}
+ECHO_REPLY = {socket.AF_INET: 0, socket.AF_INET6: 129}
+TIME_EXCEEDED = {socket.AF_INET: 11, socket.AF_INET6: 3}
+UNREACHABLE = {socket.AF_INET: 3, socket.AF_INET6: 1}
+HOPS_OPTION = {
+    socket.AF_INET: (socket.IPPROTO_IP, socket.IP_TTL),
+    socket.AF_INET6: (socket.IPPROTO_IPV6, socket.IPV6_UNICAST_HOPS),
+}
+# Linux extended errors, used by unprivileged sockets to report ICMP errors
+IP_RECVERR = getattr(socket, "IP_RECVERR", 11)
+IPV6_RECVERR = getattr(socket, "IPV6_RECVERR", 25)
+MSG_ERRQUEUE = getattr(socket, "MSG_ERRQUEUE", 0x2000)
+SOCK_EXTENDED_ERR = struct.Struct("=IBBBBII")
+
+DEFAULT_TIMEOUT = 1.0  # seconds before a probe is considered lost
+DEFAULT_INTERVAL = 0.2  # seconds between the echo requests sent to one target
+# TTLs probed at once by traceroute, as `traceroute -N`
+PARALLEL_HOPS = 8
+MAX_SILENT_HOPS = 5
+PAYLOAD = b"networking-agents-probe"
+
+
+class ProbeError(OSError):
+    """No ICMP socket could be opened, or a target could not be resolved"""
+
+
+def _checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b"\0"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+@dataclass
+class _Reply:
+    address: str
+    rtt: float
+    # Echo reply, rather than an ICMP error
+    echo: bool
+    # No further hop: echo reply, or destination unreachable
+    reached: bool
+
+
+class _ICMPSocket:
+    """One ICMP socket of an address family, with the probes waiting for an answer"""
+
+    def __init__(self, family: int, loop: asyncio.AbstractEventLoop):
+        self.family = family
+        self.loop = loop
+        proto = socket.IPPROTO_ICMP if family == socket.AF_INET else socket.IPPROTO_ICMPV6
+        try:
+            # Unprivileged "ping socket", allowed by net.ipv4.ping_group_range
+            self.sock = socket.socket(family, socket.SOCK_DGRAM, proto)
+            self.raw = False
+            level = socket.IPPROTO_IP if family == socket.AF_INET else socket.IPPROTO_IPV6
+            self.sock.setsockopt(level, IP_RECVERR if family == socket.AF_INET else IPV6_RECVERR, 1)
+        except PermissionError:
+            try:
+                self.sock = socket.socket(family, socket.SOCK_RAW, proto)
+            except PermissionError as e:
+                raise ProbeError(
+                    "ICMP sockets are not allowed: add the group to net.ipv4.ping_group_range "
+                    "or grant CAP_NET_RAW"
+                ) from e
+            self.raw = True
+        self.sock.setblocking(False)
+        # The kernel rewrites the identifier of ping sockets, only raw ones filter on it
+        self.ident = os.getpid() & 0xFFFF
+        self.pending: Dict[int, tuple[asyncio.Future, str, float]] = {}
+        self._seq = itertools.count(1)
+        loop.add_reader(self.sock.fileno(), self._on_readable)
+
+    def next_seq(self) -> int:
+        while True:
+            seq = next(self._seq) & 0xFFFF
+            if seq and seq not in self.pending:
+                return seq
+
+    def send(self, address: str, seq: int, ttl: Optional[int]) -> asyncio.Future:
+        future = self.loop.create_future()
+        header = struct.pack("!BBHHH", ECHO_REQUEST[self.family], 0, 0, self.ident, seq)
+        checksum = _checksum(header + PAYLOAD) if self.family == socket.AF_INET else 0
+        packet = struct.pack("!BBHHH", ECHO_REQUEST[self.family], 0, checksum, self.ident, seq) + PAYLOAD
+        level, option = HOPS_OPTION[self.family]
+        self.sock.setsockopt(level, option, ttl or 64)
+        self.pending[seq] = (future, address, time.perf_counter())
+        try:
+            self.sock.sendto(packet, (address, 0))
+        except OSError:
+            # A queued ICMP error of an earlier probe fails the next call on ping sockets
+            self._read_errors()
+            try:
+                self.sock.sendto(packet, (address, 0))
+            except OSError as e:
+                del self.pending[seq]
+                future.set_exception(e)
+        return future
+
+    def _resolve(self, seq: int, responder: str, echo: bool, unreachable: bool = False) -> None:
+        entry = self.pending.pop(seq, None)
+        if entry is None:
+            return
+        future, address, sent_at = entry
+        if not future.done():
+            rtt = (time.perf_counter() - sent_at) * 1000
+            future.set_result(_Reply(responder, rtt, echo, echo or unreachable or responder == address))
+
+    def _on_readable(self) -> None:
+        while True:
+            try:
+                data, source = self.sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                # Pending ICMP error of a ping socket, read below
+                break
+            self._on_packet(data, source[0])
+        if not self.raw:
+            self._read_errors()
+
+    def _on_packet(self, data: bytes, source: str) -> None:
+        if self.raw and self.family == socket.AF_INET:
+            # Raw IPv4 sockets receive the IP header
+            data = data[(data[0] & 0x0F) * 4:]
+        if len(data) < 8:
+            return
+        icmp_type, _, _, ident, seq = struct.unpack("!BBHHH", data[:8])
+        if icmp_type == ECHO_REPLY[self.family]:
+            if not self.raw or ident == self.ident:
+                self._resolve(seq, source, echo=True)
+        elif self.raw and icmp_type in (TIME_EXCEEDED[self.family], UNREACHABLE[self.family]):
+            # The error quotes the IP header and first 8 bytes of our echo request
+            inner = data[8:]
+            if self.family == socket.AF_INET:
+                inner = inner[(inner[0] & 0x0F) * 4:] if inner else inner
+            else:
+                inner = inner[40:]
+            if len(inner) < 8:
+                return
+            inner_type, _, _, ident, seq = struct.unpack("!BBHHH", inner[:8])
+            if inner_type == ECHO_REQUEST[self.family] and ident == self.ident:
+                self._resolve(seq, source, echo=False, unreachable=icmp_type == UNREACHABLE[self.family])
+
+    def _read_errors(self) -> None:
+        """ICMP errors of ping sockets come through the socket error queue"""
+        while True:
+            try:
+                data, ancdata, _, _ = self.sock.recvmsg(2048, 512, MSG_ERRQUEUE)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            if len(data) < 8:
+                continue
+            seq = struct.unpack("!H", data[6:8])[0]
+            for _, _, cmsg in ancdata:
+                if len(cmsg) < SOCK_EXTENDED_ERR.size:
+                    continue
+                _, origin, icmp_type, _, _, _, _ = SOCK_EXTENDED_ERR.unpack_from(cmsg)
+                offender = cmsg[SOCK_EXTENDED_ERR.size:]
+                if self.family == socket.AF_INET and len(offender) >= 8:
+                    responder = socket.inet_ntop(socket.AF_INET, offender[4:8])
+                elif self.family == socket.AF_INET6 and len(offender) >= 24:
+                    responder = socket.inet_ntop(socket.AF_INET6, offender[8:24])
+                else:
+                    continue
+                self._resolve(seq, responder, echo=False, unreachable=icmp_type == UNREACHABLE[self.family])
+
+    def close(self) -> None:
+        self.loop.remove_reader(self.sock.fileno())
+        self.sock.close()
+        for future, _, _ in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+
+
+class ICMPProber:
+    """
+    Send ICMP echo requests to many targets from one asyncio loop.
+
+    Uses unprivileged ICMP datagram sockets when `net.ipv4.ping_group_range`
+    allows it, raw sockets otherwise (root or CAP_NET_RAW). Replies are matched
+    to probes by sequence number (and identifier on raw sockets). Only sockets
+    are involved, so it runs unchanged inside a network namespace
+    (`ip netns exec <ns> python ...`).
+
+    Use as `async with ICMPProber() as prober: ...`.
+    """
+
+    def __init__(self):
+        self._sockets: Dict[int, _ICMPSocket] = {}
+
+    async def __aenter__(self) -> "ICMPProber":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.close()
+
+    def _socket(self, family: int) -> _ICMPSocket:
+        if family not in self._sockets:
+            self._sockets[family] = _ICMPSocket(family, asyncio.get_running_loop())
+        return self._sockets[family]
+
+    async def resolve(self, target: str) -> tuple[int, str]:
+        """Return (family, address) of a host name or IP"""
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(target, None, type=socket.SOCK_DGRAM)
+        except socket.gaierror as e:
+            raise ProbeError(f"Cannot resolve {target}: {e}") from e
+        family, _, _, _, sockaddr = infos[0]
+        return family, sockaddr[0]
+
+    async def probe(
+        self, family: int, address: str, ttl: Optional[int] = None, timeout: float = DEFAULT_TIMEOUT
+    ) -> Optional[_Reply]:
+        """Send one echo request, return the reply, or None when it is lost"""
+        sock = self._socket(family)
+        seq = sock.next_seq()
+        future = sock.send(address, seq, ttl)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            sock.pending.pop(seq, None)
+
+    async def ping(
+        self,
+        target: str,
+        count: int = 4,
+        interval: float = DEFAULT_INTERVAL,
+        timeout: float = DEFAULT_TIMEOUT,
+    ) -> PingStats:
+        stats = PingStats(target)
+        try:
+            family, stats.address = await self.resolve(target)
+            probes = []
+            for i in range(count):
+                if i:
+                    await asyncio.sleep(interval)
+                probes.append(asyncio.ensure_future(self.probe(family, stats.address, timeout=timeout)))
+                stats.sent += 1
+            for reply in await asyncio.gather(*probes):
+                if reply is not None and reply.echo:
+                    stats.rtts.append(reply.rtt)
+        except OSError as e:
+            stats.error = str(e)
+        return stats
+
+    async def traceroute(
+        self,
+        target: str,
+        max_hops: int = 30,
+        probes: int = 3,
+        timeout: float = DEFAULT_TIMEOUT,
+        max_silent_hops: int = MAX_SILENT_HOPS,
+    ) -> List[TracerouteHop]:
+        """
+        Probe `PARALLEL_HOPS` TTLs at a time, up to the first hop answering from the target.
+
+        Raises:
+            ProbeError: If the target cannot be resolved or no ICMP socket can be opened.
+        """
+        family, address = await self.resolve(target)
+        hops: List[TracerouteHop] = []
+        silent = 0
+        for first in range(1, max_hops + 1, PARALLEL_HOPS):
+            ttls = range(first, min(first + PARALLEL_HOPS, max_hops + 1))
+            replies = await asyncio.gather(
+                *(self.probe(family, address, ttl, timeout) for ttl in ttls for _ in range(probes))
+            )
+            for i, ttl in enumerate(ttls):
+                hop_replies = replies[i * probes:(i + 1) * probes]
+                hop = TracerouteHop(ttl)
+                for reply in hop_replies:
+                    hop.rtts.append(None if reply is None else round(reply.rtt, 3))
+                    if reply is not None and hop.ip is None:
+                        hop.ip = reply.address
+                hops.append(hop)
+                silent = silent + 1 if hop.silent else 0
+                if any(reply is not None and reply.reached for reply in hop_replies) or silent >= max_silent_hops:
+                    return hops
+        return hops
+
+    def close(self) -> None:
+        for sock in self._sockets.values():
+            sock.close()
+        self._sockets.clear()
+
+
+async def ping_many(
+    targets: List[str],
+    count: int = 4,
+    interval: float = DEFAULT_INTERVAL,
+    timeout: float = DEFAULT_TIMEOUT,
+) -> List[PingStats]:
+    """Ping every target concurrently, return one PingStats per target, in order"""
+    async with ICMPProber() as prober:
+        return await asyncio.gather(
+            *(prober.ping(target, count, interval, timeout) for target in targets)
+        )
+
+
+async def traceroute_many(
+    targets: List[str],
+    max_hops: int = 30,
+    probes: int = 3,
+    timeout: float = DEFAULT_TIMEOUT,
+    max_silent_hops: int = MAX_SILENT_HOPS,
+) -> Dict[str, Union[List[TracerouteHop], ProbeError]]:
+    """Trace every target concurrently, map each target to its hops, or to the error that stopped it"""
+    async with ICMPProber() as prober:
+        routes = await asyncio.gather(
+            *(prober.traceroute(target, max_hops, probes, timeout, max_silent_hops) for target in targets),
+            return_exceptions=True,
+        )
+    for route in routes:
+        if isinstance(route, BaseException) and not isinstance(route, ProbeError):
+            raise route
+    return dict(zip(targets, routes))
+
+
+if __name__ == "__main__":
+    for stats in asyncio.run(ping_many(["127.0.0.1", "127.0.0.2", "::1"])):
+        print(stats.to_dict())
+    print(asyncio.run(traceroute_many(["127.0.0.1"])))
@@ -1,10 +1,39 @@
+import asyncio
 import datetime
+import json
 import re
-import requests
-import subprocess
+import socket
+from typing import Optional
 
+import requests
 from geopy.geocoders import Nominatim
 from langchain_core.tools import tool
+from langgraph.config import get_stream_writer
+
+from src.agents.network_operator.parsers import (
+    TracerouteHop,
+    parse_ping,
+    parse_routes,
+    parse_traceroute_header,
+    parse_traceroute_line,
+)
+from src.agents.network_operator.probing import MAX_SILENT_HOPS, ProbeError
+from src.agents.network_operator.probing import ping_many as _probe_ping_many
+from src.agents.network_operator.probing import traceroute_many as _probe_traceroute_many
+from src.agents.utils.asn_index import get_asn_index
+from src.agents.utils.commands import (
+    ACommandLines,
+    CommandLines,
+    CommandResult,
+    arun_command,
+    run_command,
+)
+from src.agents.utils.formats import tool_output
+
+# Wall-clock seconds before a command is stopped, its partial output is returned
+PING_TIMEOUT = 30
+TRACEROUTE_TIMEOUT = 90
+ROUTING_TABLE_TIMEOUT = 10
 
 
 def extract_tool(content: str):
@@ -41,8 +70,8 @@ def get_current_weather(city: str):
     lat_lng = f"latitude={latitude}&longitude={longitude}"
     url = f"https://api.open-meteo.com/v1/forecast?{lat_lng}&current=temperature_2m,wind_speed_10m&hourly=temperature_2m,relative_humidity_2m,wind_speed_10m"
     response = requests.get(url)
-    json = response.json()
-    return f"<tool>{json['current']}</tool>"
+    current = response.json()["current"]
+    return tool_output([current], raw=str(current))
 
 
 @tool(parse_docstring=True)
@@ -68,37 +97,158 @@ def ping(host: str, count: int = 4) -> str:
         count (int, optional): Number of echo requests to send. Defaults to 4.
 
     Returns:
-        str: The raw output from the ping command.
+        str: The ping statistics: packets sent and received, loss in percent and min/avg/max/mdev round-trip times in ms.
+    """
+    result = run_command(["ping", "-c", str(count), host], timeout=PING_TIMEOUT, host=host)
+    return _ping_output(host, result)
+
+
+async def _aping(host: str, count: int = 4) -> str:
+    result = await arun_command(["ping", "-c", str(count), host], timeout=PING_TIMEOUT, host=host)
+    return _ping_output(host, result)
+
+
+def _ping_output(host: str, result: CommandResult) -> str:
+    stats = parse_ping(result.stdout, host)
+    if stats is None:
+        # e.g. unknown host, the error message is the answer
+        return f"<tool>{result.output}</tool>"
+    note = f"Command stopped after {PING_TIMEOUT:g}s, the statistics are partial" if result.timed_out else None
+    return tool_output([stats.to_dict()], raw=result.output, note=note)
+
+
+# Used by ainvoke, instead of running the sync tool in a thread
+ping.coroutine = _aping
+
+
+class TracerouteProgress:
+    """
+    Parse traceroute lines as they are printed and decide when to stop early.
+
+    The run stops once a hop answers from the destination address, or after
+    `max_silent_hops` consecutive `* * *` hops.
     """
-    result = subprocess.run(
-        ["ping", "-c", str(count), host],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-    )
-    res = result.stdout if result.returncode == 0 else result.stderr
-    return f"<tool>{res}</tool>"
+
+    def __init__(self, host: str, targets: set[str], max_silent_hops: int):
+        self.host = host
+        self.targets = targets
+        self.max_silent_hops = max_silent_hops
+        self.lines: list[str] = []
+        self.hops: list[TracerouteHop] = []
+        self.stop_reason: Optional[str] = None
+        self._silent = 0
+
+    def feed(self, line: str) -> Optional[TracerouteHop]:
+        """Consume a line, return the hop it describes if any"""
+        self.lines.append(line)
+        header_ip = parse_traceroute_header(line)
+        if header_ip:
+            self.targets.add(header_ip)
+        hop = parse_traceroute_line(line)
+        if hop is None:
+            return None
+        self.hops.append(hop)
+        self._silent = self._silent + 1 if hop.silent else 0
+        if hop.ip in self.targets:
+            self.stop_reason = "destination reached"
+        elif self._silent >= self.max_silent_hops:
+            self.stop_reason = f"{self._silent} consecutive hops without answer"
+        return hop
+
+    def event(self, hop: TracerouteHop) -> dict:
+        """Custom stream event pushed to the UI for each hop"""
+        return {"tool": "traceroute", "host": self.host, "hop": hop.to_dict(), "line": str(hop)}
+
+    def output(self, timed_out: bool) -> str:
+        if self.stop_reason:
+            note = f"Stopped early: {self.stop_reason}"
+        elif timed_out:
+            note = f"Command stopped after {TRACEROUTE_TIMEOUT:g}s, the output above is partial"
+        else:
+            note = None
+        raw = "\n".join(self.lines) + (f"\n[{note}]" if note else "")
+        if not self.hops:
+            # e.g. unknown host, the error message is the answer
+            return f"<tool>{raw}</tool>"
+        return tool_output(with_asns([hop.to_dict() for hop in self.hops]), raw=raw, note=note)
+
+
+def with_asns(records: list[dict]) -> list[dict]:
+    """Add the origin ASN of each record's "ip" from the local routing table, when there is one"""
+    index = get_asn_index()
+    if index is None:
+        return records
+    matches = index.lookup_many([record.get("ip") or "" for record in records])
+    for record, match in zip(records, matches):
+        if match is not None:
+            record["asn"] = match.asn
+    return records
+
+
+def _resolve(host: str) -> set[str]:
+    try:
+        return {info[4][0] for info in socket.getaddrinfo(host, None)}
+    except socket.gaierror:
+        return set()
+
+
+async def _aresolve(host: str) -> set[str]:
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, None)
+    except socket.gaierror:
+        return set()
+    return {info[4][0] for info in infos}
+
+
+def _stream_writer():
+    """LangGraph custom stream writer, a no-op outside of a graph run"""
+    try:
+        return get_stream_writer()
+    except RuntimeError:
+        return lambda chunk: None
 
 
 @tool(parse_docstring=True)
-def traceroute(host: str, max_hops: int = 30) -> str:
+def traceroute(host: str, max_hops: int = 30, max_silent_hops: int = MAX_SILENT_HOPS) -> str:
     """
     Traces the route packets take to reach the specified host.
 
     Args:
         host (str): The destination host or IP address.
         max_hops (int, optional): Maximum number of hops to probe. Defaults to 30.
+        max_silent_hops (int, optional): Stop after this many consecutive hops without answer. Defaults to 5.
 
     Returns:
-        str: The raw output from the traceroute command, i.e. a list of ips and hostnames with the latency and hop number.
+        str: One line per hop with the hop number, the ip and hostname of the router that answered, and the latency of each probe in ms (* when lost), plus the origin ASN of the ip when a local routing table is available.
     """
-    result = subprocess.run(
-        ["traceroute", "-m", str(max_hops), host],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-    )
-    return result.stdout if result.returncode == 0 else result.stderr
+    writer = _stream_writer()
+    progress = TracerouteProgress(host, _resolve(host), max_silent_hops)
+    args = ["traceroute", "-m", str(max_hops), host]
+    with CommandLines(args, timeout=TRACEROUTE_TIMEOUT, host=host) as lines:
+        for line in lines:
+            hop = progress.feed(line)
+            if hop is not None:
+                writer(progress.event(hop))
+            if progress.stop_reason:
+                break
+    return progress.output(lines.timed_out)
+
+
+async def _atraceroute(host: str, max_hops: int = 30, max_silent_hops: int = MAX_SILENT_HOPS) -> str:
+    writer = _stream_writer()
+    progress = TracerouteProgress(host, await _aresolve(host), max_silent_hops)
+    args = ["traceroute", "-m", str(max_hops), host]
+    async with ACommandLines(args, timeout=TRACEROUTE_TIMEOUT, host=host) as lines:
+        async for line in lines:
+            hop = progress.feed(line)
+            if hop is not None:
+                writer(progress.event(hop))
+            if progress.stop_reason:
+                break
+    return progress.output(lines.timed_out)
+
+
+traceroute.coroutine = _atraceroute
 
 
 @tool(parse_docstring=True)
@@ -107,30 +257,96 @@ def get_routing_table():
     Retrieves the current IP routing table of the system. Useful to get the router ip.
 
     This function executes the `ip route show` command using the subprocess module
-    to query the system's routing table. The output is returned as a decoded string.
+    to query the system's routing table, and returns one record per route.
 
     Returns:
-        str: A string containing the routing table as output by the `ip route show` command.
+        str: One line per route with its destination, gateway, device, protocol, scope, source address and metric.
 
     Raises:
         subprocess.CalledProcessError: If the `ip route` command fails to execute.
         FileNotFoundError: If the `ip` command is not found on the system.
     """
-    result = subprocess.run(
-        ["ip", "route", "show"],
-        check=True,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-    )
-    res = result.stdout if result.returncode == 0 else result.stderr
-    return f"<tool>{res}</tool>"
+    result = run_command(["ip", "route", "show"], check=True, timeout=ROUTING_TABLE_TIMEOUT)
+    return _routing_table_output(result)
+
+
+async def _aget_routing_table() -> str:
+    result = await arun_command(["ip", "route", "show"], check=True, timeout=ROUTING_TABLE_TIMEOUT)
+    return _routing_table_output(result)
+
+
+def _routing_table_output(result: CommandResult) -> str:
+    routes = [route.to_dict() for route in parse_routes(result.output)]
+    return tool_output(routes, raw=result.output)
+
+
+get_routing_table.coroutine = _aget_routing_table
+
+
+@tool(parse_docstring=True)
+def ping_many(hosts: list[str], count: int = 4) -> str:
+    """
+    Pings several hosts at once, from the agent process, and summarises the round-trip times.
+
+    Args:
+        hosts (list[str]): The target hosts or IP addresses (e.g., ["google.com", "8.8.8.8"]).
+        count (int, optional): Number of echo requests sent to each host. Defaults to 4.
+
+    Returns:
+        str: One line per host with the packets sent and received, the loss in percent and the min/avg/max/mdev round-trip times in ms.
+    """
+    return asyncio.run(_aping_many(hosts, count))
+
+
+async def _aping_many(hosts: list[str], count: int = 4) -> str:
+    results = await _probe_ping_many(hosts, count)
+    records = [stats.to_dict() for stats in results]
+    return tool_output(records, raw=json.dumps(records))
+
+
+ping_many.coroutine = _aping_many
+
+
+@tool(parse_docstring=True)
+def traceroute_many(hosts: list[str], max_hops: int = 30) -> str:
+    """
+    Traces the routes to several hosts at once, from the agent process.
+
+    Args:
+        hosts (list[str]): The destination hosts or IP addresses.
+        max_hops (int, optional): Maximum number of hops to probe. Defaults to 30.
+
+    Returns:
+        str: One line per host and hop with the responding ip and the latency of each probe in ms (* when lost), plus its origin ASN when a local routing table is available.
+    """
+    return asyncio.run(_atraceroute_many(hosts, max_hops))
+
+
+async def _atraceroute_many(hosts: list[str], max_hops: int = 30) -> str:
+    routes = await _probe_traceroute_many(hosts, max_hops)
+    writer = _stream_writer()
+    records, sections = [], []
+    for host, hops in routes.items():
+        if isinstance(hops, ProbeError):
+            records.append({"target": host, "error": str(hops)})
+            sections.append(f"traceroute to {host}\n{hops}")
+            continue
+        for hop in hops:
+            writer({"tool": "traceroute_many", "host": host, "hop": hop.to_dict(), "line": str(hop)})
+            records.append({"target": host, **hop.to_dict()})
+        sections.append(f"traceroute to {host}\n" + "\n".join(str(hop) for hop in hops))
+    return tool_output(with_asns(records), raw="\n\n".join(sections))
+
+
+traceroute_many.coroutine = _atraceroute_many
 
 NETWORKING_TOOLS = [
     get_current_time,
     ping,
     get_routing_table,
     traceroute,
+    ping_many,
+    traceroute_many,
 ]
 
 if __name__ == "__main__":
@@ -2,8 +2,8 @@ import json
 from typing_extensions import Annotated
 from langgraph.graph import StateGraph, START, END
 from langchain_core.messages import SystemMessage, HumanMessage, ToolMessage
-from langchain_openai import ChatOpenAI
 from langgraph.graph.state import CompiledStateGraph
+from langgraph.utils.runnable import RunnableCallable
 from langchain_core.tools import tool, InjectedToolCallId
 from langgraph.prebuilt import ToolNode, tools_condition
 from langgraph.prebuilt import InjectedState
@@ -16,7 +16,8 @@ from src.agents.utils.states import (
     SplitThinkingAgentState,
     serialize_state,
 )
-from src.agents.utils.models import ModelParams
+from src.agents.utils.models import ModelParams, get_chat_model
+from src.agents.utils.graphs import shared_graph
 
 METADATA_KEY_HANDOFF_DESTINATION = "__handoff_destination"
 METADATA_KEY_IS_HANDOFF_BACK = "__is_handoff_back"
@@ -99,18 +100,23 @@ def get_supervisor_graph(debug=False, checkpointer=None, model_params=ModelParam
 
     supervisor_tools = [assign_to_data_retriever, assign_to_network_operator]
     
-    llm = ChatOpenAI(
-        **model_params.model_dump()).bind_tools(supervisor_tools, parallel_tool_calls=False)
+    llm = get_chat_model(model_params).bind_tools(supervisor_tools, parallel_tool_calls=False)
 
     def assistant(state: SplitThinkingAgentState):
         sysprompt = SystemMessage(supervisor_prompt)
         response = llm.invoke([sysprompt] + state["messages"])
 
         return {"messages": [response], "thoughts": [response]}
+
+    async def aassistant(state: SplitThinkingAgentState):
+        sysprompt = SystemMessage(supervisor_prompt)
+        response = await llm.ainvoke([sysprompt] + state["messages"])
+
+        return {"messages": [response], "thoughts": [response]}
     
     # Define react supervisor
     builder = StateGraph(SplitThinkingAgentState)
-    builder.add_node("assistant", assistant)
+    builder.add_node("assistant", RunnableCallable(assistant, aassistant))
     builder.add_node("tools", ToolNode(supervisor_tools))
     builder.add_edge(START, "assistant")
     builder.add_conditional_edges(
@@ -122,24 +128,27 @@ def get_supervisor_graph(debug=False, checkpointer=None, model_params=ModelParam
     builder.add_edge("tools", "assistant")
     supervisor_agent = builder.compile(debug=debug, name="supervisor_agent")
     
-    data_retriever = get_data_retriever_graph(model_params=model_params)
-    network_operator = get_network_operator_graph(model_params=model_params)
+    data_retriever = shared_graph(get_data_retriever_graph, model_params)
+    network_operator = shared_graph(get_network_operator_graph, model_params)
     
-    def call_data_retriever(state: SplitThinkingAgentState):
+    def handoff_back(agent_name: str, response: dict) -> dict:
         """wrapper for custom return values"""
-        response = data_retriever.invoke(state)
         reply = [response["messages"][-1]]
-        handoff = create_handoff_back_messages("data_retriever", "supervisor_agent")
+        handoff = create_handoff_back_messages(agent_name, "supervisor_agent")
         reply.extend(handoff)
         return {"messages": reply, "thoughts": response["thoughts"]}
 
+    def call_data_retriever(state: SplitThinkingAgentState):
+        return handoff_back("data_retriever", data_retriever.invoke(state))
+
+    async def acall_data_retriever(state: SplitThinkingAgentState):
+        return handoff_back("data_retriever", await data_retriever.ainvoke(state))
+
     def call_network_operator(state: SplitThinkingAgentState):
-        """wrapper for custom return values"""
-        response = network_operator.invoke(state)
-        reply = [response["messages"][-1]]
-        handoff = create_handoff_back_messages("network_operator", "supervisor_agent")
-        reply.extend(handoff)
-        return {"messages": reply, "thoughts": response["thoughts"]}
+        return handoff_back("network_operator", network_operator.invoke(state))
+
+    async def acall_network_operator(state: SplitThinkingAgentState):
+        return handoff_back("network_operator", await network_operator.ainvoke(state))
 
     # Define the multi-agent supervisor graph
     supervisor = (
@@ -148,8 +157,8 @@ def get_supervisor_graph(debug=False, checkpointer=None, model_params=ModelParam
         .add_node(
             supervisor_agent, destinations=("data_retriever", "network_operator", END)
         )
-        .add_node("data_retriever", call_data_retriever)
-        .add_node("network_operator", call_network_operator)
+        .add_node("data_retriever", RunnableCallable(call_data_retriever, acall_data_retriever))
+        .add_node("network_operator", RunnableCallable(call_network_operator, acall_network_operator))
         .add_edge(START, "supervisor_agent")
         # always return back to the supervisor
         .add_edge("data_retriever", "supervisor_agent")
@@ -0,0 +1,262 @@
+import gzip
+import hashlib
+import json
+import os
+import socket
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+# Bump when the on-disk layout changes
+INDEX_VERSION = 1
+# CAIDA RouteViews prefix2as dump ("1.0.0.0<TAB>24<TAB>13335"), plain or gzipped
+PFX2AS_PATH = "data/routeviews.pfx2as.gz"
+# Where the arrays built from it are persisted, one .npy per array
+DEFAULT_INDEX_DIR = "data/asn_index"
+# IPv6 is indexed on its upper 64 bits, longer prefixes are not globally routed
+IPV6_BITS = 64
+FAMILIES = {4: 32, 6: IPV6_BITS}
+ARRAYS = ("starts", "ranges", "networks", "lengths", "asns")
+
+
+@dataclass
+class PrefixMatch:
+    """Most specific announced prefix covering an IP, and its origin AS"""
+
+    ip: str
+    prefix: str
+    asn: int
+
+    def to_dict(self) -> Dict:
+        return {"ip": self.ip, "prefix": self.prefix, "asn": self.asn}
+
+
+def _key(version: int, address: bytes) -> int:
+    value = int.from_bytes(address, "big")
+    return value if version == 4 else value >> (128 - IPV6_BITS)
+
+
+def ip_key(ip: str) -> tuple[int, int]:
+    """(IP version, integer the index is keyed on)"""
+    if ":" in ip:
+        return 6, _key(6, socket.inet_pton(socket.AF_INET6, ip))
+    return 4, _key(4, socket.inet_aton(ip))
+
+
+def _prefix(version: int, network: int, length: int) -> str:
+    """Prefix text of an index entry, much cheaper than building ipaddress networks"""
+    if version == 4:
+        return f"{socket.inet_ntoa(network.to_bytes(4, 'big'))}/{length}"
+    address = socket.inet_ntop(socket.AF_INET6, (network << (128 - IPV6_BITS)).to_bytes(16, "big"))
+    return f"{address}/{length}"
+
+
+def parse_pfx2as(lines: Iterable[str]) -> Dict[int, List[tuple[int, int, int]]]:
+    """(network key, prefix length, first origin ASN) per IP version"""
+    prefixes: Dict[int, List[tuple[int, int, int]]] = {4: [], 6: []}
+    for line in lines:
+        parts = line.split()
+        if len(parts) != 3:
+            continue
+        network, length, origins = parts[0], int(parts[1]), parts[2]
+        version, key = ip_key(network)
+        if length > FAMILIES[version]:
+            continue
+        # Multi-origin prefixes are "a_b", AS sets "a,b": keep the first origin
+        asn = int(origins.replace(",", "_").split("_")[0])
+        prefixes[version].append((key, length, asn))
+    return prefixes
+
+
+def flatten(prefixes: List[tuple[int, int, int]], bits: int) -> Dict[str, np.ndarray]:
+    """
+    Leaf-push nested prefixes into disjoint address ranges.
+
+    Every IP of `[starts[i], starts[i + 1])` matches prefix `ranges[i]` (-1 for
+    no route), so a longest-prefix match is one binary search, also vectorized.
+    """
+    prefixes = sorted(set(prefixes), key=lambda p: (p[0], p[1]))
+    starts: List[int] = []
+    ranges: List[int] = []
+
+    def emit(start: int, index: int) -> None:
+        if start >= 1 << bits:
+            return
+        if starts and starts[-1] == start:
+            ranges[-1] = index
+            if len(ranges) > 1 and ranges[-2] == index:
+                starts.pop()
+                ranges.pop()
+        elif not ranges or ranges[-1] != index:
+            starts.append(start)
+            ranges.append(index)
+
+    emit(0, -1)
+    stack: List[tuple[int, int]] = []  # (end, prefix index) of the enclosing prefixes
+    for index, (network, length, _) in enumerate(prefixes):
+        while stack and stack[-1][0] <= network:
+            end, _ = stack.pop()
+            emit(end, stack[-1][1] if stack else -1)
+        emit(network, index)
+        stack.append((network + (1 << (bits - length)), index))
+    while stack:
+        end, _ = stack.pop()
+        emit(end, stack[-1][1] if stack else -1)
+
+    return {
+        "starts": np.array(starts, dtype=np.uint64),
+        "ranges": np.array(ranges, dtype=np.int32),
+        "networks": np.array([p[0] for p in prefixes], dtype=np.uint64),
+        "lengths": np.array([p[1] for p in prefixes], dtype=np.uint8),
+        "asns": np.array([p[2] for p in prefixes], dtype=np.uint32),
+    }
+
+
+def fingerprint(path: str) -> str:
+    """Hash of the dump content and the index layout"""
+    digest = hashlib.sha256(f"{INDEX_VERSION}".encode())
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ASNIndex:
+    """Longest-prefix match IP -> (prefix, origin ASN), from a pfx2as dump.
+
+    The IPv4 and IPv6 tables are flattened into sorted range arrays, persisted
+    as `.npy` files and memory-mapped, so opening an index already built from
+    the same dump costs a few milliseconds whatever its size.
+
+    Args:
+        path: pfx2as dump, plain or gzipped.
+        index_dir: Directory of the `.npy` arrays and their `.json` metadata.
+    """
+
+    def __init__(self, path: str = PFX2AS_PATH, index_dir: str = DEFAULT_INDEX_DIR):
+        self.path = path
+        self.index_dir = index_dir
+        self.meta_path = os.path.join(index_dir, "meta.json")
+        self.fingerprint = fingerprint(path)
+        self.rebuilt = False
+        self.tables: Dict[int, Dict[str, np.ndarray]] = {}
+
+        if not self._load():
+            self._build()
+            self.rebuilt = True
+
+    def _array_path(self, version: int, name: str) -> str:
+        return os.path.join(self.index_dir, f"v{version}_{name}.npy")
+
+    def _load(self) -> bool:
+        try:
+            with open(self.meta_path) as f:
+                if json.load(f).get("fingerprint") != self.fingerprint:
+                    return False
+            self.tables = {
+                version: {name: np.load(self._array_path(version, name), mmap_mode="r") for name in ARRAYS}
+                for version in FAMILIES
+            }
+        except (OSError, ValueError):
+            return False
+        return True
+
+    def _build(self) -> None:
+        opener = gzip.open if self.path.endswith(".gz") else open
+        with opener(self.path, "rt") as f:
+            prefixes = parse_pfx2as(f)
+        os.makedirs(self.index_dir, exist_ok=True)
+        # Write then rename, so concurrent readers never map a partial file
+        for version, bits in FAMILIES.items():
+            for name, array in flatten(prefixes[version], bits).items():
+                tmp = f"{self._array_path(version, name)}.{os.getpid()}.tmp.npy"
+                np.save(tmp, array)
+                os.replace(tmp, self._array_path(version, name))
+        tmp_meta = f"{self.meta_path}.{os.getpid()}.tmp"
+        with open(tmp_meta, "w") as f:
+            json.dump({"fingerprint": self.fingerprint}, f)
+        os.replace(tmp_meta, self.meta_path)
+        self._load()
+
+    def __len__(self) -> int:
+        return sum(len(table["asns"]) for table in self.tables.values())
+
+    def match_keys(self, version: int, keys: np.ndarray) -> np.ndarray:
+        """Prefix indexes matching an array of integer keys (see `ip_key`), -1 when unrouted"""
+        table = self.tables[version]
+        if len(keys) == 0 or len(table["asns"]) == 0:
+            return np.full(len(keys), -1, dtype=np.int32)
+        positions = np.searchsorted(table["starts"], keys.astype(np.uint64), side="right") - 1
+        return table["ranges"][positions]
+
+    def _matches(self, ips: List[str], version: int, keys: List[int]) -> List[Optional[PrefixMatch]]:
+        indexes = self.match_keys(version, np.array(keys, dtype=np.uint64))
+        routed = indexes >= 0
+        table = self.tables[version]
+        networks = table["networks"][indexes[routed]].tolist()
+        lengths = table["lengths"][indexes[routed]].tolist()
+        asns = table["asns"][indexes[routed]].tolist()
+        results: List[Optional[PrefixMatch]] = [None] * len(ips)
+        for position, network, length, asn in zip(np.flatnonzero(routed).tolist(), networks, lengths, asns):
+            results[position] = PrefixMatch(ips[position], _prefix(version, network, length), asn)
+        return results
+
+    def lookup(self, ip: str) -> Optional[PrefixMatch]:
+        """
+        Most specific prefix covering `ip`, None when it is not routed.
+
+        Raises:
+            OSError: If `ip` is not an IP address.
+        """
+        version, key = ip_key(ip)
+        table = self.tables[version]
+        if len(table["asns"]) == 0:
+            return None
+        # A numpy scalar key avoids a slow conversion of the whole array
+        index = int(table["ranges"][table["starts"].searchsorted(np.uint64(key), side="right") - 1])
+        if index < 0:
+            return None
+        network, length = int(table["networks"][index]), int(table["lengths"][index])
+        return PrefixMatch(ip, _prefix(version, network, length), int(table["asns"][index]))
+
+    def lookup_many(self, ips: List[str]) -> List[Optional[PrefixMatch]]:
+        """`lookup` of many IPs, with one vectorized search per IP version. Invalid IPs give None."""
+        positions: Dict[int, List[int]] = {4: [], 6: []}
+        keys: Dict[int, List[int]] = {4: [], 6: []}
+        for position, ip in enumerate(ips):
+            try:
+                version, key = ip_key(ip)
+            except OSError:
+                continue
+            positions[version].append(position)
+            keys[version].append(key)
+        results: List[Optional[PrefixMatch]] = [None] * len(ips)
+        for version in FAMILIES:
+            version_ips = [ips[position] for position in positions[version]]
+            for position, match in zip(positions[version], self._matches(version_ips, version, keys[version])):
+                results[position] = match
+        return results
+
+
+_default_index: Optional[ASNIndex] = None
+_default_index_lock = threading.Lock()
+
+
+def get_asn_index() -> Optional[ASNIndex]:
+    """Return the process-wide index of `PFX2AS_PATH`, None when the dump is not there"""
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None and os.path.exists(PFX2AS_PATH):
+            _default_index = ASNIndex()
+        return _default_index
+
+
+if __name__ == "__main__":
+    index = get_asn_index()
+    if index is None:
+        print(f"Download a RouteViews pfx2as dump from https://www.caida.org/catalog/datasets/routeviews-prefix2as/ to {PFX2AS_PATH}")
+    else:
+        for match in index.lookup_many(["1.1.1.1", "8.8.8.8", "2001:4860:4860::8888"]):
+            print(match)
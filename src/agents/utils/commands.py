@@ -0,0 +1,382 @@
+import asyncio
+import os
+import selectors
+import signal
+import subprocess
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from src.agents.utils.telemetry import observe
+
+# Commands allowed to run at the same time against one host
+DEFAULT_PER_HOST_LIMIT = 2
+# Seconds between SIGTERM and SIGKILL when stopping a command
+KILL_GRACE = 1.0
+READ_CHUNK_SIZE = 4096
+
+
+@dataclass
+class CommandResult:
+    """Exit code and decoded output of a command, possibly cut short by its timeout"""
+
+    returncode: Optional[int]
+    stdout: str
+    stderr: str
+    timed_out: bool = False
+    timeout: Optional[float] = None
+
+    @property
+    def output(self) -> str:
+        """stdout on success, stderr otherwise, flagged when the command timed out"""
+        if self.timed_out:
+            return (
+                f"{self.stdout}\n[Command stopped after {self.timeout:g}s, "
+                "the output above is partial]"
+            )
+        return self.stdout if self.returncode == 0 else self.stderr
+
+
+def _check(args: list[str], result: CommandResult) -> None:
+    if not result.timed_out and result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, args, result.stdout, result.stderr)
+
+
+def _observe(args: list[str], returncode: Optional[int], timed_out: bool, seconds: float) -> None:
+    """Record the run time of a command, host lock waits excluded"""
+    if timed_out:
+        status = "timeout"
+    elif returncode is not None and returncode < 0:
+        # Killed once the caller had read enough
+        status = "stopped"
+    else:
+        status = "ok" if returncode == 0 else "error"
+    observe("command_seconds", seconds, command=os.path.basename(args[0]), status=status)
+
+
+def _signal_group(pid: int, sig: int) -> None:
+    try:
+        os.killpg(pid, sig)
+    except ProcessLookupError:
+        pass
+
+
+# Sync
+
+
+_host_locks: Dict[str, threading.BoundedSemaphore] = {}
+_host_locks_lock = threading.Lock()
+
+
+def _host_lock(host: str, limit: int) -> threading.BoundedSemaphore:
+    with _host_locks_lock:
+        return _host_locks.setdefault(host, threading.BoundedSemaphore(limit))
+
+
+def run_command(
+    args: list[str],
+    check: bool = False,
+    timeout: Optional[float] = None,
+    host: Optional[str] = None,
+    per_host_limit: int = DEFAULT_PER_HOST_LIMIT,
+) -> CommandResult:
+    """
+    Run a command, blocking the caller.
+
+    The command runs in its own process group, killed as a whole past `timeout`,
+    in which case the output received so far is returned with `timed_out` set.
+
+    Args:
+        args: Program and arguments.
+        check: Raise when the command exits with a non-zero code.
+        timeout: Wall-clock seconds before the command is stopped. Defaults to no limit.
+        host: Target of the command, at most `per_host_limit` commands run per host.
+        per_host_limit: Concurrent commands allowed per host.
+
+    Raises:
+        subprocess.CalledProcessError: If `check` and the command exits with a non-zero code.
+        FileNotFoundError: If the program is not installed.
+    """
+    lock = _host_lock(host, per_host_limit) if host else None
+    if lock:
+        lock.acquire()
+    start = time.perf_counter()
+    try:
+        process = subprocess.Popen(
+            args,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+        )
+        timed_out = False
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            timed_out = True
+            _signal_group(process.pid, signal.SIGKILL)
+            stdout, stderr = process.communicate()
+        except BaseException:
+            _signal_group(process.pid, signal.SIGKILL)
+            process.wait()
+            raise
+    finally:
+        if lock:
+            lock.release()
+
+    result = CommandResult(
+        process.returncode,
+        stdout.decode(errors="replace"),
+        stderr.decode(errors="replace"),
+        timed_out,
+        timeout,
+    )
+    _observe(args, result.returncode, timed_out, time.perf_counter() - start)
+    if check:
+        _check(args, result)
+    return result
+
+
+# Async
+
+
+# Semaphores are bound to an event loop, keep them per loop
+_host_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _host_semaphore(host: str, limit: int) -> asyncio.Semaphore:
+    per_loop = _host_semaphores.setdefault(asyncio.get_running_loop(), {})
+    return per_loop.setdefault(host, asyncio.Semaphore(limit))
+
+
+async def _read(stream: asyncio.StreamReader, chunks: list[bytes]) -> None:
+    while chunk := await stream.read(READ_CHUNK_SIZE):
+        chunks.append(chunk)
+
+
+async def _stop(process: asyncio.subprocess.Process) -> None:
+    """SIGTERM the process group, then SIGKILL it if it is still there after a grace period"""
+    if process.returncode is not None:
+        return
+    _signal_group(process.pid, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(process.wait(), KILL_GRACE)
+    except asyncio.TimeoutError:
+        _signal_group(process.pid, signal.SIGKILL)
+        await process.wait()
+
+
+async def arun_command(
+    args: list[str],
+    check: bool = False,
+    timeout: Optional[float] = None,
+    host: Optional[str] = None,
+    per_host_limit: int = DEFAULT_PER_HOST_LIMIT,
+) -> CommandResult:
+    """
+    Run a command without blocking the event loop.
+
+    The command runs in its own process group. Past `timeout` the group is
+    stopped and the output received so far is returned with `timed_out` set.
+    When the caller is cancelled, the group is stopped before re-raising.
+
+    Args:
+        args: Program and arguments.
+        check: Raise when the command exits with a non-zero code.
+        timeout: Wall-clock seconds before the command is stopped. Defaults to no limit.
+        host: Target of the command, at most `per_host_limit` commands run per host.
+        per_host_limit: Concurrent commands allowed per host.
+
+    Raises:
+        subprocess.CalledProcessError: If `check` and the command exits with a non-zero code.
+        FileNotFoundError: If the program is not installed.
+    """
+    semaphore = _host_semaphore(host, per_host_limit) if host else None
+    if semaphore:
+        await semaphore.acquire()
+    start = time.perf_counter()
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,
+        )
+        stdout, stderr = [], []
+        readers = asyncio.gather(_read(process.stdout, stdout), _read(process.stderr, stderr))
+        timed_out = False
+        try:
+            await asyncio.wait_for(asyncio.shield(readers), timeout)
+            await process.wait()
+        except asyncio.TimeoutError:
+            timed_out = True
+            await _stop(process)
+        except asyncio.CancelledError:
+            # Do not leave the command running when the caller gives up
+            await asyncio.shield(_stop(process))
+            raise
+        finally:
+            # Pipes close with the process, the readers end with them
+            await asyncio.shield(readers)
+    finally:
+        if semaphore:
+            semaphore.release()
+
+    result = CommandResult(
+        process.returncode,
+        b"".join(stdout).decode(errors="replace"),
+        b"".join(stderr).decode(errors="replace"),
+        timed_out,
+        timeout,
+    )
+    _observe(args, result.returncode, timed_out, time.perf_counter() - start)
+    if check:
+        _check(args, result)
+    return result
+
+
+# Line streaming
+
+
+class CommandLines:
+    """
+    Stream the output lines of a command (stderr merged into stdout) as they are printed.
+
+    Use as `with CommandLines(args) as lines: for line in lines: ...`. Leaving
+    the block early, or past `timeout`, stops the command's process group, and
+    `timed_out` tells which happened.
+    """
+
+    def __init__(
+        self,
+        args: list[str],
+        timeout: Optional[float] = None,
+        host: Optional[str] = None,
+        per_host_limit: int = DEFAULT_PER_HOST_LIMIT,
+    ):
+        self.args = args
+        self.timeout = timeout
+        self.timed_out = False
+        self.returncode: Optional[int] = None
+        self._lock = _host_lock(host, per_host_limit) if host else None
+
+    def __enter__(self) -> "CommandLines":
+        if self._lock:
+            self._lock.acquire()
+        self._start = time.perf_counter()
+        try:
+            self.process = subprocess.Popen(
+                self.args,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,
+            )
+        except BaseException:
+            if self._lock:
+                self._lock.release()
+            raise
+        self._deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self.process.stdout, selectors.EVENT_READ)
+        self._buffer = b""
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        while b"\n" not in self._buffer:
+            remaining = None if self._deadline is None else self._deadline - time.monotonic()
+            if remaining is not None and (remaining <= 0 or not self._selector.select(remaining)):
+                self.timed_out = True
+                raise StopIteration
+            chunk = os.read(self.process.stdout.fileno(), READ_CHUNK_SIZE)
+            if not chunk:
+                if not self._buffer:
+                    raise StopIteration
+                self._buffer += b"\n"
+            self._buffer += chunk
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return line.decode(errors="replace")
+
+    def __exit__(self, *exc) -> None:
+        try:
+            if self.process.poll() is None:
+                _signal_group(self.process.pid, signal.SIGKILL)
+            self.returncode = self.process.wait()
+            self._selector.close()
+            self.process.stdout.close()
+            _observe(self.args, self.returncode, self.timed_out, time.perf_counter() - self._start)
+        finally:
+            if self._lock:
+                self._lock.release()
+
+
+class ACommandLines:
+    """
+    Async version of `CommandLines`: `async with ACommandLines(args) as lines: async for line in lines: ...`
+
+    Cancelling the consumer stops the command's process group too.
+    """
+
+    def __init__(
+        self,
+        args: list[str],
+        timeout: Optional[float] = None,
+        host: Optional[str] = None,
+        per_host_limit: int = DEFAULT_PER_HOST_LIMIT,
+    ):
+        self.args = args
+        self.timeout = timeout
+        self.timed_out = False
+        self.returncode: Optional[int] = None
+        self._host = host
+        self._per_host_limit = per_host_limit
+
+    async def __aenter__(self) -> "ACommandLines":
+        self._semaphore = _host_semaphore(self._host, self._per_host_limit) if self._host else None
+        if self._semaphore:
+            await self._semaphore.acquire()
+        self._start = time.perf_counter()
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                *self.args,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+                start_new_session=True,
+            )
+        except BaseException:
+            if self._semaphore:
+                self._semaphore.release()
+            raise
+        loop = asyncio.get_running_loop()
+        self._deadline = None if self.timeout is None else loop.time() + self.timeout
+        return self
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        remaining = None
+        if self._deadline is not None:
+            remaining = self._deadline - asyncio.get_running_loop().time()
+        try:
+            line = await asyncio.wait_for(self.process.stdout.readline(), remaining)
+        except asyncio.TimeoutError:
+            self.timed_out = True
+            raise StopAsyncIteration
+        if not line:
+            raise StopAsyncIteration
+        return line.decode(errors="replace").rstrip("\n")
+
+    async def __aexit__(self, *exc) -> None:
+        try:
+            await asyncio.shield(_stop(self.process))
+            self.returncode = self.process.returncode
+            _observe(self.args, self.returncode, self.timed_out, time.perf_counter() - self._start)
+        finally:
+            if self._semaphore:
+                self._semaphore.release()
@@ -0,0 +1,100 @@
+import csv
+import io
+import json
+from typing import Dict, Iterable, Optional
+
+# How structured tool results are written for the LLM:
+# - "auto": "kv" for a single record, "csv" for several (fewest tokens)
+# - "kv": one record per line, `key=value` pairs
+# - "csv": a header line, then one line per record
+# - "json": compact JSON list of records
+# - "raw": the command output, as returned before the parsers existed
+OUTPUT_FORMATS = ("auto", "kv", "csv", "json", "raw")
+TOOL_OUTPUT_FORMAT = "auto"
+
+
+def _value(value) -> str:
+    if isinstance(value, bool):
+        return str(value).lower()
+    if isinstance(value, float):
+        return f"{value:g}"
+    if isinstance(value, (list, tuple)):
+        return ",".join("*" if item is None else _value(item) for item in value)
+    return str(value)
+
+
+def _kv_key(key: str) -> str:
+    return key.replace(" ", "_")
+
+
+def _kv_value(value) -> str:
+    text = _value(value)
+    if not text or any(char in text for char in ' ="'):
+        return json.dumps(text)
+    return text
+
+
+def format_records(records: Iterable[Dict], fmt: Optional[str] = None) -> str:
+    """
+    Serialize records, skipping None and empty values.
+
+    Args:
+        records: Dicts sharing (mostly) the same keys.
+        fmt: One of "auto", "kv", "csv" or "json". Defaults to `TOOL_OUTPUT_FORMAT`.
+
+    Raises:
+        ValueError: If the format is unknown or "raw", which has no record form.
+    """
+    fmt = fmt or TOOL_OUTPUT_FORMAT
+    records = [
+        {key: value for key, value in record.items() if value is not None and value != []}
+        for record in records
+    ]
+    if fmt == "auto":
+        fmt = "kv" if len(records) == 1 else "csv"
+    if fmt == "kv":
+        return "\n".join(
+            " ".join(f"{_kv_key(key)}={_kv_value(value)}" for key, value in record.items())
+            for record in records
+        )
+    if fmt == "csv":
+        columns = list(dict.fromkeys(key for record in records for key in record))
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(columns)
+        for record in records:
+            writer.writerow([_value(record[key]) if key in record else "" for key in columns])
+        return buffer.getvalue().rstrip("\n")
+    if fmt == "json":
+        return json.dumps(records, separators=(",", ":"))
+    raise ValueError(f"Unknown record format {fmt!r}, expected one of {OUTPUT_FORMATS[:-1]}")
+
+
+def tool_output(
+    records: Iterable[Dict], raw: str, note: Optional[str] = None, fmt: Optional[str] = None
+) -> str:
+    """
+    Tool result in the configured format, wrapped in `<tool>` tags for the UI.
+
+    Args:
+        records: Parsed result.
+        raw: Command output, returned as is in the "raw" format.
+        note: Line appended to structured formats, e.g. why a command stopped early.
+        fmt: One of `OUTPUT_FORMATS`. Defaults to `TOOL_OUTPUT_FORMAT`.
+    """
+    fmt = fmt or TOOL_OUTPUT_FORMAT
+    if fmt == "raw":
+        return f"<tool>{raw}</tool>"
+    text = format_records(records, fmt)
+    if note:
+        text += f"\n[{note}]"
+    return f"<tool>{text}</tool>"
+
+
+if __name__ == "__main__":
+    hops = [
+        {"hop": 1, "ip": "192.168.1.1", "hostname": None, "rtts": [0.512, 0.498, None]},
+        {"hop": 2, "ip": None, "hostname": None, "rtts": [None, None, None]},
+    ]
+    for fmt in OUTPUT_FORMATS[1:-1]:
+        print(f"{fmt}:\n{format_records(hops, fmt)}\n")
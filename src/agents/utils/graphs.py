@@ -0,0 +1,48 @@
+import threading
+from typing import Callable, Dict
+
+from langgraph.graph.state import CompiledStateGraph
+
+from src.agents.utils.models import ModelParams
+from src.agents.utils.telemetry import instrument
+
+GraphFactory = Callable[..., CompiledStateGraph]
+
+_graphs: Dict[tuple, CompiledStateGraph] = {}
+_graphs_lock = threading.Lock()
+
+
+def shared_graph(factory: GraphFactory, model_params: ModelParams = ModelParams()) -> CompiledStateGraph:
+    """
+    Return the graph built by `factory` for `model_params`, compiling it on first use.
+
+    Compiled graphs hold no conversation state without a checkpointer, so one
+    instance (with its LLM clients and nested graphs) serves every session.
+    When telemetry is enabled, the graph is returned with its callback.
+    """
+    key = (factory, model_params)
+    with _graphs_lock:
+        graph = _graphs.get(key)
+    if graph is None:
+        # Built outside the lock, nested graphs go through shared_graph too
+        graph = factory(model_params=model_params)
+        with _graphs_lock:
+            graph = _graphs.setdefault(key, graph)
+    return instrument(graph)
+
+
+def session_graph(
+    factory: GraphFactory,
+    model_params: ModelParams = ModelParams(),
+    checkpointer=None,
+) -> CompiledStateGraph:
+    """Shared graph bound to a session's own checkpointer, without recompiling it"""
+    graph = shared_graph(factory, model_params)
+    if checkpointer is None:
+        return graph
+    return graph.copy(update={"checkpointer": checkpointer})
+
+
+def clear_graphs() -> None:
+    with _graphs_lock:
+        _graphs.clear()
@@ -1,8 +1,65 @@
-from pydantic import BaseModel
-from typing import Literal
+from functools import lru_cache
+from pydantic import BaseModel, ConfigDict
+from typing import Literal, Optional
+
+import httpx
+from langchain_openai import ChatOpenAI
+
+from src.agents.iypchat.iyp_client import DEFAULT_MAX_CONNECTIONS, IYP_API_BASE
+from src.agents.utils.replay import Latency, ReplayTransport, get_replay_store
+
+
+class IYPSettings(BaseModel):
+    """Where the IYP Cypher queries are run, see `src.agents.iypchat.backends`"""
+
+    model_config = ConfigDict(frozen=True)
+
+    # "http": IYP query API, "bolt": a local Neo4j (IYP dump), "fixtures": recorded answers
+    backend: Literal["http", "bolt", "fixtures"] = "http"
+    url: str = IYP_API_BASE
+    bolt_uri: str = "bolt://localhost:7687"
+    user: Optional[str] = None
+    password: Optional[str] = None
+    database: Optional[str] = None
+    # Connection pool size of the HTTP client or the Bolt driver
+    max_connections: int = DEFAULT_MAX_CONNECTIONS
+    fixtures_path: str = "src/agents/iypchat/fixtures/iyp_queries.json"
+    # With the fixtures backend, run unknown statements over HTTP and record them
+    record_fixtures: bool = False
+    # Synthetic delay of the recorded answers, seconds plus up to `fixtures_jitter`
+    fixtures_latency: float = 0.0
+    fixtures_jitter: float = 0.0
+    # Answer repeated statements from `src.agents.iypchat.result_cache`, off when
+    # every run must pay the backend latency (benchmarks replaying fixtures)
+    result_cache: bool = True
+    # Guard of generated queries, see `src.agents.iypchat.query_guard`: "rewrite" adds
+    # or clamps LIMIT and variable-length bounds, "reject" refuses such queries instead
+    guard: Literal["off", "rewrite", "reject"] = "rewrite"
+    max_limit: int = 200
+    max_hops: int = 4
+    # Estimated rows touched by a query that cannot stop at its LIMIT
+    max_cost: float = 1e8
+
+
+class ReplaySettings(BaseModel):
+    """Record/replay of the LLM HTTP calls, see `src.agents.utils.replay`"""
+
+    model_config = ConfigDict(frozen=True)
+
+    # "record": call the server for requests not on the tape and record them,
+    # "replay": answer from the tape only, no network
+    mode: Literal["off", "record", "replay"] = "off"
+    path: str = "data/llm_tape.jsonl.gz"
+    # Delay of replayed responses, None for the recorded one, times `latency_scale`
+    latency: Optional[float] = None
+    latency_scale: float = 1.0
+    jitter: float = 0.0
 
 
 class ModelParams(BaseModel):
+    # Frozen, so it can key the graph and client caches
+    model_config = ConfigDict(frozen=True)
+
     base_url: str = "http://localhost:11434/v1"
     api_key: str = "ollama"
     model: Literal[
@@ -11,4 +68,18 @@ class ModelParams(BaseModel):
         "qwen2.5-coder:3b",
         "hf.co/unsloth/Qwen3-4B-GGUF:Q6_K_XL",
     ] = "qwen3:4b"
-    temperature: float = 0.0
\ No newline at end of file
+    temperature: float = 0.0
+    iyp: IYPSettings = IYPSettings()
+    replay: ReplaySettings = ReplaySettings()
+
+@lru_cache(maxsize=None)
+def get_chat_model(model_params: ModelParams = ModelParams()) -> ChatOpenAI:
+    """Return the chat client of `model_params`, shared with its HTTP connection pool"""
+    kwargs = model_params.model_dump(exclude={"iyp", "replay"})
+    replay = model_params.replay
+    if replay.mode != "off":
+        latency = Latency(replay.latency, replay.latency_scale, replay.jitter)
+        transport = ReplayTransport(get_replay_store(replay.path), replay.mode, latency)
+        kwargs["http_client"] = httpx.Client(transport=transport)
+        kwargs["http_async_client"] = httpx.AsyncClient(transport=transport)
+    return ChatOpenAI(**kwargs)
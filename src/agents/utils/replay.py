@@ -0,0 +1,207 @@
+import asyncio
+import base64
+import gzip
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Literal, Optional
+
+import httpx
+
+ReplayMode = Literal["record", "replay"]
+
+# Response headers kept on record, the body is stored decoded so encodings are dropped
+KEPT_HEADERS = ("content-type",)
+
+
+@dataclass(frozen=True)
+class Latency:
+    """Synthetic delay of replayed responses.
+
+    Args:
+        seconds: Delay of every response, None to wait as long as when it was recorded.
+        scale: Factor applied to the delay, e.g. 0.5 for a server twice as fast.
+        jitter: Extra seconds drawn uniformly in [0, jitter] for each response.
+    """
+
+    seconds: Optional[float] = None
+    scale: float = 1.0
+    jitter: float = 0.0
+
+    def sample(self, recorded: float) -> float:
+        base = recorded if self.seconds is None else self.seconds
+        return base * self.scale + (random.uniform(0.0, self.jitter) if self.jitter else 0.0)
+
+
+@dataclass
+class Recording:
+    """A recorded response and the seconds the server took to send it"""
+
+    status: int
+    headers: Dict[str, str]
+    body: bytes
+    seconds: float
+
+    def to_json(self, key: str) -> dict:
+        try:
+            body = {"body": self.body.decode()}
+        except UnicodeDecodeError:
+            body = {"body_b64": base64.b64encode(self.body).decode()}
+        return {"key": key, "status": self.status, "headers": self.headers, **body, "seconds": round(self.seconds, 4)}
+
+    @classmethod
+    def from_json(cls, entry: dict) -> "Recording":
+        body = entry["body"].encode() if "body" in entry else base64.b64decode(entry["body_b64"])
+        return cls(entry["status"], entry["headers"], body, entry["seconds"])
+
+    def to_response(self, request: httpx.Request) -> httpx.Response:
+        return httpx.Response(self.status, headers=self.headers, content=self.body, request=request)
+
+
+def request_key(request: httpx.Request) -> str:
+    """Hash of the method, path and body of a request, JSON bodies compared by value.
+
+    The host is left out, so a tape recorded against one server replays against another.
+    """
+    body = request.content
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode()
+    except ValueError:
+        pass
+    return hashlib.sha256(f"{request.method} {request.url.path}\n".encode() + body).hexdigest()
+
+
+class ReplayStore:
+    """Recorded responses, in a gzipped JSON lines file.
+
+    Recordings are appended as gzip members, so recording never rewrites the file.
+    A key recorded twice keeps its latest response.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.recordings: Dict[str, Recording] = {}
+        try:
+            with gzip.open(path, "rt") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.recordings[entry["key"]] = Recording.from_json(entry)
+        except FileNotFoundError:
+            pass
+
+    def get(self, key: str) -> Optional[Recording]:
+        return self.recordings.get(key)
+
+    def record(self, key: str, response: httpx.Response, seconds: float) -> Recording:
+        headers = {name: response.headers[name] for name in KEPT_HEADERS if name in response.headers}
+        recording = Recording(response.status_code, headers, response.content, seconds)
+        line = json.dumps(recording.to_json(key)) + "\n"
+        with self._lock:
+            self.recordings[key] = recording
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with gzip.open(self.path, "at") as f:
+                f.write(line)
+        return recording
+
+
+@lru_cache(maxsize=None)
+def get_replay_store(path: str) -> ReplayStore:
+    """Return the process-wide store of `path`, shared by the transports recording to it"""
+    return ReplayStore(path)
+
+
+def _missing(request: httpx.Request) -> httpx.Response:
+    # Shaped like an OpenAI error, clients raise it instead of retrying
+    message = f"No recorded response for {request.method} {request.url.path}"
+    return httpx.Response(404, json={"error": {"message": message, "type": "replay_miss"}}, request=request)
+
+
+class ReplayTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """httpx transport answering from a `ReplayStore`, for runs without network.
+
+    Plug it into `httpx.Client(transport=...)` and `httpx.AsyncClient(transport=...)`,
+    e.g. the `http_client` and `http_async_client` of `ChatOpenAI`.
+
+    Args:
+        store: Recorded responses.
+        mode: "replay" answers 404 to requests not recorded, "record" sends them
+            to the server and records the response. Recorded requests are replayed
+            in both modes.
+        latency: Delay of replayed responses.
+    """
+
+    def __init__(self, store: ReplayStore, mode: ReplayMode = "replay", latency: Latency = Latency()):
+        self.store = store
+        self.mode = mode
+        self.latency = latency
+        self._transport: Optional[httpx.HTTPTransport] = None
+        self._atransport: Optional[httpx.AsyncHTTPTransport] = None
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        key = request_key(request)
+        recording = self.store.get(key)
+        if recording is not None:
+            time.sleep(self.latency.sample(recording.seconds))
+            return recording.to_response(request)
+        if self.mode == "replay":
+            return _missing(request)
+        if self._transport is None:
+            self._transport = httpx.HTTPTransport()
+        start = time.perf_counter()
+        response = self._transport.handle_request(request)
+        try:
+            response.read()
+        finally:
+            response.close()
+        return self.store.record(key, response, time.perf_counter() - start).to_response(request)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        key = request_key(request)
+        recording = self.store.get(key)
+        if recording is not None:
+            await asyncio.sleep(self.latency.sample(recording.seconds))
+            return recording.to_response(request)
+        if self.mode == "replay":
+            return _missing(request)
+        if self._atransport is None:
+            self._atransport = httpx.AsyncHTTPTransport()
+        start = time.perf_counter()
+        response = await self._atransport.handle_async_request(request)
+        try:
+            await response.aread()
+        finally:
+            await response.aclose()
+        return self.store.record(key, response, time.perf_counter() - start).to_response(request)
+
+    def close(self) -> None:
+        if self._transport is not None:
+            self._transport.close()
+
+    async def aclose(self) -> None:
+        if self._atransport is not None:
+            await self._atransport.aclose()
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    from src.benchmarks.llm_stand_in import LLMStandIn
+
+    path = os.path.join(tempfile.mkdtemp(), "tape.jsonl.gz")
+    body = {"model": "qwen3:4b", "messages": [{"role": "user", "content": "Hi"}]}
+    with LLMStandIn(delay=0.2) as llm:
+        with httpx.Client(transport=ReplayTransport(ReplayStore(path), "record")) as client:
+            print("recorded", client.post(f"{llm.url}/chat/completions", json=body).json()["choices"][0])
+    # The stand-in is gone, the answer comes from the tape
+    with httpx.Client(transport=ReplayTransport(ReplayStore(path), latency=Latency(scale=0.5))) as client:
+        start = time.perf_counter()
+        response = client.post("http://offline/v1/chat/completions", json=body)
+        print("replayed", response.json()["choices"][0], f"{time.perf_counter() - start:.2f}s")
+        print("missing", client.post("http://offline/v1/chat/completions", json={}).status_code)
+    print(f"{os.path.getsize(path)} bytes on disk")
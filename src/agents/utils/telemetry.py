@@ -0,0 +1,338 @@
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langgraph.constants import NS_END, NS_SEP
+from langgraph.errors import GraphBubbleUp
+
+# Histogram buckets in seconds, from a cached IYP answer to a long traceroute
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """Prometheus histogram, one series per combination of label values"""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...], buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # Label values -> [count per bucket, sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        for key, (counts, total, count) in series:
+            for bound, bucket_count in zip(self.buckets, counts):
+                le = f'le="{bound:g}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {bucket_count}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {total:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Counter:
+    """Prometheus counter, one series per combination of label values"""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...]):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, value: float = 1, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            series = sorted(self._series.items())
+        lines += [f"{self.name}{_labels(self.labels, key)} {value:g}" for key, value in series]
+        return lines
+
+
+def node_path(checkpoint_ns: str) -> str:
+    """Node names from the root graph down, e.g. "data_retriever/tools/iyp_assistant".
+
+    A checkpoint namespace also holds task ids: "data_retriever:<id>|tools:<id>|...".
+    """
+    return "/".join(part.split(NS_END)[0] for part in checkpoint_ns.split(NS_SEP))
+
+
+def _status(error: BaseException) -> str:
+    # Handoffs and interrupts travel as exceptions, they are not failures
+    return "ok" if isinstance(error, GraphBubbleUp) else "error"
+
+
+class TelemetryCallback(BaseCallbackHandler):
+    """Feeds the node, LLM and tool metrics of `Telemetry` from LangChain callbacks.
+
+    Nested graphs inherit the callbacks of their parent, so the same event may be
+    reported twice when both graphs carry this handler: every run is recorded
+    once, by its run id, and a node is timed once per checkpoint namespace.
+    """
+
+    # Timings are taken in the thread of the run, not in a callback executor
+    run_inline = True
+
+    def __init__(self, telemetry: "Telemetry"):
+        self.telemetry = telemetry
+        self._nodes: Dict[UUID, Tuple[str, float]] = {}
+        self._open_nodes: set[str] = set()
+        # Run id -> [node path, model, start, first token]
+        self._llm: Dict[UUID, list] = {}
+        self._tools: Dict[UUID, Tuple[str, float]] = {}
+
+    # Nodes
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, **kwargs) -> None:
+        metadata = metadata or {}
+        node = metadata.get("langgraph_node")
+        # The node runnable is named after the node, the runnables inside it are not
+        if node is None or kwargs.get("name") != node:
+            return
+        checkpoint_ns = metadata.get("langgraph_checkpoint_ns") or node
+        if checkpoint_ns in self._open_nodes:
+            return
+        self._open_nodes.add(checkpoint_ns)
+        self._nodes[run_id] = (checkpoint_ns, time.perf_counter())
+
+    def _end_node(self, run_id: UUID, status: str) -> None:
+        started = self._nodes.pop(run_id, None)
+        if started is None:
+            return
+        checkpoint_ns, start = started
+        self._open_nodes.discard(checkpoint_ns)
+        self.telemetry.node_seconds.observe(time.perf_counter() - start, node=node_path(checkpoint_ns), status=status)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs) -> None:
+        self._end_node(run_id, "ok")
+
+    def on_chain_error(self, error, *, run_id, **kwargs) -> None:
+        self._end_node(run_id, _status(error))
+
+    # LLM calls
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs) -> None:
+        if run_id in self._llm:
+            return
+        metadata = metadata or {}
+        path = node_path(metadata.get("langgraph_checkpoint_ns") or "")
+        self._llm[run_id] = [path, metadata.get("ls_model_name", ""), time.perf_counter(), None]
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs) -> None:
+        call = self._llm.get(run_id)
+        if call is not None and call[3] is None:
+            call[3] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+        call = self._llm.pop(run_id, None)
+        if call is None:
+            return
+        path, model, start, first_token = call
+        end = time.perf_counter()
+        telemetry = self.telemetry
+        telemetry.llm_seconds.observe(end - start, node=path, model=model)
+        # Without streaming the first token comes with the whole answer
+        telemetry.llm_first_token_seconds.observe((first_token or end) - start, node=path, model=model)
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                if usage:
+                    telemetry.llm_tokens.inc(usage.get("input_tokens", 0), node=path, model=model, kind="prompt")
+                    telemetry.llm_tokens.inc(usage.get("output_tokens", 0), node=path, model=model, kind="completion")
+
+    def on_llm_error(self, error, *, run_id, **kwargs) -> None:
+        self._llm.pop(run_id, None)
+
+    # Tools
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs) -> None:
+        if run_id not in self._tools:
+            name = kwargs.get("name") or (serialized or {}).get("name", "")
+            self._tools[run_id] = (name, time.perf_counter())
+
+    def _end_tool(self, run_id: UUID, status: str) -> None:
+        started = self._tools.pop(run_id, None)
+        if started is not None:
+            self.telemetry.tool_seconds.observe(time.perf_counter() - started[1], tool=started[0], status=status)
+
+    def on_tool_end(self, output, *, run_id, **kwargs) -> None:
+        self._end_tool(run_id, "ok")
+
+    def on_tool_error(self, error, *, run_id, **kwargs) -> None:
+        self._end_tool(run_id, _status(error))
+
+
+class Telemetry:
+    """Metrics of the agents, rendered in the Prometheus text format.
+
+    Nodes are labelled with their path from the root graph (see `node_path`), so
+    the `assistant` of the supervisor and the one of data_retriever stay apart.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.node_seconds = Histogram("agent_node_seconds", "Wall time of graph nodes", ("node", "status"), buckets)
+        self.llm_seconds = Histogram("agent_llm_seconds", "Duration of LLM calls", ("node", "model"), buckets)
+        self.llm_first_token_seconds = Histogram(
+            "agent_llm_first_token_seconds", "Time to the first token of LLM calls", ("node", "model"), buckets
+        )
+        self.llm_tokens = Counter("agent_llm_tokens_total", "Tokens of LLM calls", ("node", "model", "kind"))
+        self.tool_seconds = Histogram("agent_tool_seconds", "Wall time of tool calls", ("tool", "status"), buckets)
+        self.command_seconds = Histogram(
+            "agent_command_seconds", "Run time of tool subprocesses", ("command", "status"), buckets
+        )
+        self.iyp_seconds = Histogram("agent_iyp_seconds", "Duration of IYP queries", ("backend", "status"), buckets)
+        self.callback = TelemetryCallback(self)
+
+    def metrics(self) -> list:
+        return [
+            self.node_seconds,
+            self.llm_seconds,
+            self.llm_first_token_seconds,
+            self.llm_tokens,
+            self.tool_seconds,
+            self.command_seconds,
+            self.iyp_seconds,
+        ]
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self.metrics() for line in metric.render()) + "\n"
+
+
+def start_metrics_server(telemetry: Telemetry, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve `telemetry` at http://host:port/metrics, in a daemon thread"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = telemetry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+_telemetry: Optional[Telemetry] = None
+_telemetry_lock = threading.Lock()
+
+
+def enable_telemetry(port: Optional[int] = None, host: str = "127.0.0.1") -> Telemetry:
+    """Start recording metrics, served on `port` when given.
+
+    Graphs returned by `shared_graph` afterwards carry the telemetry callback.
+    """
+    global _telemetry
+    with _telemetry_lock:
+        if _telemetry is None:
+            _telemetry = Telemetry()
+            if port is not None:
+                start_metrics_server(_telemetry, port, host)
+        return _telemetry
+
+
+def get_telemetry() -> Optional[Telemetry]:
+    """Return the process-wide telemetry, None while disabled"""
+    return _telemetry
+
+
+def instrument(graph: Any) -> Any:
+    """`graph` with the telemetry callback when telemetry is enabled, else `graph` itself"""
+    telemetry = _telemetry
+    if telemetry is None:
+        return graph
+    return graph.with_config(callbacks=[telemetry.callback])
+
+
+def observe(metric: str, seconds: float, **labels: str) -> None:
+    """Add `seconds` to the `metric` histogram of `Telemetry`, e.g. "command_seconds".
+
+    Does nothing while telemetry is disabled.
+    """
+    telemetry = _telemetry
+    if telemetry is not None:
+        getattr(telemetry, metric).observe(seconds, **labels)
+
+
+@contextmanager
+def timed(metric: str, **labels: str) -> Iterator[None]:
+    """Observe the duration of the block in the `metric` histogram of `Telemetry`, e.g. "iyp_seconds".
+
+    Does nothing while telemetry is disabled.
+    """
+    telemetry = _telemetry
+    if telemetry is None:
+        yield
+        return
+    start = time.perf_counter()
+    status = "error"
+    try:
+        yield
+        status = "ok"
+    finally:
+        getattr(telemetry, metric).observe(time.perf_counter() - start, status=status, **labels)
+
+
+if __name__ == "__main__":
+    import asyncio
+
+    from langchain_core.messages import HumanMessage
+
+    from src.agents.iypchat.iypchat import get_iyp_graph
+    from src.agents.utils.graphs import shared_graph
+    from src.agents.utils.models import ModelParams
+    # The instrumented modules read the state of the package module, not of __main__
+    from src.agents.utils.telemetry import enable_telemetry
+    from src.benchmarks.llm_stand_in import LLMStandIn
+
+    telemetry = enable_telemetry()
+    with LLMStandIn(delay=0.05) as llm:
+        graph = shared_graph(get_iyp_graph, ModelParams(base_url=llm.url, api_key="stand-in"))
+        asyncio.run(graph.ainvoke({"messages": [HumanMessage("Which IXPs is AS2497 a member of?")]}))
+    print(telemetry.render())
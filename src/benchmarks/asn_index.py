@@ -0,0 +1,69 @@
+"""IP -> ASN longest-prefix match on a full-table-sized synthetic pfx2as dump.
+
+Prefixes are random /8-/24 (IPv4) and /19-/48 (IPv6), nested as in a real
+table. Reports the one-off build, reopening the memory-mapped index, and
+lookup throughput: vectorized on integer keys, on IP strings, and one by one.
+
+python -m src.benchmarks.asn_index --v4 1000000 --v6 200000
+"""
+import argparse
+import ipaddress
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from src.agents.utils.asn_index import ASNIndex
+
+
+def synthetic_pfx2as(path: str, n_v4: int, n_v6: int, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    with open(path, "w") as f:
+        for _ in range(n_v4):
+            length = rng.choice([8, 12, 16, 18, 20, 22, 23, 24, 24, 24, 24, 24])
+            network = ipaddress.IPv4Network((rng.getrandbits(32), length), strict=False)
+            f.write(f"{network.network_address}\t{length}\t{rng.randint(1, 400000)}\n")
+        for _ in range(n_v6):
+            length = rng.choice([19, 24, 29, 32, 32, 36, 40, 44, 48, 48, 48])
+            network = ipaddress.IPv6Network(((0x2 << 124) | rng.getrandbits(124), length), strict=False)
+            f.write(f"{network.network_address}\t{length}\t{rng.randint(1, 400000)}\n")
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--v4", type=int, default=1_000_000)
+    parser.add_argument("--v6", type=int, default=200_000)
+    parser.add_argument("--lookups", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "synthetic.pfx2as")
+        index_dir = os.path.join(tmp, "index")
+        synthetic_pfx2as(path, args.v4, args.v6)
+
+        index, built = timed(lambda: ASNIndex(path, index_dir))
+        index, opened = timed(lambda: ASNIndex(path, index_dir))
+        assert not index.rebuilt
+        table_bytes = sum(array.nbytes for table in index.tables.values() for array in table.values())
+        print(f"{len(index)} prefixes, {table_bytes / 2**20:.1f}MiB of arrays")
+        print(f"build {built:8.2f}s   reopen (mmap) {opened * 1e3:7.1f}ms")
+
+        rng = np.random.default_rng(0)
+        keys = rng.integers(0, 2**32, args.lookups, dtype=np.uint64)
+        _, elapsed = timed(lambda: index.match_keys(4, keys))
+        print(f"integer keys  {args.lookups / elapsed / 1e3:10.0f} lookups/ms")
+
+        ips = [str(ipaddress.IPv4Address(int(key))) for key in keys[:100_000]]
+        _, elapsed = timed(lambda: index.lookup_many(ips))
+        print(f"lookup_many   {len(ips) / elapsed / 1e3:10.0f} lookups/ms")
+
+        _, elapsed = timed(lambda: [index.lookup(ip) for ip in ips[:10_000]])
+        print(f"lookup        {10_000 / elapsed / 1e3:10.0f} lookups/ms")
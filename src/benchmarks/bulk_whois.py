@@ -0,0 +1,59 @@
+"""Whois lookups of many resources against a local bgp.tools stand-in.
+
+"per resource" opens one connection per resource, as the `whois` tool does
+(without the cost of spawning the whois program). "bulk" sends them all over one
+connection, "cached" repeats the bulk lookup of other IPs of the same prefixes,
+answered by longest-prefix match in the local cache.
+
+python -m src.benchmarks.bulk_whois --resources 50 --delay 0.05
+"""
+import argparse
+import os
+import socket
+import tempfile
+import time
+
+from src.agents.data_retriever.bgp_tools import WhoisCache, lookup_many
+from src.benchmarks.whois_stand_in import WhoisStandIn
+
+
+def resources(n: int, offset: int = 0) -> list[str]:
+    """IPs spread over the stand-in prefixes, plus a few ASNs"""
+    prefixes = ["1.1.1.{}", "8.8.8.{}", "202.12.27.{}", "2001:4860::{:x}"]
+    items = [prefixes[i % len(prefixes)].format(1 + offset + i // len(prefixes)) for i in range(n)]
+    return items + ["AS13335", "AS15169", "AS2497"]
+
+
+def per_resource(stand_in: WhoisStandIn, items: list[str]) -> None:
+    for item in items:
+        with socket.create_connection((stand_in.host, stand_in.port)) as sock:
+            sock.sendall(f"-v {item}\n".encode())
+            while sock.recv(65536):
+                pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resources", type=int, default=50)
+    parser.add_argument("--delay", type=float, default=0.05, help="server latency per connection")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp, WhoisStandIn(delay=args.delay) as stand_in:
+        cache = WhoisCache(os.path.join(tmp, "whois_cache.sqlite"))
+        items = resources(args.resources)
+
+        def run(name, fn):
+            connections = stand_in.connections
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+            print(
+                f"{name:<14} {elapsed * 1e3:8.1f}ms  {stand_in.connections - connections:>4} connections"
+            )
+
+        print(f"{len(items)} resources, {args.delay * 1e3:g}ms server latency\n")
+        run("per resource", lambda: per_resource(stand_in, items))
+        run("bulk", lambda: lookup_many(items, cache, stand_in.host, stand_in.port))
+        others = resources(args.resources, offset=100)
+        run("cached", lambda: lookup_many(others, cache, stand_in.host, stand_in.port))
+        print(f"\ncache {cache.stats()}")
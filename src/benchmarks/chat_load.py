@@ -0,0 +1,72 @@
+"""Concurrent chat sessions served by one event loop, as in the Chainlit app.
+
+Each simulated user opens a session on the supervisor graph and streams one
+answer. "blocking" iterates `graph.stream` inside the coroutine, as `on_message`
+used to, "async" iterates `graph.astream`. The LLM is a local OpenAI-compatible
+stand-in answering after `--llm-delay` seconds.
+
+python -m src.benchmarks.chat_load --users 1 10 50
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+
+from src.agents.supervisor.supervisor import get_supervisor_graph
+from src.agents.utils.graphs import session_graph
+from src.agents.utils.models import ModelParams
+from src.benchmarks.llm_stand_in import LLMStandIn
+
+
+async def user(model_params: ModelParams, user_id: int, blocking: bool, start: float) -> float:
+    """Stream one answer, return the seconds from `start` until its first token"""
+    graph = session_graph(get_supervisor_graph, model_params, checkpointer=InMemorySaver())
+    inputs = {"messages": [HumanMessage("Ping google.com")]}
+    config = {"configurable": {"thread_id": str(user_id)}}
+    first_token = None
+    if blocking:
+        for msg, metadata in graph.stream(inputs, stream_mode="messages", config=config):
+            if first_token is None and msg.content:
+                first_token = time.perf_counter() - start
+            await asyncio.sleep(0)
+    else:
+        async for msg, metadata in graph.astream(inputs, stream_mode="messages", config=config):
+            if first_token is None and msg.content:
+                first_token = time.perf_counter() - start
+    return first_token
+
+
+async def load(model_params: ModelParams, n_users: int, blocking: bool) -> tuple[float, list]:
+    start = time.perf_counter()
+    first_tokens = await asyncio.gather(
+        *(user(model_params, i, blocking, start) for i in range(n_users))
+    )
+    return time.perf_counter() - start, first_tokens
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--llm-delay", type=float, default=0.1)
+    args = parser.parse_args()
+
+    async def main(url: str):
+        model_params = ModelParams(base_url=url, api_key="stand-in")
+        # Compile the shared graph and warm the clients once. A single loop is
+        # used throughout: async HTTP clients are bound to the loop that opened them
+        await load(model_params, 1, blocking=False)
+
+        for n_users in args.users:
+            for mode in ("blocking", "async"):
+                elapsed, first_tokens = await load(model_params, n_users, mode == "blocking")
+                print(
+                    f"{n_users:>4} users {mode:<9} {n_users / elapsed:7.1f} chats/s   "
+                    f"first token p50 {statistics.median(first_tokens) * 1e3:7.0f}ms "
+                    f"max {max(first_tokens) * 1e3:7.0f}ms"
+                )
+
+    with LLMStandIn(delay=args.llm_delay) as llm:
+        asyncio.run(main(llm.url))
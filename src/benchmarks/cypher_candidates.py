@@ -0,0 +1,122 @@
+"""Accuracy and latency of the iypchat graph sampling N Cypher candidates per question.
+
+The LLM is a local stand-in playing a small model: for every CypherEval question
+and sampling temperature it answers the canonical solution with probability
+`--p-correct` (a bit less for hotter samples), else a broken query (unknown
+label), one answering nothing (a changed literal) or the solution of another
+question. Candidates take `--llm-delay` seconds on average. The IYP API is a
+stand-in answering the canonical solutions only, so a question is answered
+right when the graph returns the rows of its own solution. Repairs are off.
+
+python -m src.benchmarks.cypher_candidates --n 1 2 3 4 5 --vote first
+"""
+import argparse
+import asyncio
+import random
+import re
+import statistics
+import time
+
+from langchain_core.messages import HumanMessage
+
+from src.agents.iypchat.backends import fixture_key
+from src.agents.iypchat.cypher_lint import CypherLinter
+from src.agents.iypchat.iypchat import get_iyp_graph
+from src.agents.iypchat.prompts.templates import load_cyphereval
+from src.agents.iypchat.query_guard import QueryGuard
+from src.agents.iypchat.result_cache import get_result_cache
+from src.agents.iypchat.schema.schema import load_schema
+from src.agents.utils.models import IYPSettings, ModelParams
+from src.benchmarks.iyp_stand_in import IYPStandIn
+from src.benchmarks.llm_stand_in import LLMStandIn
+
+LITERAL_RE = re.compile(r"'[^']+'|\b\d+\b")
+LABEL_RE = re.compile(r"(?<=\w):([A-Z][A-Za-z]+)(?=[\s){])")
+
+
+def load_questions(limit: int, seed: int) -> list[tuple[str, str]]:
+    """(question, canonical solution) pairs the linter and the guard let through"""
+    index = load_schema("src/agents/iypchat/schema/neo4j-schema.json").index
+    linter, guard = CypherLinter(index), QueryGuard(index)
+    dataset = load_cyphereval()
+    pairs = [
+        (question, query)
+        for question, query in zip(dataset["Prompt"], dataset["Canonical Solution"])
+        if not linter.lint(query).issues and not guard.check(query).rejected
+    ]
+    # One pair per question, CypherEval has them twice (variations A and B)
+    pairs = list(dict(pairs).items())
+    random.Random(seed).shuffle(pairs)
+    return pairs[:limit]
+
+
+def sample(question: str, temperature: float, solutions: dict[str, str], args) -> str:
+    """The query the stand-in model answers, the same for a question and temperature on every run"""
+    rng = random.Random(f"{args.seed}-{question}-{temperature:.2f}")
+    canonical = solutions[question]
+    if rng.random() < args.p_correct - 0.1 * temperature:
+        return canonical
+    mistake = rng.choice(("label", "literal", "other"))
+    if mistake == "literal" and LITERAL_RE.search(canonical):
+        return LITERAL_RE.sub(lambda m: "'x'" if m.group().startswith("'") else "0", canonical, count=1)
+    if mistake == "other":
+        return rng.choice(list(solutions.values()))
+    return LABEL_RE.sub(":Router", canonical, count=1)
+
+
+async def run(graph, questions: list[str]) -> list[tuple[float, list]]:
+    """Seconds and rows of every question, asked one at a time"""
+    results = []
+    for question in questions:
+        start = time.perf_counter()
+        out = await graph.ainvoke({"messages": [HumanMessage(question)]})
+        results.append((time.perf_counter() - start, out["cypher_result"]))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, nargs="+", default=[1, 2, 3, 4, 5])
+    parser.add_argument("--vote", choices=["first", "majority"], default="first")
+    parser.add_argument("--questions", type=int, default=30)
+    parser.add_argument("--p-correct", type=float, default=0.5)
+    parser.add_argument("--llm-delay", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    pairs = load_questions(args.questions, args.seed)
+    solutions = dict(pairs)
+    guard = QueryGuard(load_schema("src/agents/iypchat/schema/neo4j-schema.json").index)
+    # Rows of a solution, as the guard sends it
+    answers = {fixture_key(guard.check(query).query): i for i, (_, query) in enumerate(pairs)}
+    expected = {question: [{"answer": i}] for i, (question, _) in enumerate(pairs)}
+
+    def respond(body: dict) -> tuple[int, dict]:
+        answer = answers.get(fixture_key(body["statement"]))
+        values = [] if answer is None else [[answer]]
+        return 202, {"data": {"fields": ["answer"], "values": values}, "bookmarks": []}
+
+    def reply(body: dict) -> str:
+        messages = body["messages"]
+        if not messages[0]["content"].startswith("Task:Generate Cypher"):
+            # Entity extraction and presentation, not measured
+            return "AS"
+        rng = random.Random()
+        time.sleep(args.llm_delay * rng.uniform(0.5, 1.5))
+        return sample(messages[1]["content"], body.get("temperature", 0.0), solutions, args)
+
+    async def main(llm_url: str, iyp_url: str):
+        print(f"{len(pairs)} questions, vote {args.vote}\n")
+        print(f"{'N':>3}{'accuracy':>10}{'p50':>9}{'p95':>9}")
+        for n in args.n:
+            model_params = ModelParams(base_url=llm_url, api_key="stand-in", iyp=IYPSettings(url=iyp_url))
+            graph = get_iyp_graph(model_params=model_params, max_repairs=0, candidates=n, vote=args.vote)
+            get_result_cache().clear()
+            results = await run(graph, [question for question, _ in pairs])
+            accuracy = sum(rows == expected[q] for (q, _), (_, rows) in zip(pairs, results)) / len(pairs)
+            latencies = sorted(seconds for seconds, _ in results)
+            p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+            print(f"{n:>3}{accuracy:>10.0%}{statistics.median(latencies) * 1e3:>7.0f}ms{p95 * 1e3:>7.0f}ms")
+
+    with LLMStandIn(reply=reply) as llm, IYPStandIn(respond=respond) as iyp:
+        asyncio.run(main(llm.url, iyp.url))
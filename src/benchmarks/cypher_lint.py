@@ -0,0 +1,106 @@
+"""Offline Cypher linting of the CypherEval canonical solutions, and of broken copies of them.
+
+Canonical solutions are expected to pass untouched. Each is then broken the
+way generated queries often are: a label in lower case, a directed relationship
+written backwards, a misspelled property and a label that does not exist.
+Reports how many broken queries are caught, how many repaired back to the
+canonical solution, and the linting latency. Also reports how many canonical
+solutions the query guard rewrites or rejects with the default settings.
+
+python -m src.benchmarks.cypher_lint
+"""
+import argparse
+import logging
+import re
+import time
+
+from src.agents.iypchat.cypher_lint import CypherLinter
+from src.agents.iypchat.prompts.templates import load_cyphereval
+from src.agents.iypchat.query_guard import QueryGuard
+from src.agents.iypchat.schema.schema import load_schema
+
+LABEL_RE = re.compile(r"(?<=\w):([A-Z][A-Za-z]+)(?=[\s){])")
+ARROW_RE = re.compile(r"\]->|<-\[")
+PROPERTY_RE = re.compile(r"(?<=\w\.)([a-z_]+)\b")
+
+
+def lowercase_label(query: str) -> str:
+    return LABEL_RE.sub(lambda m: ":" + m.group(1).lower(), query, count=1)
+
+
+def reverse_relationship(query: str) -> str:
+    match = ARROW_RE.search(query)
+    if match is None:
+        return query
+    if match.group() == "]->":
+        start = query.rfind("-[", 0, match.start())
+        return query[:start] + "<-[" + query[start + 2 : match.start()] + "]-" + query[match.end() :]
+    end = query.find("]-", match.end())
+    return query[: match.start()] + "-[" + query[match.end() : end] + "]->" + query[end + 2 :]
+
+
+STRING_RE = re.compile(r"'[^']*'|\"[^\"]*\"")
+
+
+def misspell_property(query: str) -> str:
+    # Only outside string literals, 'google.com' is not a property access
+    parts = STRING_RE.split(query)
+    strings = STRING_RE.findall(query)
+    for i, part in enumerate(parts):
+        mutated = PROPERTY_RE.sub(lambda m: m.group(1) + "x", part, count=1)
+        if mutated != part:
+            parts[i] = mutated
+            break
+    return "".join(part + (strings[i] if i < len(strings) else "") for i, part in enumerate(parts))
+
+
+def unknown_label(query: str) -> str:
+    return LABEL_RE.sub(":Router", query, count=1)
+
+
+MUTATIONS = {
+    "lowercase label": lowercase_label,
+    "reversed relationship": reverse_relationship,
+    "misspelled property": misspell_property,
+    "unknown label": unknown_label,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    index = load_schema("src/agents/iypchat/schema/neo4j-schema.json").index
+    linter = CypherLinter(index)
+    canonical = load_cyphereval()["Canonical Solution"].tolist()
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        results = [linter.lint(query) for query in canonical]
+    per_query = (time.perf_counter() - start) / (args.repeat * len(canonical))
+    flagged = sum(bool(result.issues) for result in results)
+    print(f"canonical solutions   {len(canonical)}, flagged {flagged}, {per_query * 1e6:.0f}us/query\n")
+
+    print(f"{'mutation':<24}{'queries':>8}{'caught':>8}{'repaired':>10}{'rejected':>10}")
+    for name, mutate in MUTATIONS.items():
+        broken = [(query, mutated) for query in canonical if (mutated := mutate(query)) != query]
+        results = [(query, linter.lint(mutated)) for query, mutated in broken]
+        caught = sum(bool(result.issues) for _, result in results)
+        repaired = sum(result.ok and result.query == query for query, result in results)
+        rejected = sum(not result.ok for _, result in results)
+        print(f"{name:<24}{len(broken):>8}{caught:>8}{repaired:>10}{rejected:>10}")
+
+    guard = QueryGuard(index)
+    # The guard logs every rejection, once per repeat, they are listed once below instead
+    logging.getLogger(QueryGuard.__module__).setLevel(logging.ERROR)
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        guarded = [guard.check(query) for query in canonical]
+    per_query = (time.perf_counter() - start) / (args.repeat * len(canonical))
+    rewritten = sum(not result.rejected and result.query != result.original for result in guarded)
+    rejected = sum(result.rejected for result in guarded)
+    print(f"\nquery guard           {len(canonical)}, rewritten {rewritten}, rejected {rejected}, {per_query * 1e6:.0f}us/query")
+    # CypherEval repeats some canonical solutions, list each rejected query once
+    for query, reason in {result.original: result.decisions[-1] for result in guarded if result.rejected}.items():
+        print(f"  rejected: {reason}\n    {query}")
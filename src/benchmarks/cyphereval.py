@@ -0,0 +1,269 @@
+"""CypherEval harness: runs the iypchat graph over the dataset and reports latency, tokens and accuracy.
+
+Every question goes through `get_iyp_graph`, `--concurrency` at a time. Each run records:
+- the wall time of entity_extractor and iyp_presenter;
+- the LLM time and the IYP query time of iyp_assistant, repairs included;
+- the prompt and completion tokens of all LLM calls;
+- whether the result equals that of the canonical solution, as a set of rows with column names ignored.
+
+Canonical results are computed once and kept in `--canonical-cache`. With
+`--backend fixtures` every IYP answer comes from `--fixtures`: record them once
+with `--record` (online), then replay offline. The few-shot examples are drawn
+from CypherEval itself, so the accuracy is optimistic.
+
+The report (`--report`, .json or .csv) has p50/p95 latencies per difficulty
+level. The JSON one also lists every question.
+
+python -m src.benchmarks.cyphereval --limit 50 --concurrency 4 --report cyphereval.json
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import statistics
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, get_args
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import HumanMessage
+
+from src.agents.iypchat.backends import get_iyp_backend
+from src.agents.iypchat.iypchat import get_iyp_graph
+from src.agents.iypchat.prompts.templates import load_cyphereval, ordered_levels
+from src.agents.iypchat.query_iyp import astream_iyp_query
+from src.agents.utils.models import IYPSettings, ModelParams
+
+VARIATIONS = {
+    "A": "src/agents/iypchat/cyphereval/CypherEval/variation-A.csv",
+    "B": "src/agents/iypchat/cyphereval/CypherEval/variation-B.csv",
+}
+CANONICAL_CACHE_PATH = "data/cyphereval_canonical.json"
+STAGES = ["entity_extractor", "iyp_assistant_llm", "iyp_query", "iyp_presenter", "total"]
+# Nodes generating Cypher
+_QUERY_NODES = ("iyp_assistant", "cypher_repair")
+
+
+class StageTimer(BaseCallbackHandler):
+    """Node and LLM times, and token counts, of one graph run"""
+
+    # Called in the graph's thread, not through an executor, so times are not skewed
+    run_inline = True
+
+    def __init__(self):
+        self.nodes: Dict[str, float] = defaultdict(float)
+        self.llm: Dict[str, float] = defaultdict(float)
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._starts: Dict[Any, tuple[str, float]] = {}
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        if node is None or kwargs.get("name") != node:
+            return
+        # The node runnable wraps a runnable of the same name, time the outer one
+        if self._starts.get(parent_run_id, ("",))[0] != node:
+            self._starts[run_id] = (node, time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        if (start := self._starts.pop(run_id, None)) is not None:
+            self.nodes[start[0]] += time.perf_counter() - start[1]
+
+    on_chain_error = on_chain_end
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        self._starts[run_id] = ((metadata or {}).get("langgraph_node", ""), time.perf_counter())
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        if (start := self._starts.pop(run_id, None)) is not None:
+            self.llm[start[0]] += time.perf_counter() - start[1]
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                self.prompt_tokens += usage.get("input_tokens", 0)
+                self.completion_tokens += usage.get("output_tokens", 0)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._starts.pop(run_id, None)
+
+    def stages(self, iyp_seconds: float, total: float) -> Dict[str, float]:
+        return {
+            "entity_extractor": self.nodes["entity_extractor"],
+            "iyp_assistant_llm": sum(self.llm[node] for node in _QUERY_NODES),
+            "iyp_query": iyp_seconds,
+            "iyp_presenter": self.nodes["iyp_presenter"],
+            "total": total,
+        }
+
+
+def normalize(rows: List[Dict]) -> frozenset:
+    """Rows as a set of sorted value tuples, column names and order do not matter"""
+    return frozenset(tuple(sorted(json.dumps(value, sort_keys=True, default=str) for value in row.values())) for row in rows)
+
+
+async def canonical_results(queries: List[str], backend, path: str, concurrency: int) -> Dict[str, Optional[List[Dict]]]:
+    """Results of the canonical solutions, None when they fail, from `path` or run and saved there"""
+    try:
+        with open(path) as f:
+            cached = json.load(f)
+    except FileNotFoundError:
+        cached = {}
+    missing = sorted(set(queries) - set(cached))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(query: str) -> None:
+        async with semaphore:
+            try:
+                # Bypass the result cache, a generated query equal to its canonical
+                # solution would otherwise be answered from memory, at no iyp_query cost
+                cached[query] = (await astream_iyp_query(query, use_cache=False, backend=backend)).rows
+            except Exception as e:
+                print(f"Canonical solution failed: {e}\n{query}")
+                cached[query] = None
+
+    await asyncio.gather(*(run(query) for query in missing))
+    if missing:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(cached, f)
+    return cached
+
+
+async def ask(graph, row: Dict, expected: Optional[List[Dict]], semaphore: asyncio.Semaphore) -> Dict:
+    """Run one question, return its report record"""
+    async with semaphore:
+        timer = StageTimer()
+        start = time.perf_counter()
+        error, out = None, {}
+        try:
+            out = await graph.ainvoke({"messages": [HumanMessage(row["Prompt"])]}, config={"callbacks": [timer]})
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        total = time.perf_counter() - start
+    rows = out.get("cypher_result")
+    correct = None
+    if expected is not None and error is None:
+        correct = rows is not None and normalize(rows) == normalize(expected)
+    return {
+        "task_id": row["Task ID"],
+        "difficulty": row["Difficulty Level"],
+        "question": row["Prompt"],
+        "cypher_query": out.get("cypher_query"),
+        "failure": out.get("cypher_failure") or None,
+        "repairs": out.get("cypher_repairs", 0),
+        "error": error,
+        "correct": correct,
+        "prompt_tokens": timer.prompt_tokens,
+        "completion_tokens": timer.completion_tokens,
+        **timer.stages(out.get("cypher_seconds", 0.0), total),
+    }
+
+
+def _percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else float("nan")
+
+
+def summarize(records: List[Dict]) -> List[Dict]:
+    """One line per difficulty level and one for all questions"""
+    groups: Dict[str, List[Dict]] = defaultdict(list)
+    for record in records:
+        groups[record["difficulty"]].append(record)
+    levels = [level for level in ordered_levels if level in groups] + sorted(set(groups) - set(ordered_levels))
+    summary = []
+    for level, group in [(level, groups[level]) for level in levels] + [("all", records)]:
+        judged = [record["correct"] for record in group if record["correct"] is not None]
+        line = {
+            "difficulty": level,
+            "questions": len(group),
+            "errors": sum(record["error"] is not None for record in group),
+            "accuracy": sum(judged) / len(judged) if judged else None,
+            "prompt_tokens": statistics.mean(record["prompt_tokens"] for record in group),
+            "completion_tokens": statistics.mean(record["completion_tokens"] for record in group),
+        }
+        for stage in STAGES:
+            values = [record[stage] for record in group]
+            line[f"{stage}_p50"] = _percentile(values, 0.5)
+            line[f"{stage}_p95"] = _percentile(values, 0.95)
+        summary.append(line)
+    return summary
+
+
+def write_report(path: str, summary: List[Dict], records: List[Dict], settings: Dict) -> None:
+    if path.endswith(".csv"):
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(summary[0]))
+            writer.writeheader()
+            writer.writerows(summary)
+        return
+    with open(path, "w") as f:
+        json.dump({"settings": settings, "summary": summary, "questions": records}, f, indent=1, default=str)
+
+
+def print_summary(summary: List[Dict]) -> None:
+    print(f"{'difficulty':<26}{'n':>4}{'acc':>6}{'tokens in/out':>15}" + "".join(f"{stage[:16]:>18}" for stage in STAGES))
+    print(f"{'':<51}" + "".join(f"{'p50/p95 ms':>18}" for _ in STAGES))
+    for line in summary:
+        accuracy = f"{line['accuracy']:.0%}" if line["accuracy"] is not None else "-"
+        tokens = f"{line['prompt_tokens']:.0f}/{line['completion_tokens']:.0f}"
+        times = "".join(f"{line[f'{s}_p50'] * 1e3:>10.0f}/{line[f'{s}_p95'] * 1e3:<7.0f}" for s in STAGES)
+        print(f"{line['difficulty']:<26}{line['questions']:>4}{accuracy:>6}{tokens:>15}{times}")
+
+
+async def main(args) -> None:
+    iyp = IYPSettings(
+        backend=args.backend,
+        fixtures_path=args.fixtures,
+        record_fixtures=args.record,
+        # Questions come twice (variations A and B), the second run of a query must pay iyp_query too
+        result_cache=False,
+        **({"url": args.iyp_url} if args.iyp_url else {}),
+    )
+    model_params = ModelParams(base_url=args.base_url, api_key=args.api_key, model=args.model, iyp=iyp)
+    graph = get_iyp_graph(
+        model_params=model_params,
+        few_shot=args.few_shot,
+        max_repairs=args.max_repairs,
+        candidates=args.candidates,
+    )
+
+    dataset = load_cyphereval([VARIATIONS[v] for v in args.variations])
+    if args.difficulty:
+        dataset = dataset[dataset["Difficulty Level"].isin(args.difficulty)]
+    rows = dataset.head(args.limit).to_dict("records") if args.limit else dataset.to_dict("records")
+
+    start = time.perf_counter()
+    expected = await canonical_results(
+        [row["Canonical Solution"] for row in rows], get_iyp_backend(iyp), args.canonical_cache, args.concurrency
+    )
+    print(f"Canonical results of {len(rows)} questions in {time.perf_counter() - start:.1f}s\n")
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    records = await asyncio.gather(*(ask(graph, row, expected[row["Canonical Solution"]], semaphore) for row in rows))
+    summary = summarize(records)
+    print_summary(summary)
+    if args.report:
+        write_report(args.report, summary, records, {k: v for k, v in vars(args).items() if k != "api_key"})
+        print(f"\nReport written to {args.report}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--variations", nargs="+", choices=sorted(VARIATIONS), default=sorted(VARIATIONS))
+    parser.add_argument("--difficulty", nargs="+", help='Levels to keep, e.g. "Easy technical prompt"')
+    parser.add_argument("--limit", type=int, help="Max questions, in dataset order")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--base-url", default=ModelParams().base_url)
+    parser.add_argument("--api-key", default=ModelParams().api_key)
+    parser.add_argument("--model", choices=get_args(ModelParams.model_fields["model"].annotation), default=ModelParams().model)
+    parser.add_argument("--few-shot", default="overlap")
+    parser.add_argument("--max-repairs", type=int, default=2)
+    parser.add_argument("--candidates", type=int, default=1)
+    parser.add_argument("--backend", choices=["http", "bolt", "fixtures"], default="http")
+    parser.add_argument("--iyp-url", help="IYP query API, for the http backend and recording")
+    parser.add_argument("--fixtures", default=IYPSettings().fixtures_path)
+    parser.add_argument("--record", action="store_true", help="Record the answers missing from --fixtures")
+    parser.add_argument("--canonical-cache", default=CANONICAL_CACHE_PATH)
+    parser.add_argument("--report", help="Report file, .json or .csv")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,49 @@
+"""How many CypherEval questions the rule-based entity extractor answers alone, and how well.
+
+Labels of the canonical solution are the reference (compared case-insensitively,
+the schema spells HostName): recall is the share of them found, precision the
+share of extracted labels they use. The same questions are then run in lower
+case, without the capitals the rules read as names.
+
+python -m src.benchmarks.entity_extraction
+"""
+import argparse
+import time
+
+from src.agents.iypchat.entities import extract_entities
+from src.agents.iypchat.prompts.templates import get_cypher_labels, load_cyphereval
+
+
+def report(extractions: list, references: list) -> None:
+    confident = [(e, ref) for e, ref in zip(extractions, references) if e.confident]
+    found = sum(len({label.lower() for label in e.entities} & ref) for e, ref in confident)
+    print(f"rules path           {len(confident)} ({len(confident) / len(extractions):.0%})")
+    print(f"llm fallback         {len(extractions) - len(confident)}")
+    print(f"rules recall         {found / max(sum(len(ref) for _, ref in confident), 1):.0%}")
+    print(f"rules precision      {found / max(sum(len(e.entities) for e, _ in confident), 1):.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    cyphereval = load_cyphereval()
+    questions = cyphereval["Prompt"].tolist()
+    references = [
+        {label.lower() for label in get_cypher_labels(cypher)}
+        for cypher in cyphereval["Canonical Solution"]
+    ]
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        extractions = [extract_entities(question) for question in questions]
+    per_call = (time.perf_counter() - start) / (args.repeat * len(questions))
+
+    print(f"questions            {len(questions)}")
+    report(extractions, references)
+    print(f"extraction latency   {per_call * 1e6:.0f}us/question")
+
+    # Capitalization is a clue for names, check the questions without it too
+    print("\nlower case questions")
+    report([extract_entities(question.lower()) for question in questions], references)
@@ -0,0 +1,102 @@
+"""Cost of turning a Neo4j Query API payload into rows for the LLM.
+
+python -m src.benchmarks.format_response --rows 10000 100000
+"""
+import argparse
+import gc
+import time
+
+from src.agents.iypchat.query_iyp import format_response
+
+REFERENCE = {
+    "reference_org": "BGP.Tools",
+    "reference_url_data": "https://bgp.tools/asns.csv",
+    "reference_url_info": "https://bgp.tools/kb/api",
+    "reference_time_fetch": "2025-05-13T00:00:00Z",
+    "reference_time_modification": "2025-05-12T00:00:00Z",
+    "reference_name": "bgptools.as_names",
+}
+TO_REMOVE = list(REFERENCE) + ["reference_url"]
+
+
+def synthetic_payload(n_rows: int) -> dict:
+    """AS -[MEMBER_OF]-> IXP rows, plus a list column and a scalar column"""
+    values = []
+    for i in range(n_rows):
+        as_node = {"elementId": f"4:{i}", "labels": ["AS"], "properties": {"asn": i}}
+        member_of = {
+            "elementId": f"5:{i}",
+            "startNodeElementId": f"4:{i}",
+            "endNodeElementId": "4:0",
+            "type": "MEMBER_OF",
+            "properties": dict(REFERENCE),
+        }
+        ixp = {"elementId": "4:0", "labels": ["IXP"], "properties": {"name": "DE-CIX Frankfurt"}}
+        tags = [{"elementId": "6:0", "labels": ["Tag"], "properties": {"label": "ISP"}}]
+        values.append([as_node, member_of, ixp, tags, i % 7])
+    return {"fields": ["as", "r", "ixp", "tags", "rank"], "values": values}
+
+
+def baseline(results: dict, skip_unfilterable: bool = False) -> list:
+    """Previous implementation: format, then filter in a second pass"""
+    result_list = []
+    keys = results["fields"]
+    for row in results["values"]:
+        obj = {}
+        for i, row_val in enumerate(row):
+            if isinstance(row_val, dict):
+                obj[keys[i]] = row_val.get("properties", row_val)
+            elif isinstance(row_val, list):
+                obj[keys[i]] = [
+                    val["properties"] if isinstance(val, dict) and "properties" in val else val
+                    for val in row_val
+                ]
+            else:
+                obj[keys[i]] = row_val
+        result_list.append(obj)
+    try:
+        for elem in result_list:
+            for key, val in elem.items():
+                if skip_unfilterable and not isinstance(val, dict):
+                    continue
+                for remove_me in TO_REMOVE:
+                    val.pop(remove_me, None)
+    except (AttributeError, TypeError):
+        # Scalar and list columns made the second pass crash on the first row
+        pass
+    return result_list
+
+
+def timed(fn, n_rows: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        # Fresh payload, the baseline mutates it
+        payload = synthetic_payload(n_rows)
+        gc.collect()
+        gc.disable()
+        start = time.perf_counter()
+        fn(payload)
+        best = min(best, time.perf_counter() - start)
+        gc.enable()
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    candidates = {
+        "baseline (2 passes)": baseline,
+        "baseline, full filter": lambda p: baseline(p, skip_unfilterable=True),
+        "format_response": format_response,
+        "format_response columnar": lambda p: format_response(p, columnar=True),
+    }
+    for n_rows in args.rows:
+        for name, fn in candidates.items():
+            best = timed(fn, n_rows, args.repeat)
+            print(
+                f"{n_rows:>7} rows {name:<26} {best * 1e3:8.1f}ms "
+                f"({best / n_rows * 1e9:6.0f}ns/row)"
+            )
@@ -0,0 +1,117 @@
+"""Load test of the agent graphs on recorded LLM and IYP answers, without network.
+
+Record once, with the LLM server and the IYP API reachable: each graph answers
+its question and every LLM response goes to `--tape`, every IYP answer to
+`--fixtures`.
+
+python -m src.benchmarks.graph_replay --record --base-url http://localhost:11434/v1
+
+Then replay anywhere: `--users` sessions ask their graph's question at the same
+time, the LLM answers after the recorded delay (`--latency` to override it,
+`--latency-scale` to speed it up) and IYP after `--iyp-latency`. Only the HTTP
+calls are replayed, tools still run: keep to questions answered by the LLM and
+IYP, tools answering differently on every run (time, ping) change the next LLM
+request, which is then missing from the tape.
+
+python -m src.benchmarks.graph_replay --users 1 10 50
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import get_args
+
+from langchain_core.messages import HumanMessage
+
+from src.agents.data_retriever.data_retriever import get_data_retriever_graph
+from src.agents.iypchat.backends import get_iyp_backend
+from src.agents.iypchat.iypchat import get_iyp_graph
+from src.agents.network_operator.network_operator import get_network_operator_graph
+from src.agents.supervisor.supervisor import get_supervisor_graph
+from src.agents.utils.graphs import shared_graph
+from src.agents.utils.models import IYPSettings, ModelParams, ReplaySettings
+
+GRAPHS = {
+    "supervisor": get_supervisor_graph,
+    "data_retriever": get_data_retriever_graph,
+    "network_operator": get_network_operator_graph,
+    "iypchat": get_iyp_graph,
+}
+QUESTIONS = {
+    "supervisor": "Which IXPs is AS2497 a member of?",
+    "data_retriever": "Which IXPs is AS2497 a member of?",
+    "network_operator": "Which tools do you have?",
+    "iypchat": "Which IXPs is AS2497 a member of?",
+}
+
+
+async def ask(graph, question: str) -> float:
+    start = time.perf_counter()
+    await graph.ainvoke({"messages": [HumanMessage(question)]})
+    return time.perf_counter() - start
+
+
+async def load(graph, question: str, n_users: int) -> tuple[float, list[float]]:
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(ask(graph, question) for _ in range(n_users)))
+    return time.perf_counter() - start, sorted(latencies)
+
+
+def model_params(args) -> ModelParams:
+    replay = ReplaySettings(
+        mode="record" if args.record else "replay",
+        path=args.tape,
+        latency=args.latency,
+        latency_scale=args.latency_scale,
+        jitter=args.jitter,
+    )
+    iyp = IYPSettings(
+        backend="fixtures",
+        fixtures_path=args.fixtures,
+        record_fixtures=args.record,
+        fixtures_latency=args.iyp_latency,
+        # Every query pays --iyp-latency, not only the first run of each statement
+        result_cache=False,
+        **({"url": args.iyp_url} if args.iyp_url else {}),
+    )
+    return ModelParams(base_url=args.base_url, api_key=args.api_key, model=args.model, iyp=iyp, replay=replay)
+
+
+async def main(args) -> None:
+    params = model_params(args)
+    if args.record:
+        for name in args.graphs:
+            seconds = await ask(shared_graph(GRAPHS[name], params), QUESTIONS[name])
+            print(f"{name:<17} recorded in {seconds:.1f}s")
+        # Close the IYP sessions of this loop, their cache threads would keep the process alive
+        await get_iyp_backend(params.iyp).aclose()
+        return
+
+    print(f"{'graph':<17}{'users':>6}{'chats/s':>9}{'p50':>9}{'p95':>9}")
+    for name in args.graphs:
+        graph = shared_graph(GRAPHS[name], params)
+        for n_users in args.users:
+            elapsed, latencies = await load(graph, QUESTIONS[name], n_users)
+            p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+            print(
+                f"{name:<17}{n_users:>6}{n_users / elapsed:>9.1f}"
+                f"{statistics.median(latencies) * 1e3:>7.0f}ms{p95 * 1e3:>7.0f}ms"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--graphs", nargs="+", choices=list(GRAPHS), default=list(GRAPHS))
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--record", action="store_true", help="Call the LLM and IYP, recording their answers")
+    parser.add_argument("--tape", default=ReplaySettings().path)
+    parser.add_argument("--fixtures", default="data/graph_replay_iyp.json")
+    parser.add_argument("--latency", type=float, help="Seconds per LLM response, defaults to the recorded ones")
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--iyp-latency", type=float, default=0.0)
+    parser.add_argument("--base-url", default=ModelParams().base_url)
+    parser.add_argument("--api-key", default=ModelParams().api_key)
+    parser.add_argument("--model", choices=get_args(ModelParams.model_fields["model"].annotation), default=ModelParams().model)
+    parser.add_argument("--iyp-url", help="IYP query API to record from")
+    asyncio.run(main(parser.parse_args()))
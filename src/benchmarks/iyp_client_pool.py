@@ -0,0 +1,85 @@
+"""Per-query latency of IYP calls with and without the pooled IYPClient.
+
+python -m src.benchmarks.iyp_client_pool --queries 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from src.agents.iypchat.iyp_client import IYPClient
+from src.benchmarks.iyp_stand_in import IYPStandIn
+
+
+def summarize(name: str, latencies: list[float], connections: int):
+    latencies = sorted(latencies)
+    p95 = latencies[int(0.95 * (len(latencies) - 1))]
+    print(
+        f"{name:<28} mean={statistics.mean(latencies) * 1e3:7.3f}ms "
+        f"p50={statistics.median(latencies) * 1e3:7.3f}ms "
+        f"p95={p95 * 1e3:7.3f}ms connections={connections}"
+    )
+
+
+def bench_sync(url: str, n: int, pooled: bool, use_cache: bool, cache_name: str):
+    latencies = []
+    client = IYPClient(base_url=url, cache_name=cache_name)
+    for i in range(n):
+        # Unique statements so the HTTP cache never answers for the server
+        statement = f"MATCH (n) RETURN n LIMIT {i + 1}"
+        start = time.perf_counter()
+        if pooled:
+            client.query(statement, use_cache=use_cache)
+        else:
+            # Previous behaviour: a new session per call
+            fresh = IYPClient(base_url=url, cache_name=cache_name)
+            fresh.query(statement, use_cache=use_cache)
+            fresh.close()
+        latencies.append(time.perf_counter() - start)
+    client.close()
+    return latencies
+
+
+async def bench_async(url: str, n: int, pooled: bool):
+    latencies = []
+    client = IYPClient(base_url=url)
+    for i in range(n):
+        statement = f"MATCH (n) RETURN n LIMIT {i + 1}"
+        start = time.perf_counter()
+        if pooled:
+            await client.aquery(statement, use_cache=False)
+        else:
+            fresh = IYPClient(base_url=url)
+            await fresh.aquery(statement, use_cache=False)
+            await fresh.aclose()
+        latencies.append(time.perf_counter() - start)
+    await client.aclose()
+    return latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_name = os.path.join(tmp, "iyp_cache")
+        for use_cache in (False, True):
+            for pooled in (False, True):
+                with IYPStandIn() as stand_in:
+                    latencies = bench_sync(
+                        stand_in.url, args.queries, pooled, use_cache, cache_name
+                    )
+                    name = f"sync {'pooled' if pooled else 'per-call'}{' +cache' if use_cache else ''}"
+                    summarize(name, latencies, stand_in.connections)
+
+    for pooled in (False, True):
+        with IYPStandIn() as stand_in:
+            latencies = asyncio.run(bench_async(stand_in.url, args.queries, pooled))
+            summarize(
+                f"async {'pooled' if pooled else 'per-call'}",
+                latencies,
+                stand_in.connections,
+            )
@@ -0,0 +1,85 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+
+# Minimal Neo4j Query API v2 body, shaped like the IYP answers
+DEFAULT_RESPONSE = {
+    "data": {
+        "fields": ["ixp.name"],
+        "values": [["Equinix Los Angeles"], ["DE-CIX Frankfurt"]],
+    },
+    "bookmarks": [],
+}
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops connections opened by concurrent benchmarks
+    request_queue_size = 128
+
+
+class IYPStandIn:
+    """Local HTTP/1.1 stand-in for the IYP query API, used by the benchmarks.
+
+    Args:
+        respond: Callable mapping the decoded request body to (status, body).
+            Defaults to a 202 with `DEFAULT_RESPONSE`.
+        delay: Seconds the server waits before answering, to mimic server-side work.
+    """
+
+    def __init__(
+        self,
+        respond: Optional[Callable[[Dict], tuple[int, Dict]]] = None,
+        delay: float = 0.0,
+    ):
+        self.respond = respond or (lambda body: (202, DEFAULT_RESPONSE))
+        self.delay = delay
+        self.connections = 0
+        self.requests = 0
+
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive requires HTTP/1.1
+            protocol_version = "HTTP/1.1"
+            # Headers and body are separate writes, avoid Nagle/delayed-ACK stalls
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                stand_in.connections += 1
+
+            def do_POST(self):
+                stand_in.requests += 1
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if stand_in.delay:
+                    time.sleep(stand_in.delay)
+                status, payload = stand_in.respond(body)
+                raw = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                try:
+                    self.wfile.write(raw)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Client aborted the transfer on purpose
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = _Server(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/query/v2"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,122 @@
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+
+DEFAULT_REPLY = "Pong. The host answered every request."
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops connections opened by concurrent benchmarks
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        # Cancelled requests reset their connection, nothing went wrong here
+        if not isinstance(sys.exc_info()[1], ConnectionResetError):
+            super().handle_error(request, client_address)
+
+
+class LLMStandIn:
+    """Local OpenAI-compatible chat completions endpoint, used by the benchmarks.
+
+    Answers `/v1/chat/completions` with a fixed assistant message, as a single
+    JSON body or as server-sent events when the request asks for a stream.
+
+    Args:
+        reply: Callable mapping the decoded request body to the assistant content.
+            Defaults to `DEFAULT_REPLY`.
+        delay: Seconds the server waits before answering, to mimic generation time.
+    """
+
+    def __init__(self, reply: Optional[Callable[[Dict], str]] = None, delay: float = 0.0):
+        self.reply = reply or (lambda body: DEFAULT_REPLY)
+        self.delay = delay
+        self.requests = 0
+
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                stand_in.requests += 1
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if stand_in.delay:
+                    time.sleep(stand_in.delay)
+                content = stand_in.reply(body)
+                model = body.get("model", "stand-in")
+                if body.get("stream"):
+                    raw = _sse(model, content)
+                    content_type = "text/event-stream"
+                else:
+                    raw = json.dumps(_completion(model, content)).encode()
+                    content_type = "application/json"
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                try:
+                    self.wfile.write(raw)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = _Server(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _completion(model: str, content: str) -> Dict:
+    return {
+        "id": "chatcmpl-stand-in",
+        "object": "chat.completion",
+        "created": 0,
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+    }
+
+
+def _sse(model: str, content: str) -> bytes:
+    """One event per word, then the stop chunk"""
+    events = []
+    words = content.split(" ")
+    for i, word in enumerate(words):
+        delta = {"content": word if i == 0 else " " + word}
+        if i == 0:
+            delta["role"] = "assistant"
+        events.append(_chunk(model, delta, None))
+    events.append(_chunk(model, {}, "stop"))
+    lines = [f"data: {json.dumps(event)}\n\n" for event in events] + ["data: [DONE]\n\n"]
+    return "".join(lines).encode()
+
+
+def _chunk(model: str, delta: Dict, finish_reason: Optional[str]) -> Dict:
+    return {
+        "id": "chatcmpl-stand-in",
+        "object": "chat.completion.chunk",
+        "created": 0,
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
@@ -0,0 +1,42 @@
+"""Per-request cost of projecting the IYP schema for the Cypher prompt.
+
+python -m src.benchmarks.schema_prompt --requests 500
+"""
+import argparse
+import random
+import time
+
+from src.agents.iypchat.schema.schema import Neo4jSchema, SchemaIndex
+
+SCHEMA_PATH = "src/agents/iypchat/schema/neo4j-schema.json"
+
+
+def bench(name: str, fn, requests: list[list[str]]):
+    start = time.perf_counter()
+    for entities in requests:
+        fn(entities)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<34} {elapsed / len(requests) * 1e6:10.1f}us/request")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    schema = Neo4jSchema.from_json(SCHEMA_PATH)
+    labels = schema.get_labels()
+    random.seed(0)
+    # Entity extraction usually yields 1 to 4 labels
+    requests = [random.sample(labels, random.randint(1, 4)) for _ in range(args.requests)]
+
+    bench(
+        "pandas filter_labels + to_llm",
+        lambda e: schema.filter_labels(e, common_rel_mode="and").to_llm(),
+        requests,
+    )
+    start = time.perf_counter()
+    index = SchemaIndex(schema)
+    print(f"{'SchemaIndex build (once)':<34} {(time.perf_counter() - start) * 1e6:10.1f}us")
+    bench("SchemaIndex.to_llm, cold cache", index.to_llm, requests)
+    bench("SchemaIndex.to_llm, warm cache", index.to_llm, requests)
@@ -0,0 +1,69 @@
+"""Cost of opening a chat session: graph construction and first streamed token.
+
+"rebuild" clears the graph, client and schema caches before every session, as
+when each chat compiled its own graphs. "shared" binds the cached graphs to a
+fresh checkpointer. The LLM is a local OpenAI-compatible stand-in.
+
+python -m src.benchmarks.session_startup --sessions 20
+"""
+import argparse
+import statistics
+import time
+
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+
+from src.agents.iypchat.schema.schema import load_schema
+from src.agents.supervisor.supervisor import get_supervisor_graph
+from src.agents.utils.graphs import clear_graphs, session_graph
+from src.agents.utils.models import ModelParams, get_chat_model
+from src.benchmarks.llm_stand_in import LLMStandIn
+
+
+def clear_caches() -> None:
+    clear_graphs()
+    get_chat_model.cache_clear()
+    load_schema.cache_clear()
+
+
+def open_session(model_params: ModelParams, rebuild: bool, session: int) -> tuple[float, float]:
+    """Return (startup, first token) seconds of a new session answering one message"""
+    if rebuild:
+        clear_caches()
+    start = time.perf_counter()
+    graph = session_graph(get_supervisor_graph, model_params, checkpointer=InMemorySaver())
+    startup = time.perf_counter() - start
+
+    config = {"configurable": {"thread_id": str(session)}}
+    first_token = None
+    for msg, metadata in graph.stream(
+        {"messages": [HumanMessage("Ping google.com")]},
+        stream_mode="messages",
+        config=config,
+    ):
+        if first_token is None and msg.content:
+            first_token = time.perf_counter() - start
+    return startup, first_token
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=20)
+    args = parser.parse_args()
+
+    with LLMStandIn() as llm:
+        model_params = ModelParams(base_url=llm.url, api_key="stand-in")
+        # Warm imports and lazy module state once
+        open_session(model_params, rebuild=True, session=-1)
+
+        for mode in ("rebuild", "shared"):
+            timings = [
+                open_session(model_params, rebuild=mode == "rebuild", session=i)
+                for i in range(args.sessions)
+            ]
+            startup = statistics.median(t for t, _ in timings)
+            first_token = statistics.median(t for _, t in timings)
+            print(
+                f"{mode:<8} startup {startup * 1e3:8.2f}ms   "
+                f"first token {first_token * 1e3:8.2f}ms   (median of {args.sessions})"
+            )
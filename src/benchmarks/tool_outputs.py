@@ -0,0 +1,84 @@
+"""Prompt tokens of each tool result, raw command output vs the compact formats.
+
+The results are parsed from recorded outputs in `fixtures/tool_outputs/`.
+Tokens are counted with tiktoken's cl100k_base encoding when it can be loaded,
+with a word/punctuation approximation otherwise (the counter is printed).
+
+python -m src.benchmarks.tool_outputs
+"""
+import json
+import re
+from pathlib import Path
+
+from src.agents.data_retriever.data_retriever import parse_whois
+from src.agents.network_operator.parsers import parse_ping, parse_routes
+from src.agents.network_operator.tools import TracerouteProgress
+from src.agents.utils.formats import OUTPUT_FORMATS, TOOL_OUTPUT_FORMAT, tool_output
+
+FIXTURES = Path(__file__).parent / "fixtures" / "tool_outputs"
+APPROXIMATE_TOKEN_RE = re.compile(r"\w{1,4}|[^\w\s]|\s+")
+
+
+def token_counter():
+    try:
+        import tiktoken
+
+        encoding = tiktoken.get_encoding("cl100k_base")
+        return "tiktoken cl100k_base", lambda text: len(encoding.encode(text))
+    except Exception:
+        return "approximation", lambda text: len(APPROXIMATE_TOKEN_RE.findall(text))
+
+
+def ping(fmt: str) -> str:
+    raw = (FIXTURES / "ping.txt").read_text()
+    return tool_output([parse_ping(raw, "google.com").to_dict()], raw=raw, fmt=fmt)
+
+
+def routing_table(fmt: str) -> str:
+    raw = (FIXTURES / "ip_route.txt").read_text()
+    return tool_output([route.to_dict() for route in parse_routes(raw)], raw=raw, fmt=fmt)
+
+
+def traceroute(fmt: str) -> str:
+    progress = TracerouteProgress("google.com", set(), max_silent_hops=5)
+    for line in (FIXTURES / "traceroute.txt").read_text().splitlines():
+        progress.feed(line)
+    return tool_output(
+        [hop.to_dict() for hop in progress.hops], raw="\n".join(progress.lines), fmt=fmt
+    )
+
+
+def whois(fmt: str) -> str:
+    raw = (FIXTURES / "whois.txt").read_text()
+    # The tool used to return the parsed dict as a Python literal
+    return tool_output([parse_whois(raw)], raw=str(parse_whois(raw)), fmt=fmt)
+
+
+def weather(fmt: str) -> str:
+    current = json.loads((FIXTURES / "weather.json").read_text())
+    return tool_output([current], raw=str(current), fmt=fmt)
+
+
+TOOLS = {
+    "ping": ping,
+    "get_routing_table": routing_table,
+    "traceroute": traceroute,
+    "whois": whois,
+    "get_current_weather": weather,
+}
+
+
+if __name__ == "__main__":
+    name, count = token_counter()
+    formats = ["raw"] + [fmt for fmt in OUTPUT_FORMATS if fmt != "raw"]
+    print(f"Tokens per tool result ({name}), saved by the default {TOOL_OUTPUT_FORMAT!r} format\n")
+    print(f"{'tool':<20}" + "".join(f"{fmt:>8}" for fmt in formats) + f"{'saved':>8}")
+    totals = dict.fromkeys(formats, 0)
+    for tool_name, render in TOOLS.items():
+        tokens = {fmt: count(render(fmt)) for fmt in formats}
+        for fmt in formats:
+            totals[fmt] += tokens[fmt]
+        saved = 1 - tokens[TOOL_OUTPUT_FORMAT] / tokens["raw"]
+        print(f"{tool_name:<20}" + "".join(f"{tokens[fmt]:>8}" for fmt in formats) + f"{saved:>8.0%}")
+    saved = 1 - totals[TOOL_OUTPUT_FORMAT] / totals["raw"]
+    print(f"{'total':<20}" + "".join(f"{totals[fmt]:>8}" for fmt in formats) + f"{saved:>8.0%}")
@@ -0,0 +1,95 @@
+import ipaddress
+import socketserver
+import threading
+import time
+from typing import Dict, List, Optional
+
+from src.agents.data_retriever.bgp_tools import COLUMNS
+
+HEADER = "AS      | IP               | BGP Prefix          | CC | Registry | Allocated  | AS Name"
+# (prefix, AS, CC, registry, allocated, AS name) announced by the stand-in
+DEFAULT_PREFIXES = [
+    ("1.1.1.0/24", "13335", "US", "ARIN", "2010-07-14", "Cloudflare, Inc."),
+    ("8.8.8.0/24", "15169", "US", "ARIN", "1992-12-01", "Google LLC"),
+    ("202.12.27.0/24", "2497", "JP", "APNIC", "1997-04-01", "Internet Initiative Japan Inc."),
+    ("2001:4860::/32", "15169", "US", "ARIN", "2005-03-14", "Google LLC"),
+]
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class WhoisStandIn:
+    """Local whois server speaking the bgp.tools verbose and bulk protocols, used by the benchmarks.
+
+    Answers `-v <resource>` queries and `begin` / `verbose` / ... / `end` bulk
+    queries from a fixed list of announced prefixes.
+
+    Args:
+        prefixes: (prefix, AS, CC, registry, allocated, AS name) tuples. Defaults to `DEFAULT_PREFIXES`.
+        delay: Seconds the server waits before answering a connection, to mimic a remote server.
+    """
+
+    def __init__(self, prefixes: Optional[List[tuple]] = None, delay: float = 0.0):
+        self.prefixes = [
+            (ipaddress.ip_network(prefix), rest) for prefix, *rest in (prefixes or DEFAULT_PREFIXES)
+        ]
+        self.delay = delay
+        self.connections = 0
+        self.queries = 0
+
+        stand_in = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                stand_in.connections += 1
+                first = self.rfile.readline().decode().strip()
+                if first == "begin":
+                    resources = []
+                    while (line := self.rfile.readline().decode().strip()) not in ("end", ""):
+                        if line != "verbose":
+                            resources.append(line)
+                else:
+                    resources = [first.removeprefix("-v").strip()]
+                if stand_in.delay:
+                    time.sleep(stand_in.delay)
+                lines = [HEADER] + [stand_in.answer(resource) for resource in resources]
+                stand_in.queries += len(resources)
+                self.wfile.write(("\n".join(lines) + "\n").encode())
+
+        self.server = _Server(("127.0.0.1", 0), Handler)
+        self.host, self.port = self.server.server_address
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def row(self, values: Dict[str, str]) -> str:
+        return " | ".join(values.get(column, "") for column in COLUMNS)
+
+    def answer(self, resource: str) -> str:
+        if resource.upper().startswith("AS"):
+            asn = resource[2:]
+            for _, (as_, cc, registry, allocated, name) in self.prefixes:
+                if as_ == asn:
+                    return self.row({"AS": asn, "CC": cc, "Registry": registry, "Allocated": allocated, "AS Name": name})
+            return self.row({"AS": asn})
+        ip = ipaddress.ip_address(resource)
+        matches = [(network, rest) for network, rest in self.prefixes if ip in network]
+        if not matches:
+            return self.row({"AS": "0", "IP": resource})
+        network, (as_, cc, registry, allocated, name) = max(matches, key=lambda match: match[0].prefixlen)
+        return self.row(
+            {
+                "AS": as_, "IP": resource, "BGP Prefix": str(network), "CC": cc,
+                "Registry": registry, "Allocated": allocated, "AS Name": name,
+            }
+        )
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
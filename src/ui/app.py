@@ -1,6 +1,6 @@
 import chainlit as cl
 import json
-import asyncio
+import os
 import re
 from langchain.schema.runnable.config import RunnableConfig
 from langgraph.checkpoint.memory import InMemorySaver
@@ -16,9 +16,15 @@ from src.agents.network_operator.network_operator import get_network_operator_gr
 from src.agents.data_retriever.data_retriever import get_data_retriever_graph
 from src.agents.iypchat.iypchat import get_iyp_graph
 from src.agents.utils.models import ModelParams
+from src.agents.utils.graphs import session_graph
+from src.agents.utils.telemetry import enable_telemetry
 
 # python -m chainlit run src/ui/app.py -w
 
+# Agent metrics at http://127.0.0.1:<port>/metrics, for Prometheus
+if os.environ.get("AGENT_METRICS_PORT"):
+    enable_telemetry(port=int(os.environ["AGENT_METRICS_PORT"]))
+
 
 def extract_tool(content: str):
     extracted = re.findall(r"<tool>(.*?)</tool>", content, flags=re.DOTALL)
@@ -81,8 +87,9 @@ agents = {"Multi-Agent": get_supervisor_graph,
 @cl.on_chat_start
 async def start_chat():
     cl.user_session.set("message_history", [])
+    # Compiled graphs are shared by all sessions, only the checkpointer is per session
     checkpointer = InMemorySaver()
-    cl.user_session.set("agent", get_supervisor_graph(checkpointer=checkpointer))
+    cl.user_session.set("agent", session_graph(get_supervisor_graph, checkpointer=checkpointer))
 
     settings = await cl.ChatSettings(
         [
@@ -118,7 +125,7 @@ async def setup_agent(settings):
     
     cl.user_session.set(
         "agent",
-        agents[settings["agent"]](checkpointer=checkpointer, model_params=model_params),
+        session_graph(agents[settings["agent"]], model_params, checkpointer=checkpointer),
     )
 
 
@@ -130,6 +137,18 @@ async def on_tool(action):
     await cl.Message(tool_res).send()
 
 
+async def show_tool_progress(tool_steps: dict, event: dict):
+    """Append a custom stream event line to the step of its tool run"""
+    key = (event.get("tool"), event.get("host"))
+    step = tool_steps.get(key)
+    if step is None:
+        step = cl.Step(name=f"{key[0]} {key[1]}", type="tool")
+        step.output = ""
+        await step.send()
+        tool_steps[key] = step
+    await step.stream_token(f"{event.get('line', event)}\n")
+
+
 @cl.on_message
 async def on_message(msg: cl.Message):
     config = {"configurable": {"thread_id": cl.context.session.id}}
@@ -145,11 +164,18 @@ async def on_message(msg: cl.Message):
 
     graph = cl.user_session.get("agent")
 
-    for msg, metadata in graph.stream(
+    # Tools push progress (e.g. traceroute hops) as custom events, shown in a step per tool
+    tool_steps = {}
+
+    async for mode, chunk in graph.astream(
         {"messages": message_history},
-        stream_mode="messages",
+        stream_mode=["messages", "custom"],
         config=config,
     ):
+        if mode == "custom":
+            await show_tool_progress(tool_steps, chunk)
+            continue
+        msg, metadata = chunk
         if (
             msg.content
             and not isinstance(msg, HumanMessage)
@@ -157,6 +183,9 @@ async def on_message(msg: cl.Message):
         ):
             await final_answer.stream_token(msg.content)
 
+    for step in tool_steps.values():
+        await step.update()
+
     actions = []
 
     tool_results = extract_tool(final_answer.content)
@@ -176,7 +205,7 @@ async def on_message(msg: cl.Message):
     final_answer.actions = actions
 
     # Get final_state to update the message history...
-    final_state = graph.get_state(config=config).values
+    final_state = (await graph.aget_state(config=config)).values
     message_history.append(final_state["messages"][-1])
     final_answer.content = final_state["messages"][-1].content
 
@@ -193,8 +222,6 @@ async def on_message(msg: cl.Message):
     await cl.ElementSidebar.set_elements(elements=elements)
     await cl.ElementSidebar.set_title("Agent state")
 
-    await asyncio.sleep(3)
-
     await final_answer.send()
 
 
@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+import pytest
+
+from src.agents.data_retriever.bgp_tools import WhoisCache, alookup_many, lookup_many, parse_bulk
+from src.benchmarks.whois_stand_in import HEADER, WhoisStandIn
+
+
+@pytest.fixture
+def whois():
+    with WhoisStandIn() as stand_in:
+        yield stand_in
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return WhoisCache(str(tmp_path / "whois_cache.sqlite"))
+
+
+def lookup(whois, resources, cache):
+    return lookup_many(resources, cache, server=whois.host, port=whois.port, timeout=5)
+
+
+def test_one_bulk_connection_per_batch(whois, cache):
+    results = lookup(whois, ["AS2497", "1.1.1.1", "8.8.8.8", "2001:4860::8888"], cache)
+    assert whois.connections == 1
+    assert whois.queries == 4
+    assert results["AS2497"]["AS Name"] == "Internet Initiative Japan Inc."
+    assert results["1.1.1.1"]["BGP Prefix"] == "1.1.1.0/24"
+    assert results["2001:4860::8888"]["AS"] == "15169"
+
+
+def test_async_lookup_uses_one_connection(whois, cache):
+    results = asyncio.run(alookup_many(["AS15169", "8.8.8.8"], cache, server=whois.host, port=whois.port, timeout=5))
+    assert whois.connections == 1
+    assert results["8.8.8.8"]["AS Name"] == "Google LLC"
+
+
+def test_cached_answers_open_no_connection(whois, cache):
+    lookup(whois, ["AS2497", "1.1.1.1"], cache)
+    # Same ASN, and another IP of the cached 1.1.1.0/24
+    results = lookup(whois, ["2497", "1.1.1.53"], cache)
+    assert whois.connections == 1
+    assert results["2497"]["AS"] == "2497"
+    assert results["1.1.1.53"]["IP"] == "1.1.1.53"
+    assert results["1.1.1.53"]["BGP Prefix"] == "1.1.1.0/24"
+    assert cache.stats() == {"hits": 2, "misses": 2}
+
+
+def test_expired_answers_are_queried_again(whois, tmp_path, monkeypatch):
+    cache = WhoisCache(str(tmp_path / "whois_cache.sqlite"), ttl=60)
+    lookup(whois, ["AS2497", "8.8.8.8"], cache)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert cache.get("AS2497") is None
+    assert cache.get("8.8.8.8") is None
+    lookup(whois, ["AS2497", "8.8.8.8"], cache)
+    assert whois.connections == 2
+
+
+def test_longest_prefix_match(tmp_path):
+    path = str(tmp_path / "whois_cache.sqlite")
+    cache = WhoisCache(path)
+    cache.put("10.0.0.1", {"AS": "1", "IP": "10.0.0.1", "BGP Prefix": "10.0.0.0/8"})
+    cache.put("10.1.0.1", {"AS": "2", "IP": "10.1.0.1", "BGP Prefix": "10.1.0.0/16"})
+    cache.put("2001:db8::1", {"AS": "3", "IP": "2001:db8::1", "BGP Prefix": "2001:db8::/32"})
+    # Outside any BGP prefix, not cached
+    cache.put("192.0.2.1", {"AS": "0", "IP": "192.0.2.1", "BGP Prefix": ""})
+    assert cache._lengths == {4: {8, 16}, 6: {32}}
+
+    assert cache.get("10.1.2.3")["AS"] == "2"
+    assert cache.get("10.2.3.4")["AS"] == "1"
+    assert cache.get("2001:db8:1::1")["AS"] == "3"
+    assert cache.get("11.0.0.1") is None
+    assert cache.get("192.0.2.1") is None
+
+    # Lengths are reloaded from disk
+    reopened = WhoisCache(path)
+    assert reopened._lengths == {4: {8, 16}, 6: {32}}
+    assert reopened.get("10.1.2.3")["IP"] == "10.1.2.3"
+
+
+def test_parse_bulk_skips_malformed_lines():
+    text = "\n".join(
+        [
+            HEADER,
+            "2497 | 202.12.27.33 | 202.12.27.0/24 | JP | APNIC | 1997-04-01 | Internet Initiative Japan Inc.",
+            "15169 | 8.8.8.8 | 8.8.8.0/24 | US | ARIN",
+            "garbage without separators",
+            "",
+            "13335 | not an ip | | US | ARIN | 2010-07-14 | Cloudflare, Inc.",
+            "Error: no such resource",
+        ]
+    )
+    rows = parse_bulk(text)
+    assert sorted(rows) == ["202.12.27.33", "AS13335"]
+    assert rows["202.12.27.33"]["BGP Prefix"] == "202.12.27.0/24"
+    assert rows["AS13335"]["AS Name"] == "Cloudflare, Inc."
@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from src.agents.iypchat.candidates import Candidate, arace_candidates, race_candidates
+from src.agents.iypchat.cypher_lint import CypherLinter
+from src.agents.iypchat.schema.schema import load_schema
+from src.agents.iypchat.streaming import StreamedResult
+
+QUERY = "MATCH (a:AS {asn: 2497})-[:MEMBER_OF]->(i:IXP) RETURN i.name"
+TEMPERATURES = [0.0, 0.3, 0.6]
+
+
+@pytest.fixture(scope="module")
+def lint():
+    linter = CypherLinter(load_schema("src/agents/iypchat/schema/neo4j-schema.json").index)
+    return linter.lint(QUERY)
+
+
+def outcomes(lint):
+    """First candidate raises, the second answers nothing, the third answers"""
+
+    def generate(temperature: float) -> Candidate:
+        if temperature == 0.0:
+            raise RuntimeError("LLM call failed")
+        rows = [] if temperature == 0.3 else [{"i.name": "JPNAP Tokyo"}]
+        return Candidate(None, lint, streamed=StreamedResult(rows), temperature=temperature)
+
+    return generate
+
+
+@pytest.mark.parametrize("vote", ["first", "majority"])
+def test_race_skips_failed_and_empty_candidates(lint, vote):
+    winner = race_candidates(outcomes(lint), TEMPERATURES, vote)
+    assert winner.temperature == 0.6
+    assert winner.rows == [{"i.name": "JPNAP Tokyo"}]
+
+
+@pytest.mark.parametrize("vote", ["first", "majority"])
+def test_arace_skips_failed_and_empty_candidates(lint, vote):
+    generate = outcomes(lint)
+
+    async def agenerate(temperature: float) -> Candidate:
+        # Finish in temperature order
+        await asyncio.sleep(temperature / 10)
+        return generate(temperature)
+
+    winner = asyncio.run(arace_candidates(agenerate, TEMPERATURES, vote))
+    assert winner.temperature == 0.6
+    assert winner.rows == [{"i.name": "JPNAP Tokyo"}]
+
+
+def test_race_raises_when_every_candidate_fails(lint):
+    def generate(temperature: float) -> Candidate:
+        raise RuntimeError("LLM call failed")
+
+    with pytest.raises(RuntimeError):
+        race_candidates(generate, TEMPERATURES, "majority")
@@ -0,0 +1,19 @@
+from src.agents.iypchat.entities import extract_entities
+
+
+def test_english_as_is_not_an_entity():
+    assert "AS" not in extract_entities("Include as much details as possible").entities
+
+
+def test_upper_case_as_is_an_entity():
+    assert extract_entities("Which IXPs is AS2497 a member of?").entities == ["IXP", "AS"]
+    assert "AS" in extract_entities("Find the AS with asn 2497").entities
+
+
+def test_lower_case_names_are_left_to_the_llm():
+    extraction = extract_entities("which ases does google own")
+    assert not extraction.confident
+    assert extraction.unresolved == ["google"]
+    # Common words and names matched by a rule do not count
+    assert extract_entities("what are the ip addresses for google.com?").confident
+    assert extract_entities("which ixps is as2497 a member of").confident
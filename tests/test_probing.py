@@ -0,0 +1,73 @@
+import asyncio
+import socket
+
+import pytest
+
+from src.agents.network_operator.probing import ICMPProber, ProbeError, ping_many, traceroute_many
+
+UNRESOLVABLE = "no-such-host.invalid"
+
+
+def icmp_allowed(family: int) -> bool:
+    """Whether a ping socket or a raw ICMP socket of `family` can be opened here"""
+    proto = socket.IPPROTO_ICMP if family == socket.AF_INET else socket.IPPROTO_ICMPV6
+    for kind in (socket.SOCK_DGRAM, socket.SOCK_RAW):
+        try:
+            socket.socket(family, kind, proto).close()
+            return True
+        except OSError:
+            pass
+    return False
+
+
+LOOPBACKS = [
+    pytest.param(
+        "127.0.0.1",
+        marks=pytest.mark.skipif(not icmp_allowed(socket.AF_INET), reason="ICMP sockets are not allowed"),
+    ),
+    pytest.param(
+        "::1",
+        marks=pytest.mark.skipif(
+            not socket.has_ipv6 or not icmp_allowed(socket.AF_INET6), reason="ICMPv6 sockets are not allowed"
+        ),
+    ),
+]
+
+
+@pytest.mark.parametrize("address", LOOPBACKS)
+def test_prober_ping_and_traceroute(address):
+    async def probe():
+        async with ICMPProber() as prober:
+            return await prober.ping(address, count=3, interval=0.01), await prober.traceroute(address, probes=2)
+
+    stats, hops = asyncio.run(probe())
+    assert stats.error is None
+    assert (stats.address, stats.sent, stats.received) == (address, 3, 3)
+    assert all(rtt >= 0 for rtt in stats.rtts)
+    # The target is the first hop
+    assert len(hops) == 1
+    assert hops[0].ip == address and None not in hops[0].rtts
+
+
+@pytest.mark.parametrize("address", LOOPBACKS)
+def test_ping_many_keeps_target_order(address):
+    results = asyncio.run(ping_many([UNRESOLVABLE, address], count=2, interval=0.01))
+    assert [stats.target for stats in results] == [UNRESOLVABLE, address]
+    assert results[0].error and results[0].address is None
+    assert results[1].received == 2
+
+
+@pytest.mark.parametrize("address", LOOPBACKS)
+def test_traceroute_many_maps_errors(address):
+    routes = asyncio.run(traceroute_many([address, UNRESOLVABLE], probes=1))
+    assert routes[address][-1].ip == address
+    assert isinstance(routes[UNRESOLVABLE], ProbeError)
+
+
+def test_unresolvable_host():
+    async def resolve():
+        async with ICMPProber() as prober:
+            return await prober.resolve(UNRESOLVABLE)
+
+    with pytest.raises(ProbeError, match="Cannot resolve"):
+        asyncio.run(resolve())
@@ -0,0 +1,80 @@
+import asyncio
+import json
+
+import pytest
+
+from src.agents.iypchat.backends import FixtureBackend, HTTPBackend, create_iyp_backend, fixture_key
+from src.agents.iypchat.iyp_client import IYPAPIError, IYPClient
+from src.agents.iypchat.query_iyp import astream_iyp_query, run_iyp_query, stream_iyp_query
+from src.agents.utils.models import IYPSettings
+from src.benchmarks.iyp_stand_in import DEFAULT_RESPONSE, IYPStandIn
+
+MEMBER_OF = "MATCH (:AS {asn: 2497})-[:MEMBER_OF]->(ixp:IXP) RETURN DISTINCT ixp.name"
+NAME = "MATCH (a:AS {asn: 2497})-[r:NAME]->(n:Name) RETURN a, r, n.name AS name"
+
+
+@pytest.fixture(scope="module")
+def backend():
+    # The default fixture file
+    settings = IYPSettings(backend="fixtures")
+    backend = create_iyp_backend(settings)
+    assert isinstance(backend, FixtureBackend)
+    assert backend.answers
+    return backend
+
+
+def test_query_recorded_answer(backend):
+    # Keyed by the statement with whitespace collapsed
+    rows = run_iyp_query(MEMBER_OF.replace(" RETURN", "\n    RETURN"), use_cache=False, backend=backend)
+    assert {"ixp.name": "JPNAP Tokyo"} in rows
+    assert len(rows) == 5
+
+
+def test_nodes_and_relationships_are_formatted(backend):
+    rows = run_iyp_query(NAME, use_cache=False, backend=backend)
+    # Properties only, reference_* metadata dropped
+    assert rows == [{"a": {"asn": 2497}, "r": {}, "name": "IIJ Internet Initiative Japan Inc."}]
+
+
+def test_formatting_keeps_recorded_answers(tmp_path):
+    path = tmp_path / "iyp_queries.json"
+    backend = FixtureBackend(str(path), fallback=create_iyp_backend(IYPSettings(backend="fixtures")))
+    # Recorded from the fallback, then answered from the file
+    for _ in range(2):
+        assert run_iyp_query(NAME, use_cache=False, backend=backend)[0]["r"] == {}
+    backend.record(MEMBER_OF, {"fields": ["ixp.name"], "values": [["JPNAP Tokyo"]]})
+
+    with open(path) as f:
+        recorded = json.load(f)[fixture_key(NAME)]
+    assert recorded["values"][0][1]["properties"]["reference_org"] == "BGP.Tools"
+
+
+def test_stream_recorded_answer(backend):
+    streamed = stream_iyp_query(MEMBER_OF, max_rows=2, use_cache=False, backend=backend)
+    assert streamed.rows == [{"ixp.name": "JPIX TOKYO"}, {"ixp.name": "JPNAP Tokyo"}]
+    assert streamed.truncated and streamed.reason == "max_rows"
+
+    streamed = asyncio.run(astream_iyp_query(MEMBER_OF, use_cache=False, backend=backend))
+    assert len(streamed.rows) == 5 and not streamed.truncated
+
+
+def test_unknown_statement_is_not_found(backend):
+    with pytest.raises(IYPAPIError) as error:
+        run_iyp_query("MATCH (n:Unknown) RETURN n", use_cache=False, backend=backend)
+    assert error.value.status == 404
+
+
+@pytest.mark.parametrize("body", [DEFAULT_RESPONSE, {"bookmarks": []}])
+def test_http_backend_sync_and_async_agree(body):
+    with IYPStandIn(lambda request: (202, body)) as stand_in:
+        backend = HTTPBackend(IYPClient(base_url=stand_in.url))
+
+        async def aquery():
+            try:
+                return await backend.aquery(MEMBER_OF, use_cache=False)
+            finally:
+                await backend.aclose()
+
+        data = backend.query(MEMBER_OF, use_cache=False)
+        assert asyncio.run(aquery()) == data
+    assert data == body.get("data", {"fields": [], "values": []})
@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from src.agents.iypchat.iypchat import get_iyp_graph
+from src.agents.utils.models import IYPSettings, ModelParams
+from src.benchmarks.iyp_stand_in import IYPStandIn
+from src.benchmarks.llm_stand_in import LLMStandIn
+
+QUERY = "MATCH (:AS {asn: 2497})-[:MEMBER_OF]->(ixp:IXP) RETURN ixp.name"
+SYNTAX_ERROR = {
+    "errors": [
+        {
+            "code": "Neo.ClientError.Statement.SyntaxError",
+            "message": "Invalid input 'RETURN': expected an expression",
+        }
+    ]
+}
+
+
+@pytest.mark.parametrize("mode", ["invoke", "ainvoke"])
+def test_http_400_is_repaired_as_syntax(mode):
+    prompts = []
+
+    def reply(body: dict) -> str:
+        prompts.append(body["messages"][-1]["content"])
+        return QUERY
+
+    with LLMStandIn(reply) as llm, IYPStandIn(lambda body: (400, SYNTAX_ERROR)) as iyp:
+        model_params = ModelParams(base_url=llm.url, api_key="stand-in", iyp=IYPSettings(url=iyp.url))
+        graph = get_iyp_graph(model_params=model_params, max_repairs=1)
+        state = {"messages": [HumanMessage("Which IXPs is AS2497 a member of?")]}
+        if mode == "invoke":
+            out = graph.invoke(state)
+        else:
+            out = asyncio.run(graph.ainvoke(state))
+
+    assert out["cypher_failure"] == "syntax"
+    assert out["cypher_repairs"] == 1
+    assert iyp.requests == 2
+    # The Neo4j message is fed back to the LLM
+    assert any("Invalid input 'RETURN'" in prompt for prompt in prompts)
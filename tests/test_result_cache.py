@@ -0,0 +1,25 @@
+from src.agents.iypchat.result_cache import CypherResultCache, normalize_cypher, rename_columns
+
+RANKS = "MATCH (a:AS)-[r:RANK]-(b:Ranking) RETURN r.rank AS {alias}, {function}(b)"
+
+
+def test_alias_named_like_a_function():
+    count, _ = normalize_cypher(RANKS.format(alias="count", function="count"))
+    foo, _ = normalize_cypher(RANKS.format(alias="foo", function="count"))
+    size, _ = normalize_cypher(RANKS.format(alias="count", function="size"))
+    assert count == foo
+    assert count != size
+
+
+def test_cached_columns_keep_function_names():
+    cache = CypherResultCache()
+    cache.put(RANKS.format(alias="count", function="count"), [{"count": 1, "count(b)": 5}])
+    assert cache.get(RANKS.format(alias="foo", function="count")) == [{"foo": 1, "count(b)": 5}]
+
+    other = "MATCH (x:AS)-[q:RANK]-(y:Ranking) RETURN q.rank AS count, count(y)"
+    assert cache.get(other) == [{"count": 1, "count(y)": 5}]
+
+
+def test_rename_columns_skips_property_keys_and_functions():
+    assert rename_columns("ixp.name", {"ixp": "_v0", "name": "_v1"}) == "_v0.name"
+    assert rename_columns("count(ixp)", {"ixp": "_v0", "count": "_v1"}) == "count(_v0)"